@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+import consultas
+from db import invalidar, obtener_config, obtener_config_int, obtener_engine, usar_url
+from importar import validar_fila
+from metricas import medir, texto_prometheus
+from operaciones import archivar_pendientes, insertar_pendientes
+from refresco import REFRESCO_SEGUNDOS, iniciar_refresco
+
+
+# === API HTTP (JSON) ===
+# Las mismas consultas que usa la app (consultas.py, con la caché de db.leer_sql),
+# sin pasar por Streamlit. Pensada para el ERP y scripts:
+#   python api.py --port 8000
+#   curl -H "Authorization: Bearer $API_TOKEN" localhost:8000/api/pendientes?limite=100
+#
+# - Todas las rutas piden API_TOKEN. Las de escritura además API_ESCRITURA=1.
+# - Las respuestas GET llevan ETag (hash del cuerpo); con If-None-Match igual se
+#   responde 304 sin cuerpo.
+# - POST /api/lote ejecuta varias consultas GET en una sola petición.
+# - Los handlers son funciones normales: Starlette las corre en su threadpool,
+#   con el pool de conexiones del engine compartido (ver db.py).
+
+API_LIMITE_MAX = obtener_config_int("API_LIMITE_MAX", 1000)
+
+# Consultas por petición en /api/lote
+MAX_LOTE = 50
+
+
+class ErrorApi(Exception):
+    def __init__(self, estado, mensaje, detalle=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.detalle = detalle
+
+
+def _json(df):
+    # Fechas en ISO 8601 y NaN como null
+    return df.to_json(orient="records", date_format="iso", force_ascii=False)
+
+
+def _limite(params, defecto=200):
+    try:
+        limite = int(params.get("limite", defecto))
+    except ValueError:
+        raise ErrorApi(400, "limite debe ser un número entero")
+    return max(1, min(limite, API_LIMITE_MAX))
+
+
+def _rango(params):
+    # desde/hasta en ISO (hasta excluido); sin ellos no se filtra por fecha
+    if "desde" not in params and "hasta" not in params:
+        return None
+    try:
+        desde = pd.Timestamp(params.get("desde", "1900-01-01"))
+        hasta = pd.Timestamp(params["hasta"]) if "hasta" in params else pd.Timestamp.today() + pd.Timedelta(days=1)
+    except ValueError:
+        raise ErrorApi(400, "desde/hasta deben ser fechas ISO (AAAA-MM-DD)")
+    return desde.to_pydatetime(), hasta.to_pydatetime()
+
+
+# --- Consultas (GET): params -> texto JSON ---
+def _pendientes(params):
+    # Paginación keyset: "siguiente" se pasa tal cual como cursor de la próxima página
+    cursor = None
+    if params.get("cursor"):
+        try:
+            fecha, id_ = params["cursor"].rsplit("|", 1)
+            cursor = (pd.Timestamp(fecha).to_pydatetime(), int(id_))
+        except ValueError:
+            raise ErrorApi(400, "cursor inválido")
+    df, hay_mas = consultas.pagina_pendientes(_limite(params, 50), cursor)
+    siguiente = None
+    if hay_mas:
+        fecha, id_ = consultas.cursor_de(df)
+        siguiente = f"{pd.Timestamp(fecha).isoformat()}|{id_}"
+    return f'{{"datos": {_json(df)}, "siguiente": {json.dumps(siguiente)}}}'
+
+
+def _buscar_pendientes(params):
+    terminos = {c: params.get(c, "") for c in consultas.COLUMNAS_BUSQUEDA["pendientes"]}
+    return _json(consultas.buscar("pendientes", _limite(params), **terminos))
+
+
+def _entregas(params):
+    terminos = {c: params.get(c, "") for c in consultas.COLUMNAS_BUSQUEDA["entregas_completadas"]}
+    return _json(consultas.buscar("entregas_completadas", _limite(params), rango=_rango(params), **terminos))
+
+
+def _resumen(params):
+    agrupar_por = [c for c in params.get("agrupar_por", "proveedor").split(",") if c]
+    filtros = {c: params[c] for c in consultas.COLUMNAS_AGRUPABLES if c in params}
+    try:
+        return _json(consultas.resumen_cantidades(agrupar_por, **filtros))
+    except ValueError as e:
+        raise ErrorApi(400, str(e))
+
+
+def _antiguedad(params):
+    try:
+        return _json(consultas.antiguedad(params.get("agrupar_por", "proveedor")))
+    except ValueError as e:
+        raise ErrorApi(400, str(e))
+
+
+def _plan_compras(params):
+    return _json(consultas.plan_compras())
+
+
+CONSULTAS = {
+    "/api/pendientes": _pendientes,
+    "/api/pendientes/buscar": _buscar_pendientes,
+    "/api/entregas": _entregas,
+    "/api/resumen": _resumen,
+    "/api/antiguedad": _antiguedad,
+    "/api/plan-compras": _plan_compras,
+}
+
+
+# --- Respuestas ---
+def _respuesta_json(texto, estado=200, request=None):
+    cuerpo = texto.encode("utf-8")
+    if request is None or estado != 200:
+        return Response(cuerpo, estado, media_type="application/json")
+    etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(cuerpo, 200, media_type="application/json", headers={"ETag": etag})
+
+
+def _error(estado, mensaje, detalle=None):
+    cuerpo = {"error": mensaje} if detalle is None else {"error": mensaje, "detalle": detalle}
+    return _respuesta_json(json.dumps(cuerpo, ensure_ascii=False), estado)
+
+
+def _autorizado(request):
+    token = obtener_config("API_TOKEN", "")
+    enviado = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    return bool(token) and hmac.compare_digest(enviado, token)
+
+
+def _consulta(funcion):
+    def endpoint(request):
+        if not _autorizado(request):
+            return _error(401, "Falta el token o es incorrecto")
+        try:
+            with medir("api", request.url.path):
+                texto = funcion(request.query_params)
+        except ErrorApi as e:
+            return _error(e.estado, str(e))
+        return _respuesta_json(texto, request=request)
+    return endpoint
+
+
+def _escritura(funcion):
+    async def endpoint(request):
+        if not _autorizado(request):
+            return _error(401, "Falta el token o es incorrecto")
+        if obtener_config("API_ESCRITURA") != "1":
+            return _error(403, "La API está en modo solo lectura (API_ESCRITURA=1 para habilitar escrituras)")
+        try:
+            cuerpo = await request.json()
+        except ValueError:
+            return _error(400, "El cuerpo debe ser JSON")
+        if not isinstance(cuerpo, dict):
+            return _error(400, "El cuerpo debe ser un objeto JSON")
+        try:
+            with medir("api", request.url.path):
+                resultado = await run_in_threadpool(funcion, cuerpo)
+        except ErrorApi as e:
+            return _error(e.estado, str(e), e.detalle)
+        return _respuesta_json(json.dumps(resultado, ensure_ascii=False))
+    return endpoint
+
+
+# --- Lote: {"consultas": [{"ruta": "/api/resumen", "params": {...}}, ...]} ---
+async def lote(request):
+    if not _autorizado(request):
+        return _error(401, "Falta el token o es incorrecto")
+    try:
+        pedidas = (await request.json())["consultas"]
+    except (ValueError, KeyError, TypeError):
+        return _error(400, 'El cuerpo debe ser {"consultas": [{"ruta": ..., "params": {...}}]}')
+    if not isinstance(pedidas, list) or len(pedidas) > MAX_LOTE:
+        return _error(400, f"Se aceptan hasta {MAX_LOTE} consultas por lote")
+    if any(isinstance(pedida, dict) and not isinstance(pedida.get("params") or {}, dict) for pedida in pedidas):
+        return _error(400, 'Los params de cada consulta deben ser un objeto: {"params": {"limite": 10}}')
+
+    def ejecutar():
+        respuestas = []
+        for pedida in pedidas:
+            ruta = pedida.get("ruta") if isinstance(pedida, dict) else None
+            funcion = CONSULTAS.get(ruta)
+            if funcion is None:
+                respuestas.append(f'{{"ruta": {json.dumps(ruta)}, "estado": 404, "error": "Ruta desconocida"}}')
+                continue
+            params = {k: str(v) for k, v in (pedida.get("params") or {}).items()}
+            try:
+                with medir("api", ruta):
+                    texto = funcion(params)
+                respuestas.append(f'{{"ruta": {json.dumps(ruta)}, "estado": 200, "datos": {texto}}}')
+            except ErrorApi as e:
+                respuestas.append(json.dumps({"ruta": ruta, "estado": e.estado, "error": str(e)}, ensure_ascii=False))
+        return "[" + ", ".join(respuestas) + "]"
+
+    return _respuesta_json(await run_in_threadpool(ejecutar), request=request)
+
+
+# --- Escrituras (POST) ---
+def _crear_pendientes(cuerpo):
+    # {"filas": [{...campos del formulario...}]}; todo o nada, mismas reglas que importar.py
+    registros = cuerpo.get("filas") or []
+    if not isinstance(registros, list):
+        raise ErrorApi(400, 'El cuerpo debe ser {"filas": [{...}, ...]}')
+    filas, errores = [], []
+    for i, registro in enumerate(registros):
+        if not isinstance(registro, dict):
+            errores.append({"fila": i, "error": "debe ser un objeto JSON"})
+            continue
+        try:
+            filas.append(validar_fila(registro))
+        except ValueError as e:
+            errores.append({"fila": i, "error": str(e)})
+    if errores:
+        raise ErrorApi(400, "Hay filas con errores; no se creó ninguna", errores)
+    if not filas:
+        raise ErrorApi(400, 'El cuerpo debe ser {"filas": [{...}, ...]}')
+    with obtener_engine().begin() as conn:
+        creados, sumadas = insertar_pendientes(conn, filas)
+    invalidar("pendientes")
+    # sumadas: filas que sumaron su cantidad a un pendiente ya cargado ("id") o a otra fila del cuerpo ("fila_igual")
+    return {"creados": creados, "sumados": len(sumadas), "filas_sumadas": sumadas}
+
+
+def _archivar(cuerpo):
+    # {"ids": [1, 2, 3]}
+    # Solo una lista de enteros JSON: "12" no son los ids 1 y 2, ni 1.9 el id 1
+    ids = cuerpo.get("ids")
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ErrorApi(400, "ids debe ser una lista de enteros")
+    with obtener_engine().begin() as conn:
+        archivados = archivar_pendientes(conn, ids)
+    invalidar("pendientes", "entregas_completadas")
+    return {"archivados": archivados}
+
+
+def metrics(request):
+    if not _autorizado(request):
+        return _error(401, "Falta el token o es incorrecto")
+    return Response(texto_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(routes=[
+    *[Route(ruta, _consulta(funcion), methods=["GET"]) for ruta, funcion in CONSULTAS.items()],
+    Route("/api/lote", lote, methods=["POST"]),
+    Route("/api/pendientes", _escritura(_crear_pendientes), methods=["POST"]),
+    Route("/api/pendientes/archivar", _escritura(_archivar), methods=["POST"]),
+    Route("/metrics", metrics, methods=["GET"]),
+])
+
+
+# === CLI ===
+# python api.py                       -> 127.0.0.1:8000 sobre NEON_DB_URL
+# python api.py --host 0.0.0.0 --port 8080 --url sqlite:///local.db
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API JSON del Sistema de Pendientes")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    if not obtener_config("API_TOKEN"):
+        parser.error("Define API_TOKEN (Secrets o variable de entorno) antes de levantar la API.")
+    if args.url:
+        usar_url(args.url)
+    engine = obtener_engine()
+    # Mismo refresco que la app: la caché se invalida cuando otro proceso escribe
+    if REFRESCO_SEGUNDOS:
+        iniciar_refresco(engine.url.render_as_string(hide_password=False))
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,4 @@
 import streamlit as st
-import pandas as pd
-from sqlalchemy import create_engine, text
-import plotly.express as px
 import os
 
 
@@ -21,6 +18,9 @@ HIMAX_ACCENT = "#00AEEF"
 HIMAX_WHITE = "#FFFFFF"
 HIMAX_TEXT = "#222222"
 
+# Fondo y texto de los gráficos de barras (ver graficos.py)
+FONDO_GRAFICO = {"plot_bgcolor": HIMAX_WHITE, "paper_bgcolor": HIMAX_WHITE, "font_color": HIMAX_DARK}
+
 # === ESTILO PERSONALIZADO ===
 st.markdown(
     f"""
@@ -151,76 +151,186 @@ st.markdown(
 )
 
 # LEER CLAVES DESDE SECRETS (en Streamlit Cloud) O DESDE VARIABLES DE ENTORNO (local)
-APP_PASSWORD = st.secrets.get("APP_PASSWORD", os.getenv("APP_PASSWORD"))
 DB_URL = st.secrets.get("NEON_DB_URL", os.getenv("NEON_DB_URL"))
 
 if not DB_URL:
     st.error("❌ No se encontró NEON_DB_URL. Revisa los Secrets de Streamlit Cloud o tu archivo de entorno.")
     st.stop()
 
-engine = create_engine(DB_URL)
-
-
-if "authenticated" not in st.session_state:
-    st.session_state.authenticated = False
 
-if not st.session_state.authenticated:
+# === ACCESO ===
+# Cuentas por usuario con bcrypt (ver usuarios.py). bcrypt y la base se cargan solo al
+# pulsar "Entrar"; después la sesión guarda un token firmado y la contraseña no se
+# vuelve a verificar en los reruns. Sin cuentas creadas vale APP_PASSWORD.
+if "sesion" not in st.session_state:
     st.image("Logotipo Himax COLOR.png", width=220)
     st.title("🔒 Acceso al Sistema de Pendientes")
+    usuario = st.text_input("Usuario:")
     password = st.text_input("Contraseña:", type="password")
     if st.button("Entrar"):
-        if password == APP_PASSWORD:
-            st.session_state.authenticated = True
+        from sqlalchemy.exc import InterfaceError, OperationalError
+        from usuarios import iniciar_sesion
+        try:
+            st.session_state.sesion = iniciar_sesion(usuario, password, st.context.ip_address)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        except (OperationalError, InterfaceError):
+            st.error("❌ No se pudo conectar con la base para verificar el usuario. Intenta de nuevo en unos segundos.")
+        else:
             st.success("✅ Acceso concedido. Bienvenido al sistema.")
             st.rerun()
-        else:
-            st.error("❌ Contraseña incorrecta.")
     st.stop()
 
+# === CARGA DIFERIDA ===
+# pandas, SQLAlchemy y la capa de datos se importan recién con la sesión iniciada:
+# la pantalla de contraseña sale sin cargarlos y sin tocar la base (importa mucho
+# en el arranque en frío, después de que el hosting duerme la app). En los reruns
+# siguientes estos import ya están en sys.modules y no cuestan nada.
+# plotly.express se importa solo en las vistas con gráficos.
+import tempfile
+
+import pandas as pd
+
+from db import obtener_engine_lectura, obtener_config, obtener_config_int, invalidar, version_tablas
+from metricas import medir, iniciar as iniciar_metricas, mostrar_panel as mostrar_panel_metricas
+from consultas import (
+    contar_pendientes, contar_atrasados, pagina_pendientes, cursor_de,
+    valores_distintos, resumen_cantidades, buscar, hay_entregas,
+    COLUMNAS_ANALISIS, antiguedad, tiempos_entrega, tendencia_semanal, plan_compras, linea_existente
+)
+from importar import leer_archivo, validar, describir_sumadas
+from operaciones import destinos_filas
+from exportar import exportar, FORMATOS
+from compras import ENCABEZADOS_LINEA, ordenes_borrador, documento_xlsx
+from historico import buscar_entregas, meses_compactados
+from graficos import figura_barras
+from refresco import REFRESCO_SEGUNDOS, iniciar_refresco, revisar_cambios
+from replica import REPLICA_DB, escribir, iniciar_replica, url_replica, mostrar_estado as mostrar_estado_replica
+from usuarios import leer_token
+
+# Token vencido (SESION_HORAS) o inválido: de vuelta a la pantalla de acceso
+cuenta = leer_token(st.session_state.sesion)
+if cuenta is None:
+    del st.session_state["sesion"]
+    st.rerun()
+
+# Copia local opcional (ver replica.py): lecturas desde SQLite y escrituras en cola
+if REPLICA_DB:
+    iniciar_replica(DB_URL)
+
+# Un hilo por proceso que invalida la caché cuando cambian las tablas (ver refresco.py).
+# Con réplica se vigila la copia local, que es de donde se lee.
+if REFRESCO_SEGUNDOS:
+    iniciar_refresco(url_replica() if REPLICA_DB else DB_URL)
+
 # === MENÚ LATERAL ===
 st.sidebar.image("Logotipo Himax COLOR.png", width=180)
 st.sidebar.title("Menú")
 opcion = st.sidebar.radio(
     "Selecciona una opción:",
-    ["Lista de pendientes", "Agregar pendiente", "Dashboard", "Qué comprar", "Eliminar de pendientes", "Entregas Completadas"]
+    ["Lista de pendientes", "Agregar pendiente", "Importar pendientes", "Dashboard", "Qué comprar", "Antigüedad y SLA", "Eliminar de pendientes", "Entregas Completadas"]
 )
 
-# === FUNCIONES ===
-def obtener_pendientes():
-    with engine.begin() as conn:
-        result = conn.execute(text("SELECT * FROM pendientes ORDER BY fecha_creacion DESC"))
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+# === USUARIO ===
+# Quien tiene un nombre de vendedor ve por defecto (rol vendedor) solo sus pendientes
+# en la lista, el Dashboard y "Eliminar de pendientes": las consultas llevan
+# vendedor = ... y recorren solo sus filas.
+if cuenta["nombre"]:
+    st.sidebar.caption(f"👤 {cuenta['nombre']}")
+solo_vendedor = None
+if cuenta["vendedor"] and st.sidebar.toggle("Solo mis pendientes", value=cuenta["rol"] == "vendedor"):
+    solo_vendedor = cuenta["vendedor"]
+filtro_vendedor = {"vendedor": solo_vendedor} if solo_vendedor else {}
+if st.sidebar.button("Cerrar sesión"):
+    st.session_state.clear()
+    st.rerun()
+
+# === MÉTRICAS DE RENDIMIENTO ===
+# Panel opcional con los tiempos de cada etapa del rerun: se activa con
+# PANEL_METRICAS=1 en los Secrets/entorno o agregando ?debug=1 a la URL.
+iniciar_metricas(opcion)
+if obtener_config("PANEL_METRICAS") == "1" or st.query_params.get("debug") == "1":
+    mostrar_panel_metricas()
+
+if REPLICA_DB:
+    mostrar_estado_replica()
+
+
+# Escrituras: con réplica se aplican en la copia local y se envían a Neon en segundo plano
+def guardar(operacion, *argumentos):
+    try:
+        return escribir(operacion, *argumentos)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
 
-    # Nos aseguramos de que fecha_creacion sea tipo fecha
-    if not df.empty and "fecha_creacion" in df.columns:
-        df["fecha_creacion"] = pd.to_datetime(df["fecha_creacion"])
 
-    return df
+# === EXPORTACIÓN ===
+# El archivo se genera recién al hacer clic (descarga diferida), leyendo la tabla con
+# cursor y con los mismos filtros de la vista; no se arma un DataFrame en memoria.
+def mostrar_exportacion(tabla, nombre_archivo, **terminos):
+    with st.expander("⬇️ Exportar"):
+        formato = st.radio("Formato", list(FORMATOS), horizontal=True, key=f"exportar_formato_{tabla}")
+
+        def generar():
+            archivo = tempfile.TemporaryFile()
+            exportar(obtener_engine_lectura(), tabla, archivo, formato, **terminos)
+            archivo.seek(0)
+            return archivo
+
+        st.download_button(
+            "Descargar " + ("todo" if not any(terminos.values()) else "resultados filtrados"),
+            generar,
+            file_name=f"{nombre_archivo}.{formato}",
+            mime=FORMATOS[formato],
+            on_click="ignore",
+            key=f"exportar_{tabla}"
+        )
 
 # === LISTA DE PENDIENTES ===
 if opcion == "Lista de pendientes":
     st.title("📋 Lista de pendientes actuales")
-    df = obtener_pendientes()
+    revisar_cambios("pendientes")
+    total = contar_pendientes(solo_vendedor)
 
-    if df.empty:
+    if total == 0:
         st.info("No hay pendientes registrados aún.")
     else:
-        # === CÁLCULO DE DÍAS EN PENDIENTE ===
-        if "fecha_creacion" in df.columns:
-            hoy = pd.Timestamp.today().normalize()
-            df["fecha_creacion"] = pd.to_datetime(df["fecha_creacion"])
-            df["dias_pendiente"] = (hoy - df["fecha_creacion"]).dt.days
+        # Pendientes de +7 días (conteo en SQL, no sobre la tabla completa)
+        atrasados = contar_atrasados(7, solo_vendedor)
+        if atrasados:
+            st.warning(
+                f"⚠️ Hay {atrasados} pendientes con más de 7 días sin completar."
+            )
 
-            # Pendientes de +7 días
-            df_atrasados = df[
-                (df["dias_pendiente"] >= 7) &
-                (df["estado"].astype(str).str.lower() == "pendiente")
-            ]
+        # === PAGINACIÓN ===
+        # Solo se trae la página visible. "cursores" guarda el cursor keyset con el
+        # que empieza cada página ya visitada, para poder volver atrás.
+        tamanos = [25, 50, 100, 200]
+        tamano_defecto = obtener_config_int("PAGINA_TAMANO", 50)
+        if tamano_defecto not in tamanos:
+            tamanos = sorted(tamanos + [tamano_defecto])
+        tamano = st.selectbox("Filas por página", tamanos, index=tamanos.index(tamano_defecto))
+
+        if st.session_state.get("lista_tamano") != (tamano, solo_vendedor):
+            st.session_state.lista_tamano = (tamano, solo_vendedor)
+            st.session_state.lista_cursores = [None]
+
+        cursores = st.session_state.lista_cursores
+        pagina = len(cursores) - 1
+        df, hay_mas = pagina_pendientes(tamano, cursores[-1], solo_vendedor)
+        if df.empty and pagina > 0:
+            # La página quedó vacía (se eliminaron filas): volver al inicio
+            st.session_state.lista_cursores = [None]
+            st.rerun()
 
-            if not df_atrasados.empty:
-                st.warning(
-                    f"⚠️ Hay {len(df_atrasados)} pendientes con más de 7 días sin completar."
-                )
+        # === CÁLCULO DE DÍAS EN PENDIENTE ===
+        if "fecha_creacion" in df.columns and not df.empty:
+            siguiente_cursor = cursor_de(df)
+            with medir("pandas", "dias_pendiente"):
+                hoy = pd.Timestamp.today().normalize()
+                df["fecha_creacion"] = pd.to_datetime(df["fecha_creacion"])
+                df["dias_pendiente"] = (hoy - df["fecha_creacion"]).dt.days
 
         # === TABLA PRINCIPAL ===
         columnas_mostrar = [
@@ -242,29 +352,45 @@ if opcion == "Lista de pendientes":
             "dias_pendiente"
         ]
 
-        columnas_existentes = [c for c in columnas_mostrar if c in df.columns]
-        df = df[columnas_existentes]
-
-        df = df.rename(columns={
-            "empresa": "Empresa",
-            "rut_empresa": "RUT Empresa",
-            "producto": "Producto",
-            "sku": "SKU",
-            "cantidad": "Cantidad",
-            "proveedor": "Proveedor",
-            "tipo_facturacion": "Tipo de Facturación",
-            "orden_compra": "Orden de Compra",
-            "fecha_nota_venta": "Fecha Nota Venta",
-            "n_nota_venta": "N° Nota Venta",
-            "estado": "Estado",
-            "motivo": "Motivo o Comentario",
-            "vendedor": "Vendedor",
-            "fecha_creacion": "Fecha Creación",
-            "fecha_entrega": "Fecha de Entrega",
-            "dias_pendiente": "Días en pendiente"
-        })
-
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        with medir("pandas", "columnas"):
+            columnas_existentes = [c for c in columnas_mostrar if c in df.columns]
+            df = df[columnas_existentes]
+
+            df = df.rename(columns={
+                "empresa": "Empresa",
+                "rut_empresa": "RUT Empresa",
+                "producto": "Producto",
+                "sku": "SKU",
+                "cantidad": "Cantidad",
+                "proveedor": "Proveedor",
+                "tipo_facturacion": "Tipo de Facturación",
+                "orden_compra": "Orden de Compra",
+                "fecha_nota_venta": "Fecha Nota Venta",
+                "n_nota_venta": "N° Nota Venta",
+                "estado": "Estado",
+                "motivo": "Motivo o Comentario",
+                "vendedor": "Vendedor",
+                "fecha_creacion": "Fecha Creación",
+                "fecha_entrega": "Fecha de Entrega",
+                "dias_pendiente": "Días en pendiente"
+            })
+
+        with medir("render", "tabla"):
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        mostrar_exportacion("pendientes", "pendientes", **filtro_vendedor)
+
+        total_paginas = max(1, -(-total // tamano))
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Anterior", disabled=pagina == 0):
+                cursores.pop()
+                st.rerun()
+        with col2:
+            st.write(f"Página {pagina + 1} de {total_paginas} · {total} pendientes")
+        with col3:
+            if st.button("Siguiente ➡️", disabled=not hay_mas):
+                cursores.append(siguiente_cursor)
+                st.rerun()
 
 
 # === AGREGAR PENDIENTE ===
@@ -294,161 +420,352 @@ elif opcion == "Agregar pendiente":
         proveedor = st.text_input("Proveedor")
         estado = "Pendiente"
         motivo = st.text_area("Motivo o comentario")
-        vendedor = st.text_input("Vendedor")
+        vendedor = st.text_input("Vendedor", cuenta["vendedor"] or "")
 
         enviado = st.form_submit_button("Guardar")
 
-        if enviado:
-            with engine.begin() as conn:
-                conn.execute(text("""
-                    INSERT INTO pendientes 
-                    (empresa, rut_empresa, fecha_nota_venta, fecha_entrega, n_nota_venta, tipo_facturacion, orden_compra,
-                     producto, cantidad, proveedor, estado, motivo, vendedor, sku)
-                    VALUES 
-                    (:empresa, :rut_empresa, :fecha_nota_venta, :fecha_entrega, :n_nota_venta, :tipo_facturacion, :orden_compra,
-                     :producto, :cantidad, :proveedor, :estado, :motivo, :vendedor, :sku)
-                """), {
-                    "empresa": empresa,
-                    "rut_empresa": rut_empresa,
-                    "fecha_nota_venta": fecha_nota_venta,
-                    "fecha_entrega": fecha_entrega,
-                    "n_nota_venta": n_nota_venta,
-                    "tipo_facturacion": tipo_facturacion,
-                    "orden_compra": orden_compra,
-                    "producto": producto,
-                    "cantidad": cantidad,
-                    "proveedor": proveedor,
-                    "estado": estado,
-                    "motivo": motivo,
-                    "vendedor": vendedor,
-                    "sku": sku
-                })
-            st.success("✅ Pendiente agregado exitosamente.")
+        # Si la línea ya está cargada se avisa antes de guardar: guardarla suma su cantidad a la existente.
+        # La casilla depende de la cantidad actual, así vuelve a aparecer desmarcada después de sumar.
+        existente = linea_existente(empresa, n_nota_venta, sku, orden_compra) if enviado else None
+        if existente is not None and not st.checkbox(
+            "Sumar la cantidad al pendiente existente", key=f"sumar_linea_{existente['id']}_{existente['cantidad']}"
+        ):
+            st.warning(
+                f"⚠️ Ya hay un pendiente de esta empresa con la nota de venta {n_nota_venta} y el SKU {sku}: "
+                f"ID {existente['id']}, {existente['producto']}, {existente['cantidad']} unidades. "
+                "Si es la misma línea no hace falta volver a cargarla; si se agregaron unidades, "
+                "marca la casilla y guarda de nuevo."
+            )
+        elif enviado:
+            guardar("insertar", [{
+                "empresa": empresa,
+                "rut_empresa": rut_empresa,
+                "fecha_nota_venta": fecha_nota_venta,
+                "fecha_entrega": fecha_entrega,
+                "n_nota_venta": n_nota_venta,
+                "tipo_facturacion": tipo_facturacion,
+                "orden_compra": orden_compra,
+                "producto": producto,
+                "cantidad": cantidad,
+                "proveedor": proveedor,
+                "estado": estado,
+                "motivo": motivo,
+                "vendedor": vendedor,
+                "sku": sku
+            }])
+            invalidar("pendientes")
+            if existente is not None:
+                st.success(f"✅ Se sumaron {cantidad} unidades al pendiente ID {existente['id']}.")
+            else:
+                st.success("✅ Pendiente agregado exitosamente.")
+
+
+# === IMPORTAR PENDIENTES ===
+elif opcion == "Importar pendientes":
+    st.title("📥 Importar pendientes desde CSV o Excel")
+    st.write(
+        "El archivo debe tener una fila de encabezados con los mismos campos del formulario "
+        "(empresa, rut_empresa, fecha_nota_venta, fecha_entrega, n_nota_venta, tipo_facturacion, "
+        "orden_compra, producto, sku, cantidad, proveedor, motivo, vendedor). "
+        "Son obligatorios empresa, producto y cantidad. Una fila con la misma empresa, nota de venta, "
+        "SKU y orden de compra que un pendiente ya cargado suma su cantidad a ese pendiente."
+    )
+
+    archivo = st.file_uploader("Archivo CSV o XLSX", type=["csv", "xlsx"])
+
+    if archivo is not None:
+        try:
+            filas, errores = validar(leer_archivo(archivo))
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+
+        st.write(f"Filas válidas: **{len(filas)}** · Filas con errores: **{len(errores)}**")
+
+        if not errores.empty:
+            st.warning("⚠️ Estas filas tienen errores y no se importarán:")
+            st.dataframe(errores, use_container_width=True, hide_index=True)
+
+        if filas and cuenta["vendedor"]:
+            # Las filas sin vendedor quedan a nombre de quien importa
+            for fila in filas:
+                fila["vendedor"] = fila.get("vendedor") or cuenta["vendedor"]
+
+        if filas:
+            st.write("### Vista previa")
+            st.dataframe(pd.DataFrame(filas).head(20), use_container_width=True, hide_index=True)
+
+            # Las líneas ya cargadas suman su cantidad en vez de crear otro pendiente: se muestran
+            # antes y hay que confirmarlas, como en "Agregar pendiente"
+            with obtener_engine_lectura().connect() as conn:
+                sumadas = [{"fila": i, **destino} for i, destino in enumerate(destinos_filas(conn, filas)) if destino]
+            confirmado = True
+            if sumadas:
+                st.warning(
+                    f"⚠️ {len(sumadas)} filas repiten una línea ya cargada o de este mismo archivo (misma empresa, "
+                    "nota de venta, SKU y orden de compra). No crean otro pendiente: suman su cantidad."
+                )
+                st.dataframe(describir_sumadas(filas, sumadas), use_container_width=True, hide_index=True)
+                confirmado = st.checkbox(f"Sumar esas {len(sumadas)} filas en vez de crear pendientes nuevos")
+
+            if st.button(f"📥 Importar {len(filas)} pendientes", disabled=not confirmado):
+                # Todo o nada, en una sola transacción
+                creados, sumadas = guardar("insertar", filas)
+                invalidar("pendientes")
+                if sumadas:
+                    st.success(f"✅ Se crearon {creados} pendientes y {len(sumadas)} filas se sumaron a una línea ya cargada o repetida en el archivo.")
+                    st.dataframe(describir_sumadas(filas, sumadas), use_container_width=True, hide_index=True)
+                else:
+                    st.success(f"✅ Se importaron {creados} pendientes.")
 
 
 # === DASHBOARD ===
 elif opcion == "Dashboard":
     st.title("📊 Dashboard de Productos Pendientes")
+    revisar_cambios("pendientes")
 
-    with engine.begin() as conn:
-        df = pd.read_sql("SELECT * FROM pendientes", conn)
-
-    if df.empty:
+    if contar_pendientes(solo_vendedor) == 0:
         st.info("No hay datos registrados todavía.")
     else:
         st.subheader("📦 Resumen general por proveedor")
 
-        resumen_proveedor = df.groupby("proveedor")["cantidad"].sum().reset_index()
-        fig1 = px.bar(
-            resumen_proveedor,
-            x="proveedor",
-            y="cantidad",
-            text="cantidad",
-            title="Cantidad total de productos pendientes por proveedor",
-            color_discrete_sequence=[HIMAX_PRIMARY]
-        )
-        fig1.update_layout(
-            plot_bgcolor=HIMAX_WHITE,
-            paper_bgcolor=HIMAX_WHITE,
-            font_color=HIMAX_DARK
-        )
-        st.plotly_chart(fig1, use_container_width=True)
+        # Versión antes de leer: la figura nunca queda guardada con una versión más nueva que sus datos
+        version = version_tablas("pendientes")
+
+        # Agregado en SQL: solo viaja una fila por proveedor
+        resumen_proveedor = resumen_cantidades(["proveedor"], **filtro_vendedor)
+        with medir("grafico", "proveedor"):
+            fig1 = figura_barras(
+                resumen_proveedor,
+                ("proveedor", solo_vendedor, version),
+                x="proveedor",
+                y="cantidad",
+                titulo="Cantidad total de productos pendientes por proveedor",
+                colores=[HIMAX_PRIMARY],
+                fondo=FONDO_GRAFICO
+            )
+        with medir("render", "grafico_proveedor"):
+            st.plotly_chart(fig1, use_container_width=True)
 
         st.divider()
         st.subheader("🏢 Detalle por empresa")
 
-        empresas = sorted(df["empresa"].dropna().unique())
+        if solo_vendedor:
+            empresas = resumen_cantidades(["empresa"], **filtro_vendedor)["empresa"].tolist()
+        else:
+            empresas = valores_distintos("empresa")
         empresa_sel = st.selectbox("Selecciona una empresa", empresas)
 
-        df_empresa = df[df["empresa"] == empresa_sel]
+        tabla = resumen_cantidades(["producto", "sku", "proveedor"], empresa=empresa_sel, **filtro_vendedor)
 
-        if not df_empresa.empty:
+        if not tabla.empty:
             st.write(f"### Productos pendientes para: {empresa_sel}")
-            tabla = df_empresa.groupby(["producto", "sku", "proveedor"])["cantidad"].sum().reset_index()
-            st.dataframe(tabla, use_container_width=True)
-
-            fig2 = px.bar(
-                tabla,
-                x="producto",
-                y="cantidad",
-                color="proveedor",
-                text="cantidad",
-                title=f"Pendientes por producto - {empresa_sel}",
-                color_discrete_sequence=[HIMAX_PRIMARY, HIMAX_ACCENT, HIMAX_DARK]
-            )
-            fig2.update_layout(
-                plot_bgcolor=HIMAX_WHITE,
-                paper_bgcolor=HIMAX_WHITE,
-                font_color=HIMAX_DARK
-            )
-            st.plotly_chart(fig2, use_container_width=True)
+            with medir("render", "tabla_empresa"):
+                st.dataframe(tabla, use_container_width=True)
+
+            with medir("grafico", "empresa"):
+                fig2 = figura_barras(
+                    tabla,
+                    ("empresa", empresa_sel, solo_vendedor, version),
+                    x="producto",
+                    y="cantidad",
+                    color="proveedor",
+                    titulo=f"Pendientes por producto - {empresa_sel}",
+                    colores=[HIMAX_PRIMARY, HIMAX_ACCENT, HIMAX_DARK],
+                    fondo=FONDO_GRAFICO
+                )
+            with medir("render", "grafico_empresa"):
+                st.plotly_chart(fig2, use_container_width=True)
         else:
             st.warning("Esta empresa no tiene productos pendientes.")
 
 # === SECCIÓN DE COMPRAS / QUÉ COMPRAR ===
 elif opcion == "Qué comprar":
     st.title("🛒 Sección de Compras - Qué productos hay que comprar")
+    revisar_cambios("pendientes")
 
-    with engine.begin() as conn:
-        df = pd.read_sql("SELECT * FROM pendientes", conn)
-
-    if df.empty:
+    if contar_pendientes() == 0:
         st.info("No hay productos pendientes actualmente.")
     else:
+        # --- PLAN DE COMPRAS ---
+        # Demanda de todas las empresas menos lo que ya tiene orden de compra, en una
+        # sola consulta; una orden en borrador por proveedor (ver compras.py)
+        st.subheader("🧾 Plan de compras")
+        plan = plan_compras()
+        with medir("pandas", "ordenes_borrador"):
+            ordenes = ordenes_borrador(plan)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Proveedores", len(ordenes))
+        col2.metric("Líneas a comprar", sum(len(o["lineas"]) for o in ordenes))
+        col3.metric("Unidades a comprar", int(plan["a_comprar"].sum()))
+        col4.metric("Unidades ya con OC", int(plan["cubierta"].sum()))
+
+        if not ordenes:
+            st.success("✅ Toda la demanda pendiente ya tiene orden de compra.")
+        else:
+            def generar_documento():
+                archivo = tempfile.TemporaryFile()
+                documento_xlsx(ordenes, archivo)
+                archivo.seek(0)
+                return archivo
+
+            st.download_button(
+                "⬇️ Descargar órdenes en borrador (XLSX)",
+                generar_documento,
+                file_name=f"ordenes_compra_borrador_{pd.Timestamp.today():%Y%m%d}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                on_click="ignore"
+            )
+            with medir("render", "ordenes_borrador"):
+                for orden in ordenes:
+                    with st.expander(f"{orden['numero']} · {orden['proveedor']} · {orden['unidades']} unidades"):
+                        st.dataframe(
+                            orden["lineas"].rename(columns=ENCABEZADOS_LINEA),
+                            use_container_width=True,
+                            hide_index=True
+                        )
+
+        st.divider()
+
         # --- FILTROS ---
         st.subheader("🔍 Filtros de búsqueda")
 
         col1, col2 = st.columns(2)
         with col1:
-            empresas = sorted(df["empresa"].dropna().unique())
+            empresas = valores_distintos("empresa")
             empresa_sel = st.selectbox("Filtrar por empresa (opcional)", ["Todas"] + empresas)
         with col2:
-            proveedores = sorted(df["proveedor"].dropna().unique())
+            proveedores = valores_distintos("proveedor")
             proveedor_sel = st.selectbox("Filtrar por proveedor", ["Todos"] + proveedores)
 
-        # --- APLICAR FILTROS ---
-        df_filtrado = df.copy()
-
+        # --- APLICAR FILTROS (WHERE + GROUP BY en la base) ---
+        # Solo estado Pendiente, como el plan de compras de arriba: así los dos dan la misma
+        # demanda por proveedor. resumen_pendientes no distingue estado, así que esto se
+        # agrupa sobre pendientes.
+        filtros = {"estado": "Pendiente"}
         if empresa_sel != "Todas":
-            df_filtrado = df_filtrado[df_filtrado["empresa"] == empresa_sel]
-
+            filtros["empresa"] = empresa_sel
         if proveedor_sel != "Todos":
-            df_filtrado = df_filtrado[df_filtrado["proveedor"] == proveedor_sel]
+            filtros["proveedor"] = proveedor_sel
+
+        version = version_tablas("pendientes")
+        tabla = resumen_cantidades(["proveedor", "producto", "sku"], **filtros)
 
         st.divider()
 
-        if df_filtrado.empty:
+        if tabla.empty:
             st.warning("No hay pendientes que coincidan con los filtros seleccionados.")
         else:
             st.subheader("📦 Productos pendientes de compra")
-            tabla = df_filtrado.groupby(
-                ["proveedor", "producto", "sku"]
-            )["cantidad"].sum().reset_index()
 
             # Mostramos resumen en tabla
-            st.dataframe(tabla, use_container_width=True)
-
-            # Gráfico visual
-            import plotly.express as px
+            with medir("render", "tabla_compras"):
+                st.dataframe(tabla, use_container_width=True)
+
+            # Gráfico visual: los productos con más unidades y el resto en "Otros"
+            with medir("grafico", "compras"):
+                fig = figura_barras(
+                    tabla,
+                    ("compras", empresa_sel, proveedor_sel, version),
+                    x="producto",
+                    y="cantidad",
+                    color="proveedor",
+                    titulo="Productos pendientes por proveedor",
+                    etiquetas={"cantidad": "Unidades", "producto": "Producto"}
+                )
+            with medir("render", "grafico_compras"):
+                st.plotly_chart(fig, use_container_width=True)
+
+# === ANTIGÜEDAD Y SLA ===
+# Tramos de antigüedad de lo pendiente y días desde la nota de venta hasta el archivo
+# (mediana y p90), calculados en SQL: solo llega una fila por grupo o por semana.
+elif opcion == "Antigüedad y SLA":
+    st.title("⏳ Antigüedad de pendientes y tiempos de entrega")
+    revisar_cambios("pendientes", "entregas_completadas")
+    import plotly.express as px
+
+    etiquetas_grupo = {"proveedor": "Proveedor", "vendedor": "Vendedor", "empresa": "Empresa"}
+    agrupar_por = st.radio("Agrupar por", COLUMNAS_ANALISIS, format_func=etiquetas_grupo.get, horizontal=True)
+    etiqueta = etiquetas_grupo[agrupar_por]
+
+    # --- ANTIGÜEDAD DE LOS PENDIENTES ABIERTOS ---
+    st.subheader("📌 Pendientes abiertos por antigüedad")
+    tramos = {"d0_3": "0–3 días", "d4_7": "4–7 días", "d8_14": "8–14 días", "d15_mas": "15+ días"}
+    tabla_antiguedad = antiguedad(agrupar_por)
+    if tabla_antiguedad.empty:
+        st.info("No hay pendientes abiertos.")
+    else:
+        with medir("pandas", "antiguedad"):
+            tabla_antiguedad = tabla_antiguedad.rename(columns={
+                "grupo": etiqueta, **tramos, "total": "Total", "max_dias": "Más antiguo (días)"
+            })
+            # Los 15 grupos con más pendientes, un tramo por color
+            largo = tabla_antiguedad.head(15).melt(
+                id_vars=etiqueta, value_vars=list(tramos.values()), var_name="Antigüedad", value_name="Pendientes"
+            )
+        with medir("grafico", "antiguedad"):
             fig = px.bar(
-                tabla,
-                x="producto",
-                y="cantidad",
-                color="proveedor",
-                text="cantidad",
-                title="Productos pendientes por proveedor",
-                labels={"cantidad": "Unidades", "producto": "Producto"},
+                largo, x=etiqueta, y="Pendientes", color="Antigüedad",
+                category_orders={"Antigüedad": list(tramos.values())},
+                color_discrete_sequence=["#00AEEF", "#007BFF", "#F5A623", "#D0021B"],
+                title=f"Pendientes abiertos por {etiqueta.lower()} (15 con más pendientes)"
+            )
+        with medir("render", "antiguedad"):
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(tabla_antiguedad, use_container_width=True, hide_index=True)
+
+    st.divider()
+
+    # --- TIEMPOS DE ENTREGA ---
+    st.subheader("🚚 Días desde la nota de venta hasta la entrega")
+    hoy = pd.Timestamp.today().normalize()
+    predeterminado = ((hoy - pd.DateOffset(months=6)).date(), hoy.date())
+    fechas = st.date_input("Entregas archivadas entre", predeterminado, key="sla_fechas")
+    # Vacío si se borra el campo: vale el rango por defecto
+    fechas = fechas or predeterminado
+    desde = pd.Timestamp(fechas[0])
+    hasta = pd.Timestamp(fechas[-1]) + pd.Timedelta(days=1)
+    rango = (desde.to_pydatetime(), hasta.to_pydatetime())
+    st.caption("Solo entregas que siguen en la base (los meses compactados en Parquet no se incluyen).")
+
+    tabla_tiempos = tiempos_entrega(agrupar_por, rango)
+    if tabla_tiempos.empty:
+        st.info("No hay entregas con fecha de nota de venta en el rango elegido.")
+    else:
+        columnas_tiempos = {
+            "grupo": etiqueta,
+            "entregas": "Entregas",
+            "promedio_dias": "Promedio (días)",
+            "mediana_dias": "Mediana (días)",
+            "p90_dias": "P90 (días)",
+        }
+        with medir("render", "tiempos_entrega"):
+            st.dataframe(
+                tabla_tiempos.rename(columns=columnas_tiempos).round({"Promedio (días)": 1}),
+                use_container_width=True,
+                hide_index=True
             )
+
+        tendencia = tendencia_semanal(rango)
+        with medir("grafico", "tendencia_semanal"):
+            fig = px.line(
+                tendencia.rename(columns=columnas_tiempos | {"grupo": "Semana"}),
+                x="Semana",
+                y=["Mediana (días)", "P90 (días)"],
+                markers=True,
+                title="Tendencia semanal del tiempo de entrega",
+                labels={"value": "Días", "variable": ""}
+            )
+        with medir("render", "tendencia_semanal"):
             st.plotly_chart(fig, use_container_width=True)
+            st.bar_chart(tendencia.set_index("grupo")["entregas"], height=200)
 
 # === ELIMINAR O EDITAR PENDIENTES ===
 elif opcion == "Eliminar de pendientes":
     st.title("🗑️ Eliminar o Editar Pendientes Existentes")
 
-    # Cargar datos
-    df = obtener_pendientes()
-
-    if df.empty:
+    if contar_pendientes(solo_vendedor) == 0:
         st.info("No hay pendientes registrados aún.")
         st.stop()
 
@@ -460,32 +777,102 @@ elif opcion == "Eliminar de pendientes":
     with col2:
         filtro_producto = st.text_input("Buscar por producto")
 
-    df_filtrado = df.copy()
-    if filtro_empresa:
-        df_filtrado = df_filtrado[df_filtrado["empresa"].str.contains(filtro_empresa, case=False, na=False)]
-    if filtro_producto:
-        df_filtrado = df_filtrado[df_filtrado["producto"].str.contains(filtro_producto, case=False, na=False)]
+    # Búsqueda en la base (ILIKE con LIMIT), no sobre la tabla completa en memoria
+    limite = obtener_config_int("BUSQUEDA_LIMITE", 200)
+    df_filtrado = buscar("pendientes", limite, vendedor=solo_vendedor, empresa=filtro_empresa, producto=filtro_producto)
 
     st.write("### Resultados de búsqueda")
     if df_filtrado.empty:
         st.warning("No se encontraron resultados.")
         st.stop()
+    mostrar_exportacion("pendientes", "pendientes", empresa=filtro_empresa, producto=filtro_producto, **filtro_vendedor)
 
     # Mostrar resultados
-    st.dataframe(df_filtrado, use_container_width=True)
+    if len(df_filtrado) == limite:
+        st.caption(f"Mostrando los {limite} más recientes. Afina la búsqueda para ver otros.")
+    # Resultados con casilla de selección para las acciones masivas
+    df_editor = df_filtrado.copy()
+    df_editor.insert(0, "seleccionar", False)
+    with medir("render", "tabla_busqueda"):
+        editado = st.data_editor(
+            df_editor,
+            use_container_width=True,
+            disabled=list(df_filtrado.columns),
+            column_config={
+                "seleccionar": st.column_config.CheckboxColumn("✔", help="Marcar para acciones masivas"),
+                "version": None
+            },
+            key="editor_pendientes"
+        )
+    ids_marcados = editado.loc[editado["seleccionar"], "id"].tolist()
+
+    # === ACCIONES MASIVAS ===
+    # Una sola transacción (y un solo UPDATE / INSERT ... SELECT + DELETE) para
+    # todos los seleccionados, en vez de uno por uno.
+    if ids_marcados:
+        st.subheader(f"📦 Acciones sobre {len(ids_marcados)} pendientes seleccionados")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            campo_masivo = st.selectbox(
+                "Campo a modificar",
+                ["estado", "fecha_entrega", "orden_compra", "proveedor", "vendedor"],
+                format_func=lambda c: {
+                    "estado": "Estado",
+                    "fecha_entrega": "Fecha de Entrega",
+                    "orden_compra": "Orden de Compra",
+                    "proveedor": "Proveedor",
+                    "vendedor": "Vendedor"
+                }[c]
+            )
+            if campo_masivo == "estado":
+                valor_masivo = st.selectbox("Nuevo valor", ["Pendiente", "Completado"])
+            elif campo_masivo == "fecha_entrega":
+                valor_masivo = st.date_input("Nuevo valor", value=None)
+            else:
+                valor_masivo = st.text_input("Nuevo valor")
+
+            if st.button(f"💾 Aplicar a {len(ids_marcados)} pendientes"):
+                actualizados = guardar("actualizar", ids_marcados, {campo_masivo: valor_masivo})
+                invalidar("pendientes")
+                del st.session_state["editor_pendientes"]
+                if actualizados < len(ids_marcados):
+                    # Las filas que otro usuario tenía bloqueadas o ya archivó se saltan
+                    st.warning(f"Se actualizaron {actualizados} de {len(ids_marcados)}: el resto estaba siendo modificado por otro usuario.")
+                else:
+                    st.success(f"✅ Se actualizaron {actualizados} pendientes.")
+                    st.rerun()
+
+        with col2:
+            confirmar_masivo = st.checkbox(
+                f"Confirmo que deseo mover {len(ids_marcados)} pendientes a 'Entregas Completadas'"
+            )
+            if st.button("📦 Mover seleccionados a Entregas Completadas", disabled=not confirmar_masivo):
+                archivados = guardar("archivar", ids_marcados)
+                invalidar("pendientes", "entregas_completadas")
+                del st.session_state["editor_pendientes"]
+                if archivados < len(ids_marcados):
+                    st.warning(f"Se movieron {archivados} de {len(ids_marcados)}: el resto ya lo estaba moviendo otro usuario.")
+                else:
+                    st.success(f"✅ Se movieron {archivados} pendientes a 'Entregas Completadas'.")
+                    st.rerun()
+
+        st.divider()
 
     # Seleccionar un pendiente
     ids = df_filtrado["id"].tolist()
     id_sel = st.selectbox("Selecciona el ID del pendiente a editar o eliminar:", ids)
 
-    pendiente_sel = df[df["id"] == id_sel].iloc[0]
+    pendiente_sel = df_filtrado[df_filtrado["id"] == id_sel].iloc[0]
 
     st.subheader(f"✏️ Editar pendiente ID {id_sel}")
 
     with st.form("form_editar"):
         empresa = st.text_input("Empresa", pendiente_sel["empresa"])
         rut_empresa = st.text_input("RUT Empresa", pendiente_sel.get("rut_empresa", ""))
-        fecha_nota_venta = st.date_input("Fecha Nota Venta", pendiente_sel.get("fecha_nota_venta"))
+        # Con resultados grandes la fecha llega tipada y puede ser NaT
+        fecha_nota_venta = pendiente_sel.get("fecha_nota_venta")
+        fecha_nota_venta = st.date_input("Fecha Nota Venta", None if pd.isna(fecha_nota_venta) else fecha_nota_venta)
         n_nota_venta = st.text_input("N° Nota de Venta", pendiente_sel.get("n_nota_venta", ""))
         tipo_facturacion = st.selectbox(
             "Tipo de Facturación",
@@ -503,37 +890,33 @@ elif opcion == "Eliminar de pendientes":
 
         col1, col2 = st.columns(2)
         with col1:
-            guardar = st.form_submit_button("💾 Guardar cambios")
+            guardar_cambios = st.form_submit_button("💾 Guardar cambios")
         with col2:
             eliminar = st.form_submit_button("🗑️ Eliminar pendiente")
 
-        if guardar:
-            with engine.begin() as conn:
-                conn.execute(text("""
-                    UPDATE pendientes
-                    SET empresa=:empresa, rut_empresa=:rut_empresa, fecha_nota_venta=:fecha_nota_venta,
-                        n_nota_venta=:n_nota_venta, tipo_facturacion=:tipo_facturacion, orden_compra=:orden_compra,
-                        producto=:producto, sku=:sku, cantidad=:cantidad, proveedor=:proveedor,
-                        estado=:estado, motivo=:motivo, vendedor=:vendedor
-                    WHERE id=:id
-                """), {
-                    "id": id_sel,
-                    "empresa": empresa,
-                    "rut_empresa": rut_empresa,
-                    "fecha_nota_venta": fecha_nota_venta,
-                    "n_nota_venta": n_nota_venta,
-                    "tipo_facturacion": tipo_facturacion,
-                    "orden_compra": orden_compra,
-                    "producto": producto,
-                    "sku": sku,
-                    "cantidad": cantidad,
-                    "proveedor": proveedor,
-                    "estado": estado,
-                    "motivo": motivo,
-                    "vendedor": vendedor
-                })
-            st.success("✅ Pendiente actualizado correctamente.")
-            st.rerun()
+        if guardar_cambios:
+            # Solo se guarda si nadie lo modificó desde que se cargó la búsqueda
+            guardados = guardar("editar", id_sel, pendiente_sel["version"], {
+                "empresa": empresa,
+                "rut_empresa": rut_empresa,
+                "fecha_nota_venta": fecha_nota_venta,
+                "n_nota_venta": n_nota_venta,
+                "tipo_facturacion": tipo_facturacion,
+                "orden_compra": orden_compra,
+                "producto": producto,
+                "sku": sku,
+                "cantidad": cantidad,
+                "proveedor": proveedor,
+                "estado": estado,
+                "motivo": motivo,
+                "vendedor": vendedor
+            })
+            invalidar("pendientes")
+            if guardados:
+                st.success("✅ Pendiente actualizado correctamente.")
+                st.rerun()
+            else:
+                st.error("⚠️ Otro usuario modificó o movió este pendiente mientras lo editabas. Revisa los datos actuales (se recargan al volver a buscar) y guarda de nuevo.")
 
         if eliminar:
             # Confirmación antes de eliminar
@@ -542,29 +925,15 @@ elif opcion == "Eliminar de pendientes":
 
             if confirmar:
                 # Antes de eliminar, mover a la tabla de entregas_completadas
-                with engine.begin() as conn:
-                    # Obtener el pendiente completo
-                    pendiente = conn.execute(
-                        text("SELECT * FROM pendientes WHERE id = :id"),
-                        {"id": id_sel}
-                    ).mappings().first()
-
-                    if pendiente:
-                        # Insertar en tabla de entregas completadas
-                        conn.execute(text("""
-                            INSERT INTO entregas_completadas
-                            (empresa, rut_empresa, producto, sku, cantidad, proveedor, tipo_facturacion,
-                             orden_compra, fecha_nota_venta, n_nota_venta, estado, motivo, vendedor, fecha_creacion)
-                            VALUES
-                            (:empresa, :rut_empresa, :producto, :sku, :cantidad, :proveedor, :tipo_facturacion,
-                             :orden_compra, :fecha_nota_venta, :n_nota_venta, :estado, :motivo, :vendedor, :fecha_creacion)
-                        """), pendiente)
-
-                        # Ahora sí, eliminarlo de pendientes
-                        conn.execute(text("DELETE FROM pendientes WHERE id = :id"), {"id": id_sel})
-
-                st.success("✅ Pendiente eliminado y movido a 'Entregas Completadas'.")
-                st.rerun()
+                # INSERT ... SELECT en entregas_completadas y DELETE en la misma transacción
+                archivados = guardar("archivar", [id_sel])
+
+                invalidar("pendientes", "entregas_completadas")
+                if archivados:
+                    st.success("✅ Pendiente eliminado y movido a 'Entregas Completadas'.")
+                    st.rerun()
+                else:
+                    st.warning("⚠️ No se movió: otro usuario ya lo movió o lo está modificando. Vuelve a buscar para ver los datos actuales.")
 
             else:
                 st.info("El pendiente no ha sido eliminado. Marca la casilla para confirmar.")
@@ -572,27 +941,38 @@ elif opcion == "Eliminar de pendientes":
 # === ENTREGAS COMPLETADAS ===
 elif opcion == "Entregas Completadas":
     st.title("📦 Entregas Completadas - Historial de productos entregados")
+    revisar_cambios("entregas_completadas")
 
-    with engine.begin() as conn:
-        df = pd.read_sql("SELECT * FROM entregas_completadas ORDER BY fecha_entrega DESC", conn)
-
-    if df.empty:
+    if not hay_entregas() and not meses_compactados():
         st.info("Aún no hay entregas completadas registradas.")
     else:
         st.subheader("Historial de entregas registradas")
 
         # Opcional: filtros de búsqueda
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             filtro_empresa = st.text_input("Buscar por empresa")
         with col2:
             filtro_proveedor = st.text_input("Buscar por proveedor")
-
-        df_filtrado = df.copy()
-        if filtro_empresa:
-            df_filtrado = df_filtrado[df_filtrado["empresa"].str.contains(filtro_empresa, case=False, na=False)]
-        if filtro_proveedor:
-            df_filtrado = df_filtrado[df_filtrado["proveedor"].str.contains(filtro_proveedor, case=False, na=False)]
+        with col3:
+            # Por defecto solo los últimos meses: la consulta recorre la ventana, no todo el historial
+            hoy = pd.Timestamp.today().normalize()
+            meses = obtener_config_int("ENTREGAS_MESES", 3)
+            predeterminado = ((hoy - pd.DateOffset(months=meses)).date(), hoy.date())
+            fechas = st.date_input("Entregadas entre", predeterminado)
+
+        # Mientras se elige el rango, date_input devuelve solo la fecha de inicio,
+        # y nada si se borra el campo: entonces vale el rango por defecto
+        fechas = fechas or predeterminado
+        desde = pd.Timestamp(fechas[0])
+        hasta = pd.Timestamp(fechas[-1]) + pd.Timedelta(days=1)
+        rango = (desde.to_pydatetime(), hasta.to_pydatetime())
+
+        limite = obtener_config_int("BUSQUEDA_LIMITE", 200)
+        # Los meses compactados en Parquet (historico.py) solo se abren si el rango los incluye
+        df_filtrado = buscar_entregas(rango, limite, empresa=filtro_empresa, proveedor=filtro_proveedor)
+        if len(df_filtrado) == limite:
+            st.caption(f"Mostrando las {limite} entregas más recientes. Usa los filtros para buscar otras.")
 
         # Reordenar columnas y mostrar
         columnas = [
@@ -619,7 +999,9 @@ elif opcion == "Entregas Completadas":
             "fecha_entrega": "Fecha Entrega"
         })
 
-        st.dataframe(df_filtrado, use_container_width=True, hide_index=True)
+        with medir("render", "tabla_entregas"):
+            st.dataframe(df_filtrado, use_container_width=True, hide_index=True)
+        mostrar_exportacion("entregas_completadas", "entregas_completadas", rango=rango, empresa=filtro_empresa, proveedor=filtro_proveedor)
 
 
 
@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+from sqlalchemy import text
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from db import obtener_config, obtener_engine
+
+from benchmarks.datos import poblar
+
+
+# === PRUEBA DE CARGA CON SESIONES CONCURRENTES ===
+# python -m benchmarks.carga --url postgresql+psycopg2://usuario@localhost/pruebas --sesiones 1,5,10,20
+#
+# Levanta `streamlit run app.py` contra la base de pruebas y abre sesiones como lo hace
+# el navegador: un websocket por sesión (/_stcore/stream), BackMsg con el estado de los
+# widgets y ForwardMsg con los elementos de cada run. Cada sesión entra, recorre la
+# lista, filtra "Qué comprar", agrega un pendiente y lo archiva, con una pausa entre
+# acciones, hasta que termina el nivel. Por nivel de concurrencia informa reruns por
+# segundo, latencia de cada rerun (desde que se envía el cambio hasta script_finished),
+# conexiones a Postgres (pg_stat_activity) y memoria del servidor por sesión.
+#
+# No se usa AppTest: en cada run reemplaza estado global del proceso (Runtime,
+# st.secrets), así que no admite varias sesiones a la vez, y no mide el servidor real.
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Segundos máximos de un rerun antes de darlo por colgado
+TIEMPO_MAXIMO_RERUN = 120
+
+# Cada cuántos segundos se miden conexiones y memoria del servidor
+INTERVALO_MUESTRAS = 0.5
+
+
+class ErrorCarga(Exception):
+    pass
+
+
+# --- Estado de los widgets, como lo arma el navegador ---
+def _texto(widget, valor):
+    # text_input, radio y selectbox: el valor (o la opción elegida) como texto
+    return WidgetState(id=widget.id, string_value=valor)
+
+
+def _casilla(widget, valor):
+    return WidgetState(id=widget.id, bool_value=valor)
+
+
+def _boton(widget):
+    return WidgetState(id=widget.id, trigger_value=True)
+
+
+def _elementos(mensajes):
+    # Widgets (tipo, proto) del run en orden de aparición, excepciones y mensajes de error
+    widgets, excepciones, errores = [], [], []
+    for msg in mensajes:
+        if msg.WhichOneof("type") != "delta" or msg.delta.WhichOneof("type") != "new_element":
+            continue
+        elemento = msg.delta.new_element
+        tipo = elemento.WhichOneof("type")
+        proto = getattr(elemento, tipo)
+        if tipo == "exception":
+            excepciones.append(f"{proto.type}: {proto.message}")
+        elif tipo == "alert" and proto.format == proto.ERROR:
+            errores.append(proto.body)
+        elif "id" in proto.DESCRIPTOR.fields_by_name and "label" in proto.DESCRIPTOR.fields_by_name and proto.id:
+            widgets.append((tipo, proto))
+    return widgets, excepciones, errores
+
+
+class Sesion:
+    # Una sesión del navegador: guarda el valor de los widgets que tocó y lo reenvía
+    # en cada rerun mientras el widget siga en pantalla; los botones, una sola vez.
+    def __init__(self, ws, numero, pausa, latencias):
+        self.ws = ws
+        self.numero = numero
+        self.pausa = pausa
+        self.latencias = latencias
+        self.rng = random.Random(numero)
+        self.widgets = []
+        self.errores = []
+        self.valores = {}
+        self.vueltas = 0
+
+    def widget(self, tipo, etiqueta):
+        for t, proto in self.widgets:
+            if t == tipo and etiqueta in proto.label:
+                return proto
+        detalle = f": {self.errores[0]}" if self.errores else ""
+        raise ErrorCarga(f"No apareció {tipo} '{etiqueta}'{detalle}")
+
+    async def rerun(self, paso, cambios=()):
+        if self.widgets and self.pausa:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.pausa)
+        en_pantalla = {proto.id for _, proto in self.widgets}
+        for estado in cambios:
+            if estado.WhichOneof("value") != "trigger_value":
+                self.valores[estado.id] = estado
+        cliente = ClientState(query_string="", page_script_hash="")
+        cliente.widget_states.widgets.extend(
+            [e for id_, e in self.valores.items() if id_ in en_pantalla]
+            + [e for e in cambios if e.WhichOneof("value") == "trigger_value"]
+        )
+
+        inicio = time.perf_counter()
+        await self.ws.send(BackMsg(rerun_script=cliente).SerializeToString())
+        mensajes = []
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await asyncio.wait_for(self.ws.recv(), TIEMPO_MAXIMO_RERUN))
+            tipo = msg.WhichOneof("type")
+            if tipo == "new_session":
+                # Cada run empieza de cero, también los que dispara st.rerun()
+                mensajes = []
+            elif tipo == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+            else:
+                mensajes.append(msg)
+        self.latencias.append((paso, (time.perf_counter() - inicio) * 1000))
+
+        self.widgets, excepciones, self.errores = _elementos(mensajes)
+        if excepciones:
+            raise ErrorCarga(f"{paso}: {excepciones[0]}")
+
+    async def ir(self, vista):
+        await self.rerun(vista, [_texto(self.widget("radio", "Selecciona una opción"), vista)])
+
+    async def entrar(self, usuario, clave):
+        await self.rerun("acceso")
+        await self.rerun("entrar", [
+            _texto(self.widget("text_input", "Usuario"), usuario),
+            _texto(self.widget("text_input", "Contraseña"), clave),
+            _boton(self.widget("button", "Entrar")),
+        ])
+        self.widget("radio", "Selecciona una opción")
+
+    async def vuelta(self):
+        self.vueltas += 1
+        await self.ir("Lista de pendientes")
+        siguiente = self.widget("button", "Siguiente")
+        if not siguiente.disabled:
+            await self.rerun("lista_siguiente", [_boton(siguiente)])
+
+        await self.ir("Qué comprar")
+        proveedores = self.widget("selectbox", "Filtrar por proveedor")
+        await self.rerun("que_comprar_filtro", [_texto(proveedores, self.rng.choice(list(proveedores.options)))])
+
+        # Empresa única para encontrar después el pendiente creado por esta sesión
+        marca = f"Carga {self.numero}-{self.vueltas}-{secrets.token_hex(3)}"
+        await self.ir("Agregar pendiente")
+        await self.rerun("agregar_guardar", [
+            _texto(self.widget("text_input", "Empresa"), marca),
+            _texto(self.widget("text_input", "Producto"), "Producto de carga"),
+            _texto(self.widget("text_input", "Proveedor"), "Proveedor de carga"),
+            _boton(self.widget("button", "Guardar")),
+        ])
+        if self.errores:
+            raise ErrorCarga(f"agregar_guardar: {self.errores[0]}")
+
+        await self.ir("Eliminar de pendientes")
+        await self.rerun("eliminar_buscar", [_texto(self.widget("text_input", "Buscar por empresa"), marca)])
+        await self.rerun("eliminar", [_boton(self.widget("button", "Eliminar pendiente"))])
+        await self.rerun("eliminar_confirmar", [
+            _casilla(self.widget("checkbox", "Confirmo que deseo eliminar"), True),
+            _boton(self.widget("button", "Eliminar pendiente")),
+        ])
+        # Archivado, la búsqueda queda vacía y el formulario de edición ya no aparece
+        if any(t == "button" and "Eliminar pendiente" in p.label for t, p in self.widgets):
+            raise ErrorCarga(f"eliminar_confirmar: no se archivó {marca}")
+
+
+async def simular(url_ws, numero, args, fin, nivel):
+    await asyncio.sleep(random.uniform(0, args.rampa))
+    try:
+        async with connect(url_ws, subprotocols=["streamlit"], max_size=None) as ws:
+            sesion = Sesion(ws, numero, args.pausa, nivel["latencias"])
+            await sesion.entrar(args.usuario, args.clave)
+            # Al menos una vuelta, y la que está en curso se termina: así no quedan
+            # pendientes de prueba sin archivar
+            while True:
+                await sesion.vuelta()
+                if time.monotonic() >= fin:
+                    break
+            nivel["terminadas"] += 1
+            # Abierta hasta que terminen todas, para medir la memoria con todas conectadas
+            await nivel["cerrar"].wait()
+    except (ErrorCarga, ConnectionClosed, OSError, TimeoutError) as e:
+        nivel["errores"].append(f"sesión {numero}: {e or type(e).__name__}")
+        nivel["terminadas"] += 1
+
+
+# --- Servidor bajo prueba ---
+def _rss_mb(pid):
+    # Memoria residente del proceso (Linux); None donde no hay /proc
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _conexiones(engine):
+    # Conexiones abiertas contra la base de pruebas, sin contar la de esta medición
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT COUNT(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND pid <> pg_backend_pid()
+        """)).scalar()
+
+
+def lanzar_app(url, puerto, secretos, registro):
+    # Secrets propios (secrets.files): la app no lee el secrets.toml de producción
+    carpeta = tempfile.mkdtemp(prefix="carga_")
+    archivo = os.path.join(carpeta, "secrets.toml")
+    with open(archivo, "w", encoding="utf-8") as f:
+        for nombre, valor in {"NEON_DB_URL": url, **secretos}.items():
+            f.write(f"{nombre} = {json.dumps(valor)}\n")
+    proceso = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", "app.py",
+            "--server.headless", "true",
+            "--server.port", str(puerto),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+            "--secrets.files", archivo,
+        ],
+        cwd=RAIZ,
+        env={**os.environ, "NEON_DB_URL": url},
+        stdout=registro,
+        stderr=subprocess.STDOUT,
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"streamlit terminó con código {proceso.returncode} (ver {registro.name})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/_stcore/health", timeout=2):
+                return proceso
+        except OSError:
+            time.sleep(0.5)
+    proceso.terminate()
+    raise RuntimeError(f"streamlit no respondió en 60 s (ver {registro.name})")
+
+
+async def correr_nivel(url_ws, sesiones, args, pid, engine):
+    inicio = time.monotonic()
+    fin = inicio + args.rampa + args.duracion
+    nivel = {"latencias": [], "errores": [], "terminadas": 0, "cerrar": asyncio.Event()}
+    muestras = {"rss": [], "conexiones": []}
+    rss_inicial = _rss_mb(pid)
+
+    async def muestrear():
+        while True:
+            muestras["rss"].append(_rss_mb(pid))
+            muestras["conexiones"].append(await asyncio.to_thread(_conexiones, engine))
+            await asyncio.sleep(INTERVALO_MUESTRAS)
+
+    tarea_muestras = asyncio.create_task(muestrear())
+    tareas = [asyncio.create_task(simular(url_ws, n, args, fin, nivel)) for n in range(sesiones)]
+    # Cuando la última sesión termina su vuelta se cierran todas a la vez
+    while nivel["terminadas"] < sesiones:
+        await asyncio.sleep(INTERVALO_MUESTRAS)
+    transcurrido = time.monotonic() - inicio
+    tarea_muestras.cancel()
+    nivel["cerrar"].set()
+    await asyncio.gather(*tareas)
+
+    tiempos = np.array([ms for _, ms in nivel["latencias"]] or [np.nan])
+    rss = [r for r in muestras["rss"] if r is not None]
+    conexiones = [c for c in muestras["conexiones"] if c is not None]
+    pasos = {}
+    for paso, ms in nivel["latencias"]:
+        pasos.setdefault(paso, []).append(ms)
+    return {
+        "sesiones": sesiones,
+        "reruns": len(nivel["latencias"]),
+        "reruns_por_s": round(len(nivel["latencias"]) / transcurrido, 2),
+        "p50_ms": round(float(np.percentile(tiempos, 50)), 1),
+        "p95_ms": round(float(np.percentile(tiempos, 95)), 1),
+        "p99_ms": round(float(np.percentile(tiempos, 99)), 1),
+        "max_ms": round(float(np.max(tiempos)), 1),
+        "conexiones_max": max(conexiones) if conexiones else None,
+        "rss_mb": round(max(rss), 1) if rss else None,
+        # Aproximado: Python no siempre devuelve memoria, y el servidor guarda las
+        # sesiones desconectadas un rato (server.disconnectedSessionTTL)
+        "mb_por_sesion": round((max(rss) - rss_inicial) / sesiones, 2) if rss and rss_inicial else None,
+        "errores": nivel["errores"],
+        "pasos": {
+            paso: {"n": len(ms), "p50_ms": round(float(np.percentile(ms, 50)), 1), "p95_ms": round(float(np.percentile(ms, 95)), 1)}
+            for paso, ms in pasos.items()
+        },
+    }
+
+
+def _mostrar(resultados):
+    def valor(v):
+        return "-" if v is None else v
+
+    print(f"{'sesiones':>9}{'reruns':>8}{'rerun/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}"
+          f"{'conex.':>8}{'RSS MB':>8}{'MB/ses.':>9}{'errores':>9}")
+    for r in resultados:
+        print(f"{r['sesiones']:>9}{r['reruns']:>8}{r['reruns_por_s']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['max_ms']:>9}{valor(r['conexiones_max']):>8}{valor(r['rss_mb']):>8}"
+              f"{valor(r['mb_por_sesion']):>9}{len(r['errores']):>9}")
+
+    pasos = list(dict.fromkeys(p for r in resultados for p in r["pasos"]))
+    print("\np95 ms por paso y nivel de sesiones")
+    print(f"{'paso':<22}" + "".join(f"{r['sesiones']:>9}" for r in resultados))
+    for paso in pasos:
+        print(f"{paso:<22}" + "".join(f"{valor(r['pasos'].get(paso, {}).get('p95_ms')):>9}" for r in resultados))
+
+    for r in resultados:
+        for error in r["errores"][:3]:
+            print(f"ERROR ({r['sesiones']} sesiones) {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones de Streamlit concurrentes")
+    parser.add_argument("--url", required=True, help="Base de pruebas (nunca la de producción): se agregan y archivan pendientes")
+    parser.add_argument("--sesiones", default="1,5,10,20", help="Niveles de concurrencia, separados por comas")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos por nivel")
+    parser.add_argument("--rampa", type=float, default=2, help="Las sesiones de un nivel arrancan repartidas en estos segundos")
+    parser.add_argument("--pausa", type=float, default=1.0, help="Pausa media entre acciones de una sesión (s); 0 para saturar")
+    parser.add_argument("--usuario", default="", help="Cuenta de usuarios.py (sin cuentas se entra con una APP_PASSWORD de prueba)")
+    parser.add_argument("--clave", help="Contraseña de --usuario")
+    parser.add_argument("--puerto", type=int, default=8599)
+    parser.add_argument("--poblar", action="store_true", help="Borrar y volver a generar los datos sintéticos")
+    parser.add_argument("--pendientes", type=int, default=10_000)
+    parser.add_argument("--entregas", type=int, default=50_000)
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args(argv)
+
+    if args.url == obtener_config("NEON_DB_URL"):
+        parser.error("--url apunta a NEON_DB_URL; usa una base de pruebas.")
+    if args.usuario and not args.clave:
+        parser.error("--usuario necesita --clave.")
+
+    engine = obtener_engine(args.url)
+    if args.poblar:
+        inicio = time.perf_counter()
+        poblar(engine, args.pendientes, args.entregas)
+        print(f"Datos generados en {time.perf_counter() - inicio:.1f} s")
+
+    secretos = {}
+    if not args.usuario:
+        args.clave = secrets.token_urlsafe(12)
+        secretos["APP_PASSWORD"] = args.clave
+
+    niveles = [int(n) for n in args.sesiones.split(",")]
+    registro = tempfile.NamedTemporaryFile("w", prefix="carga_streamlit_", suffix=".log", delete=False)
+    proceso = lanzar_app(args.url, args.puerto, secretos, registro)
+    url_ws = f"ws://127.0.0.1:{args.puerto}/_stcore/stream"
+    resultados = []
+    try:
+        # Una sesión descartada antes de medir: la primera importa pandas, plotly y la
+        # capa de datos y llena la caché, y eso no es costo por sesión
+        print("Calentando...", flush=True)
+        asyncio.run(correr_nivel(url_ws, 1, argparse.Namespace(**{**vars(args), "duracion": 0, "rampa": 0}), proceso.pid, engine))
+        for sesiones in niveles:
+            print(f"{sesiones} sesiones...", flush=True)
+            resultados.append(asyncio.run(correr_nivel(url_ws, sesiones, args, proceso.pid, engine)))
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+    print()
+    _mostrar(resultados)
+    print(f"\nRegistro del servidor: {registro.name}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args) | {"clave": None}, "niveles": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+    return 1 if any(r["errores"] for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
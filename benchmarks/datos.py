@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import column, insert, table, text
+
+from migraciones import aplicar_migraciones
+from operaciones import CAMPOS_PENDIENTE, COLUMNAS_ARCHIVO, TIPOS_FACTURACION
+
+
+# === GENERADOR DE DATOS SINTÉTICOS ===
+# Distribuciones parecidas a las reales: pocas empresas, proveedores y SKUs concentran
+# la mayoría de las líneas (Zipf), cantidades chicas y fechas repartidas en el tiempo.
+
+N_EMPRESAS = 400
+N_PROVEEDORES = 40
+N_PRODUCTOS = 3000
+VENDEDORES = ["Ana", "Luis", "Carla", "Pedro", "Sofía", "Jorge", "Marta", "Diego", "Paula", "Tomás", "Rocío", "Iván"]
+
+_pendientes = table("pendientes", *[column(c) for c in CAMPOS_PENDIENTE + ["fecha_creacion"]])
+_entregas = table("entregas_completadas", *[column(c) for c in COLUMNAS_ARCHIVO + ["fecha_entrega"]])
+
+
+def _zipf(rng, n_valores, tamano, a=1.3):
+    # Índices 0..n_valores-1 con frecuencia decreciente
+    return (rng.zipf(a, tamano) - 1) % n_valores
+
+
+def generar_lineas(n, rng, dias_atras):
+    empresas = _zipf(rng, N_EMPRESAS, n)
+    productos = _zipf(rng, N_PRODUCTOS, n, a=1.15)
+    hoy = pd.Timestamp.today().normalize()
+    creacion = hoy - pd.to_timedelta(rng.integers(0, dias_atras * 24 * 60, n), unit="min")
+    nota_venta = (creacion - pd.to_timedelta(rng.integers(0, 5, n), unit="D")).date
+    con_oc = rng.random(n) < 0.4
+
+    return pd.DataFrame({
+        "empresa": [f"Empresa {e:03d}" for e in empresas],
+        "rut_empresa": [f"{76000000 + e}-{e % 10}" for e in empresas],
+        "fecha_nota_venta": nota_venta,
+        "fecha_entrega": None,
+        "n_nota_venta": [f"NV{v:06d}" for v in rng.integers(1, n // 3 + 2, n)],
+        "tipo_facturacion": rng.choice(TIPOS_FACTURACION, n, p=[0.3, 0.7]),
+        "orden_compra": np.where(con_oc, [f"OC{v:05d}" for v in rng.integers(1, 99999, n)], ""),
+        "producto": [f"Producto {p:04d}" for p in productos],
+        # El proveedor depende del producto, como en el catálogo real
+        "proveedor": [f"Proveedor {p % N_PROVEEDORES:02d}" for p in productos],
+        "sku": [f"SKU-{p:05d}" for p in productos],
+        "cantidad": np.minimum(rng.geometric(0.15, n), 200),
+        "estado": "Pendiente",
+        "motivo": "",
+        "vendedor": rng.choice(VENDEDORES, n),
+        "fecha_creacion": creacion,
+    })
+
+
+def _insertar(engine, tabla, df, tamano_lote=2000):
+    # Los drivers no aceptan pd.Timestamp: se pasan como datetime
+    filas = [
+        {k: v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for k, v in fila.items()}
+        for fila in df.to_dict("records")
+    ]
+    with engine.begin() as conn:
+        for i in range(0, len(filas), tamano_lote):
+            conn.execute(insert(tabla), filas[i:i + tamano_lote])
+
+
+def poblar(engine, n_pendientes, n_entregas, semilla=42):
+    # Deja la base con exactamente n_pendientes y n_entregas filas
+    aplicar_migraciones(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM pendientes"))
+        conn.execute(text("DELETE FROM entregas_completadas"))
+
+    rng = np.random.default_rng(semilla)
+    lote = 50_000
+    for inicio in range(0, n_pendientes, lote):
+        _insertar(engine, _pendientes, generar_lineas(min(lote, n_pendientes - inicio), rng, 120))
+
+    for inicio in range(0, n_entregas, lote):
+        df = generar_lineas(min(lote, n_entregas - inicio), rng, 730)
+        df["estado"] = "Completado"
+        # Entregado entre 1 y 60 días después de creado
+        df["fecha_entrega"] = df["fecha_creacion"] + pd.to_timedelta(rng.integers(1, 60, len(df)), unit="D")
+        _insertar(engine, _entregas, df[COLUMNAS_ARCHIVO + ["fecha_entrega"]])
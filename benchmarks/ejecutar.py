@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import consultas
+from compras import ordenes_borrador
+from db import leer_sql, limpiar_cache, obtener_config, obtener_engine, usar_url
+from graficos import armar_barras
+from historico import buscar_entregas
+from operaciones import archivar_pendientes
+
+from benchmarks.datos import poblar
+
+
+# === BENCHMARK DE LOS CAMINOS DE DATOS DE CADA VISTA ===
+# python -m benchmarks.ejecutar --url sqlite:////tmp/bench.db --poblar --pendientes 100000
+# python -m benchmarks.ejecutar --url sqlite:////tmp/bench.db --guardar-linea-base
+#
+# Cada caso se mide sin caché (se limpia antes de cada repetición), así se compara
+# el costo real contra la base. La salida es p50/p95 en ms y el pico de memoria de
+# Python (tracemalloc) de una repetición aparte.
+
+LINEA_BASE = os.path.join(os.path.dirname(__file__), "linea_base.json")
+
+
+def _top(columna):
+    # Valor más frecuente, para filtrar como lo haría un usuario
+    df = leer_sql(
+        f"SELECT {columna} AS valor, COUNT(*) AS n FROM pendientes GROUP BY {columna} ORDER BY n DESC LIMIT 1",
+        ["pendientes"]
+    )
+    return df["valor"].iloc[0]
+
+
+def casos(engine):
+    empresa = _top("empresa")
+    proveedor = _top("proveedor")
+    total = consultas.contar_pendientes()
+    medio, _ = consultas.pagina_pendientes(max(1, total // 2))
+    cursor_medio = consultas.cursor_de(medio)
+
+    def lista_completa():
+        # Lo que hacía obtener_pendientes() antes de paginar (referencia)
+        return leer_sql("SELECT * FROM pendientes ORDER BY fecha_creacion DESC", ["pendientes"])
+
+    def lista_pagina():
+        consultas.contar_pendientes()
+        consultas.contar_atrasados(7)
+        return consultas.pagina_pendientes(50)[0]
+
+    def lista_pagina_profunda():
+        return consultas.pagina_pendientes(50, cursor_medio)[0]
+
+    def dashboard():
+        consultas.resumen_cantidades(["proveedor"])
+        consultas.valores_distintos("empresa")
+        return consultas.resumen_cantidades(["producto", "sku", "proveedor"], empresa=empresa)
+
+    def que_comprar():
+        consultas.valores_distintos("proveedor")
+        consultas.resumen_cantidades(["proveedor", "producto", "sku"], estado="Pendiente")
+        return consultas.resumen_cantidades(["proveedor", "producto", "sku"], estado="Pendiente", empresa=empresa, proveedor=proveedor)
+
+    def grafico_compras():
+        # Gráfico de "Qué comprar" sin filtros, sin la caché de figuras
+        tabla = consultas.resumen_cantidades(["proveedor", "producto", "sku"], estado="Pendiente")
+        return armar_barras(tabla, "producto", "cantidad", "Productos pendientes por proveedor", "proveedor")
+
+    def plan_compras():
+        return ordenes_borrador(consultas.plan_compras())
+
+    def busqueda():
+        consultas.buscar("pendientes", empresa=empresa[-5:], producto="01")
+        return consultas.buscar("entregas_completadas", proveedor=proveedor[-4:])
+
+    def entregas_ventana():
+        # Vista "Entregas Completadas" con el rango por defecto (últimos 3 meses)
+        hoy = pd.Timestamp.today().normalize()
+        rango = ((hoy - pd.DateOffset(months=3)).to_pydatetime(), (hoy + pd.Timedelta(days=1)).to_pydatetime())
+        consultas.hay_entregas()
+        return buscar_entregas(rango, proveedor=proveedor[-4:])
+
+    def antiguedad_sla():
+        hoy = pd.Timestamp.today().normalize()
+        rango = ((hoy - pd.DateOffset(months=6)).to_pydatetime(), (hoy + pd.Timedelta(days=1)).to_pydatetime())
+        consultas.antiguedad("proveedor")
+        consultas.tiempos_entrega("proveedor", rango)
+        return consultas.tendencia_semanal(rango)
+
+    def archivar_50():
+        # Se deshace al final para que todas las repeticiones vean los mismos datos
+        with engine.connect() as conn:
+            transaccion = conn.begin()
+            ids = [f[0] for f in conn.execute(text("SELECT id FROM pendientes ORDER BY id LIMIT 50"))]
+            archivar_pendientes(conn, ids)
+            transaccion.rollback()
+        return ids
+
+    return {
+        "lista_completa": lista_completa,
+        "lista_pagina": lista_pagina,
+        "lista_pagina_profunda": lista_pagina_profunda,
+        "dashboard": dashboard,
+        "que_comprar": que_comprar,
+        "grafico_compras": grafico_compras,
+        "plan_compras": plan_compras,
+        "busqueda": busqueda,
+        "entregas_ventana": entregas_ventana,
+        "antiguedad_sla": antiguedad_sla,
+        "archivar_50": archivar_50,
+    }
+
+
+def medir_caso(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        limpiar_cache()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    limpiar_cache()
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(float(np.percentile(tiempos, 50)), 2),
+        "p95_ms": round(float(np.percentile(tiempos, 95)), 2),
+        "pico_mb": round(pico / 1024 / 1024, 2),
+    }
+
+
+def comparar(resultados, linea_base, tolerancia, margen_ms):
+    # Regresión: p95 peor que la línea base en más de la tolerancia y del margen absoluto
+    regresiones = []
+    for nombre, actual in resultados["casos"].items():
+        base = linea_base["casos"].get(nombre)
+        if base is None:
+            continue
+        limite = max(base["p95_ms"] * (1 + tolerancia), base["p95_ms"] + margen_ms)
+        if actual["p95_ms"] > limite:
+            regresiones.append(f"{nombre}: p95 {actual['p95_ms']} ms > {limite:.2f} ms (base {base['p95_ms']} ms)")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de las consultas de cada vista")
+    parser.add_argument("--url", required=True, help="Base de pruebas (nunca la de producción)")
+    parser.add_argument("--poblar", action="store_true", help="Borrar y volver a generar los datos sintéticos")
+    parser.add_argument("--pendientes", type=int, default=10_000)
+    parser.add_argument("--entregas", type=int, default=50_000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--casos", help="Lista separada por comas (por defecto todos)")
+    parser.add_argument("--linea-base", default=LINEA_BASE)
+    parser.add_argument("--guardar-linea-base", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Aumento relativo permitido del p95")
+    parser.add_argument("--margen-ms", type=float, default=2.0, help="Aumento absoluto permitido del p95")
+    args = parser.parse_args(argv)
+
+    if args.url == obtener_config("NEON_DB_URL"):
+        parser.error("--url apunta a NEON_DB_URL; usa una base de pruebas.")
+
+    usar_url(args.url)
+    engine = obtener_engine(args.url)
+
+    if args.poblar:
+        inicio = time.perf_counter()
+        poblar(engine, args.pendientes, args.entregas)
+        print(f"Datos generados en {time.perf_counter() - inicio:.1f} s")
+
+    todos = casos(engine)
+    elegidos = args.casos.split(",") if args.casos else list(todos)
+
+    resultados = {
+        "config": {
+            "motor": engine.dialect.name,
+            "pendientes": consultas.contar_pendientes(),
+            "entregas": consultas.contar_entregas(),
+        },
+        "casos": {},
+    }
+    print(f"{'caso':<24}{'p50 ms':>10}{'p95 ms':>10}{'pico MB':>10}")
+    for nombre in elegidos:
+        r = medir_caso(todos[nombre], args.repeticiones)
+        resultados["casos"][nombre] = r
+        print(f"{nombre:<24}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['pico_mb']:>10}")
+
+    if args.guardar_linea_base:
+        with open(args.linea_base, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.linea_base}")
+        return 0
+
+    if not os.path.exists(args.linea_base):
+        print("No hay línea base para comparar (usa --guardar-linea-base).")
+        return 0
+
+    with open(args.linea_base, encoding="utf-8") as f:
+        linea_base = json.load(f)
+    if linea_base["config"] != resultados["config"]:
+        print(f"La línea base es de otra configuración ({linea_base['config']}); no se compara.")
+        return 0
+
+    regresiones = comparar(resultados, linea_base, args.tolerancia, args.margen_ms)
+    for r in regresiones:
+        print("REGRESIÓN " + r)
+    if not regresiones:
+        print("Sin regresiones respecto de la línea base.")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
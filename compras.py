@@ -0,0 +1,115 @@
+import argparse
+import re
+import sys
+
+import pandas as pd
+
+from consultas import plan_compras
+from db import usar_url
+
+
+# === PLAN DE COMPRAS Y ÓRDENES DE COMPRA EN BORRADOR ===
+# A partir de consultas.plan_compras() (una sola consulta agregada) arma una orden
+# en borrador por proveedor con las líneas que faltan comprar, y el documento XLSX
+# con una hoja de resumen y una hoja por orden.
+
+COLUMNAS_LINEA = ["producto", "sku", "a_comprar", "demanda", "cubierta", "empresas", "pendiente_desde"]
+
+ENCABEZADOS_LINEA = {
+    "producto": "Producto",
+    "sku": "SKU",
+    "a_comprar": "Cantidad a comprar",
+    "demanda": "Demanda pendiente",
+    "cubierta": "Ya con OC",
+    "empresas": "Empresas",
+    "pendiente_desde": "Pendiente desde",
+}
+
+
+def numero_borrador(proveedor, fecha):
+    # Identificador legible y estable en el día, no un correlativo real
+    codigo = re.sub(r"[^A-Z0-9]+", "", proveedor.upper())[:12] or "PROV"
+    return f"BORR-{fecha:%Y%m%d}-{codigo}"
+
+
+def ordenes_borrador(plan, fecha=None):
+    # [{"numero", "proveedor", "lineas" (DataFrame), "unidades"}], una por proveedor
+    # con algo que comprar, de la que tiene más unidades a la que menos
+    fecha = fecha or pd.Timestamp.today()
+    # Conversión y orden una sola vez para todo el plan, no por proveedor
+    faltante = plan.loc[plan["a_comprar"] > 0, ["proveedor"] + COLUMNAS_LINEA]
+    # SQLite devuelve MIN(fecha_creacion) como texto
+    faltante["pendiente_desde"] = pd.to_datetime(faltante["pendiente_desde"], format="ISO8601")
+    faltante = faltante.sort_values("a_comprar", ascending=False, kind="stable").reset_index(drop=True)
+    lineas_plan = faltante[COLUMNAS_LINEA]
+    ordenes = []
+    for proveedor, posiciones in faltante.groupby("proveedor", observed=True).indices.items():
+        lineas = lineas_plan.take(posiciones).reset_index(drop=True)
+        ordenes.append({
+            "numero": numero_borrador(str(proveedor), fecha),
+            "proveedor": str(proveedor),
+            "lineas": lineas,
+            "unidades": int(lineas["a_comprar"].sum()),
+        })
+    return sorted(ordenes, key=lambda o: o["unidades"], reverse=True)
+
+
+def _nombre_hoja(texto, usados):
+    # Excel: máximo 31 caracteres, sin []:*?/\ y sin repetir
+    base = re.sub(r"[\[\]:*?/\\]", "", texto)[:31] or "Hoja"
+    nombre, i = base, 2
+    while nombre.lower() in usados:
+        sufijo = f" ({i})"
+        nombre, i = base[:31 - len(sufijo)] + sufijo, i + 1
+    usados.add(nombre.lower())
+    return nombre
+
+
+def documento_xlsx(ordenes, destino):
+    # destino: ruta o archivo binario abierto
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    libro = Workbook()
+    resumen = libro.active
+    resumen.title = "Resumen"
+    resumen.append(["Orden (borrador)", "Proveedor", "Líneas", "Unidades a comprar"])
+    for orden in ordenes:
+        resumen.append([orden["numero"], orden["proveedor"], len(orden["lineas"]), orden["unidades"]])
+
+    usados = {"resumen"}
+    for orden in ordenes:
+        hoja = libro.create_sheet(_nombre_hoja(orden["proveedor"], usados))
+        hoja.append(["Orden de compra (borrador)", orden["numero"]])
+        hoja.append(["Proveedor", orden["proveedor"]])
+        hoja.append([])
+        hoja.append([ENCABEZADOS_LINEA[c] for c in COLUMNAS_LINEA])
+        for fila in orden["lineas"].itertuples(index=False):
+            hoja.append([v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in fila])
+        hoja.append(["Total", None, orden["unidades"]])
+        for celda in (hoja["A1"], hoja["A2"], hoja[f"A{hoja.max_row}"]):
+            celda.font = Font(bold=True)
+
+    for celda in resumen[1]:
+        celda.font = Font(bold=True)
+    libro.save(destino)
+
+
+# === CLI ===
+# python compras.py plan_compras.xlsx
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generar órdenes de compra en borrador por proveedor")
+    parser.add_argument("archivo", help="Destino XLSX")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        usar_url(args.url)
+    ordenes = ordenes_borrador(plan_compras())
+    documento_xlsx(ordenes, args.archivo)
+    print(f"{len(ordenes)} órdenes en borrador, {sum(o['unidades'] for o in ordenes)} unidades -> {args.archivo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+import pandas as pd
+
+from db import leer_sql, dialecto
+from operaciones import CLAVE_LINEA, CONDICION_LINEA
+
+
+# === CONSULTAS DE LECTURA ===
+# Los sql_* solo arman la consulta parametrizada (sql, params); las demás funciones
+# la ejecutan a través de la caché de db.leer_sql.
+
+
+# Columnas que trae cada lectura, en vez de SELECT *: solo lo que la vista usa
+COLUMNAS_LISTA = [
+    "id", "empresa", "rut_empresa", "producto", "sku", "cantidad", "proveedor",
+    "tipo_facturacion", "orden_compra", "fecha_nota_venta", "n_nota_venta",
+    "fecha_entrega", "estado", "motivo", "vendedor", "fecha_creacion",
+]
+
+COLUMNAS_SELECCION = {
+    # "Eliminar de pendientes" edita el registro completo y necesita la versión leída
+    "pendientes": COLUMNAS_LISTA + ["version"],
+    "entregas_completadas": [
+        "id", "empresa", "rut_empresa", "producto", "sku", "cantidad", "proveedor",
+        "tipo_facturacion", "orden_compra", "fecha_nota_venta", "n_nota_venta",
+        "motivo", "vendedor", "fecha_entrega",
+    ],
+}
+
+
+# --- Lista de pendientes: conteo y paginación keyset sobre (fecha_creacion, id) ---
+# vendedor: solo los pendientes de ese vendedor (usuarios con rol vendedor); con el
+# índice (vendedor, fecha_creacion, id) de la migración 7 se recorren solo sus filas.
+def _where(condiciones):
+    return f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+
+def sql_contar_pendientes(vendedor=None):
+    if vendedor is None:
+        return "SELECT COUNT(*) AS total FROM pendientes", {}
+    return "SELECT COUNT(*) AS total FROM pendientes WHERE vendedor = :vendedor", {"vendedor": vendedor}
+
+
+def sql_contar_atrasados(fecha_limite, vendedor=None):
+    params = {"fecha_limite": fecha_limite}
+    condiciones = ["estado = 'Pendiente'", "fecha_creacion <= :fecha_limite"]
+    if vendedor is not None:
+        condiciones.append("vendedor = :vendedor")
+        params["vendedor"] = vendedor
+    return f"SELECT COUNT(*) AS total FROM pendientes {_where(condiciones)}", params
+
+
+def sql_pagina_pendientes(limite, cursor=None, vendedor=None):
+    # cursor: (fecha_creacion, id) de la última fila de la página anterior.
+    # Con keyset la base salta directo a la posición por el índice, sin OFFSET.
+    params = {"limite": limite}
+    condiciones = []
+    if vendedor is not None:
+        condiciones.append("vendedor = :vendedor")
+        params["vendedor"] = vendedor
+    if cursor is not None:
+        condiciones.append("(fecha_creacion, id) < (:cursor_fecha, :cursor_id)")
+        params["cursor_fecha"], params["cursor_id"] = cursor
+    sql = f"""
+        SELECT {", ".join(COLUMNAS_LISTA)} FROM pendientes
+        {_where(condiciones)}
+        ORDER BY fecha_creacion DESC, id DESC
+        LIMIT :limite
+    """
+    return sql, params
+
+
+def contar_pendientes(vendedor=None):
+    sql, params = sql_contar_pendientes(vendedor)
+    return int(leer_sql(sql, ["pendientes"], params, "contar_pendientes")["total"].iloc[0])
+
+
+def contar_atrasados(dias=7, vendedor=None):
+    fecha_limite = (pd.Timestamp.today().normalize() - pd.Timedelta(days=dias)).to_pydatetime()
+    sql, params = sql_contar_atrasados(fecha_limite, vendedor)
+    return int(leer_sql(sql, ["pendientes"], params, "contar_atrasados")["total"].iloc[0])
+
+
+def pagina_pendientes(limite, cursor=None, vendedor=None):
+    # Se pide una fila extra solo para saber si existe una página siguiente
+    sql, params = sql_pagina_pendientes(limite + 1, cursor, vendedor)
+    df = leer_sql(sql, ["pendientes"], params, "pagina_pendientes")
+    hay_mas = len(df) > limite
+    return df.iloc[:limite], hay_mas
+
+
+def cursor_de(df):
+    # Cursor keyset a partir de la última fila de una página
+    fecha = df["fecha_creacion"].iloc[-1]
+    if isinstance(fecha, pd.Timestamp):
+        fecha = fecha.to_pydatetime()
+    return fecha, int(df["id"].iloc[-1])
+
+
+# --- Agregaciones para Dashboard y "Qué comprar" ---
+# Solo se aceptan estas columnas para agrupar/filtrar: se interpolan en el SQL,
+# así que nunca deben venir directamente del usuario.
+COLUMNAS_AGRUPABLES = ["empresa", "proveedor", "producto", "sku", "vendedor", "estado"]
+
+# Claves de la tabla resumen_pendientes, que los triggers mantienen al día
+COLUMNAS_RESUMEN = ["empresa", "proveedor", "producto", "sku"]
+
+
+def _validar_columnas(columnas):
+    for c in columnas:
+        if c not in COLUMNAS_AGRUPABLES:
+            raise ValueError(f"Columna no permitida: {c}")
+
+
+def sql_valores_distintos(columna):
+    _validar_columnas([columna])
+    tabla = "resumen_pendientes" if columna in COLUMNAS_RESUMEN else "pendientes"
+    return f"""
+        SELECT DISTINCT {columna} AS valor FROM {tabla}
+        WHERE {columna} IS NOT NULL
+        ORDER BY {columna}
+    """, {}
+
+
+def sql_resumen_cantidades(agrupar_por, filtros=None):
+    # SUM(cantidad) agrupado en la base; filtros: {columna: valor} con igualdad.
+    # Igual que groupby de pandas, se descartan los grupos con claves nulas.
+    if not agrupar_por:
+        raise ValueError("Hay que agrupar por al menos una columna")
+    filtros = filtros or {}
+    _validar_columnas(list(agrupar_por) + list(filtros))
+    condiciones = [f"{c} IS NOT NULL" for c in agrupar_por]
+    params = {}
+    for i, (columna, valor) in enumerate(filtros.items()):
+        condiciones.append(f"{columna} = :filtro_{i}")
+        params[f"filtro_{i}"] = valor
+    columnas = ", ".join(agrupar_por)
+    # Si todas las columnas están en resumen_pendientes (migración 4) se agrega sobre
+    # esa tabla, que tiene una fila por grupo, en vez de recorrer pendientes
+    tabla = "resumen_pendientes" if set(agrupar_por) | set(filtros) <= set(COLUMNAS_RESUMEN) else "pendientes"
+    sql = f"""
+        SELECT {columnas}, SUM(cantidad) AS cantidad
+        FROM {tabla}
+        WHERE {" AND ".join(condiciones)}
+        GROUP BY {columnas}
+        ORDER BY {columnas}
+    """
+    return sql, params
+
+
+def valores_distintos(columna):
+    sql, params = sql_valores_distintos(columna)
+    return leer_sql(sql, ["pendientes"], params, f"distintos_{columna}")["valor"].tolist()
+
+
+def resumen_cantidades(agrupar_por, **filtros):
+    sql, params = sql_resumen_cantidades(agrupar_por, filtros)
+    return leer_sql(sql, ["pendientes"], params, "resumen_" + "_".join(agrupar_por))
+
+
+# --- Búsqueda de texto ---
+# ILIKE '%texto%' en Postgres (respaldado por los índices de trigramas de la
+# migración 3); en SQLite LIKE ya ignora mayúsculas. Siempre con LIMIT, para que
+# el tamaño del resultado no crezca con el historial.
+COLUMNAS_BUSQUEDA = {
+    "pendientes": ["empresa", "producto", "proveedor"],
+    "entregas_completadas": ["empresa", "producto", "proveedor"],
+}
+
+ORDEN_BUSQUEDA = {
+    "pendientes": "fecha_creacion DESC, id DESC",
+    "entregas_completadas": "fecha_entrega DESC, id DESC",
+}
+
+# Columna de fecha para filtrar por rango (indexadas en la migración 2)
+COLUMNAS_FECHA = {
+    "pendientes": "fecha_creacion",
+    "entregas_completadas": "fecha_entrega",
+}
+
+
+def _escapar_like(valor):
+    # Se busca el texto literal: % y _ del usuario no son comodines
+    return valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def sql_buscar(tabla, terminos, limite, motor="postgresql", columnas=None, rango=None, vendedor=None):
+    # terminos: {columna: texto}; los textos vacíos se ignoran.
+    # limite=None solo para la exportación (exportar.py), que lee con cursor.
+    # rango: (desde, hasta) sobre COLUMNAS_FECHA, hasta excluido.
+    # vendedor: igualdad exacta, no LIKE (ver sql_pagina_pendientes).
+    columnas_validas = COLUMNAS_BUSQUEDA[tabla]
+    operador = "ILIKE" if motor == "postgresql" else "LIKE"
+    condiciones = []
+    params = {"limite": limite} if limite is not None else {}
+    for columna, valor in terminos.items():
+        if columna not in columnas_validas:
+            raise ValueError(f"Columna no permitida: {columna}")
+        valor = (valor or "").strip()
+        if valor:
+            condiciones.append(f"{columna} {operador} :buscar_{columna} ESCAPE '\\'")
+            params[f"buscar_{columna}"] = f"%{_escapar_like(valor)}%"
+    if rango is not None:
+        # Con el índice de la fecha solo se recorre la ventana elegida, no todo el historial
+        fecha = COLUMNAS_FECHA[tabla]
+        condiciones.append(f"{fecha} >= :desde AND {fecha} < :hasta")
+        params["desde"], params["hasta"] = rango
+    if vendedor is not None:
+        condiciones.append("vendedor = :vendedor")
+        params["vendedor"] = vendedor
+    sql = f"""
+        SELECT {", ".join(columnas or COLUMNAS_SELECCION[tabla])} FROM {tabla}
+        {_where(condiciones)}
+        ORDER BY {ORDEN_BUSQUEDA[tabla]}
+        {"LIMIT :limite" if limite is not None else ""}
+    """
+    return sql, params
+
+
+def buscar(tabla, limite=200, rango=None, vendedor=None, **terminos):
+    sql, params = sql_buscar(tabla, terminos, limite, dialecto(), rango=rango, vendedor=vendedor)
+    return leer_sql(sql, [tabla], params, f"buscar_{tabla}")
+
+
+# --- Línea ya cargada: mismo pendiente que se está por agregar (operaciones.clave_linea) ---
+def sql_linea_existente(empresa, n_nota_venta, sku, orden_compra):
+    valores = ["UPPER(TRIM(:n_nota_venta))", "UPPER(TRIM(:sku))", "LOWER(TRIM(:empresa))", "UPPER(TRIM(:orden_compra))"]
+    iguales = " AND ".join(f"{expresion} = {valor}" for expresion, valor in zip(CLAVE_LINEA, valores))
+    params = {"n_nota_venta": n_nota_venta, "sku": sku, "empresa": empresa, "orden_compra": orden_compra}
+    sql = f"""
+        SELECT id, producto, cantidad FROM pendientes
+        WHERE {CONDICION_LINEA} AND {iguales}
+        ORDER BY id LIMIT 1
+    """
+    return sql, params
+
+
+def linea_existente(empresa, n_nota_venta, sku, orden_compra):
+    # La fila (id, producto, cantidad) o None; sin nota de venta o SKU nunca hay una
+    if not (n_nota_venta or "").strip() or not (sku or "").strip():
+        return None
+    sql, params = sql_linea_existente(empresa, n_nota_venta, sku, orden_compra or "")
+    df = leer_sql(sql, ["pendientes"], params, "linea_existente")
+    return None if df.empty else df.iloc[0]
+
+
+def sql_contar_entregas():
+    return "SELECT COUNT(*) AS total FROM entregas_completadas", {}
+
+
+def sql_hay_entregas():
+    # Solo si existe alguna fila: no recorre la tabla como COUNT(*)
+    return "SELECT COUNT(*) AS total FROM (SELECT 1 FROM entregas_completadas LIMIT 1) t", {}
+
+
+def hay_entregas():
+    sql, params = sql_hay_entregas()
+    return bool(leer_sql(sql, ["entregas_completadas"], params, "hay_entregas")["total"].iloc[0])
+
+
+def contar_entregas():
+    sql, params = sql_contar_entregas()
+    return int(leer_sql(sql, ["entregas_completadas"], params, "contar_entregas")["total"].iloc[0])
+
+
+# --- Antigüedad de pendientes y tiempos de entrega (vista "Antigüedad y SLA") ---
+# Todo se calcula en la base: a pandas solo llega una fila por grupo o por semana.
+# Los percentiles son "nearest rank": percentile_disc en Postgres y ROW_NUMBER()
+# sobre la partición en SQLite, que no tiene funciones de percentil.
+COLUMNAS_ANALISIS = ["proveedor", "vendedor", "empresa"]
+
+# (desde, hasta, nombre de la columna); hasta=None es abierto
+TRAMOS_ANTIGUEDAD = [
+    (0, 3, "d0_3"),
+    (4, 7, "d4_7"),
+    (8, 14, "d8_14"),
+    (15, None, "d15_mas"),
+]
+
+PERCENTILES_ENTREGA = [(0.5, "mediana_dias"), (0.9, "p90_dias")]
+
+
+def _validar_analisis(columna):
+    if columna not in COLUMNAS_ANALISIS:
+        raise ValueError(f"Columna no permitida: {columna}")
+
+
+def _dias_entre(desde, hasta, motor):
+    # Días calendario enteros entre dos fechas (o timestamps)
+    if motor == "postgresql":
+        return f"(CAST({hasta} AS DATE) - CAST({desde} AS DATE))"
+    return f"CAST(julianday(date({hasta})) - julianday(date({desde})) AS INTEGER)"
+
+
+def sql_antiguedad(agrupar_por, hoy, motor="postgresql"):
+    # Pendientes abiertos por tramo de días desde fecha_creacion
+    _validar_analisis(agrupar_por)
+    tramos = []
+    for desde, hasta, nombre in TRAMOS_ANTIGUEDAD:
+        condicion = f"dias >= {desde}" + (f" AND dias <= {hasta}" if hasta is not None else "")
+        tramos.append(f"SUM(CASE WHEN {condicion} THEN 1 ELSE 0 END) AS {nombre}")
+    sql = f"""
+        SELECT grupo, {", ".join(tramos)}, COUNT(*) AS total, MAX(dias) AS max_dias
+        FROM (
+            SELECT {agrupar_por} AS grupo, {_dias_entre("fecha_creacion", ":hoy", motor)} AS dias
+            FROM pendientes
+            WHERE estado = 'Pendiente' AND {agrupar_por} IS NOT NULL
+        ) t
+        GROUP BY grupo
+        ORDER BY total DESC, grupo
+    """
+    return sql, {"hoy": hoy}
+
+
+def _sql_percentiles_entrega(grupo, rango, motor):
+    # grupo: expresión SQL de la clave. Días desde la nota de venta hasta el archivo.
+    dias = _dias_entre("fecha_nota_venta", "fecha_entrega", motor)
+    where = "fecha_nota_venta IS NOT NULL AND fecha_entrega >= :desde AND fecha_entrega < :hasta"
+    params = {"desde": rango[0], "hasta": rango[1]}
+    if motor == "postgresql":
+        percentiles = ", ".join(
+            f"percentile_disc({p}) WITHIN GROUP (ORDER BY dias) AS {nombre}" for p, nombre in PERCENTILES_ENTREGA
+        )
+        sql = f"""
+            SELECT grupo, COUNT(*) AS entregas, AVG(CAST(dias AS FLOAT)) AS promedio_dias, {percentiles}
+            FROM (SELECT {grupo} AS grupo, {dias} AS dias FROM entregas_completadas WHERE {where}) t
+            WHERE grupo IS NOT NULL
+            GROUP BY grupo
+        """
+    else:
+        percentiles = ", ".join(
+            f"MIN(CASE WHEN fila >= {p} * n THEN dias END) AS {nombre}" for p, nombre in PERCENTILES_ENTREGA
+        )
+        sql = f"""
+            SELECT grupo, COUNT(*) AS entregas, AVG(CAST(dias AS FLOAT)) AS promedio_dias, {percentiles}
+            FROM (
+                SELECT grupo, dias,
+                       ROW_NUMBER() OVER (PARTITION BY grupo ORDER BY dias) AS fila,
+                       COUNT(*) OVER (PARTITION BY grupo) AS n
+                FROM (SELECT {grupo} AS grupo, {dias} AS dias FROM entregas_completadas WHERE {where}) d
+                WHERE grupo IS NOT NULL
+            ) t
+            GROUP BY grupo
+        """
+    return sql, params
+
+
+def sql_tiempos_entrega(agrupar_por, rango, motor="postgresql"):
+    _validar_analisis(agrupar_por)
+    sql, params = _sql_percentiles_entrega(agrupar_por, rango, motor)
+    return sql + " ORDER BY entregas DESC, grupo", params
+
+
+def sql_tendencia_semanal(rango, motor="postgresql"):
+    # Semanas que empiezan el lunes, por fecha de archivo
+    if motor == "postgresql":
+        semana = "CAST(date_trunc('week', fecha_entrega) AS DATE)"
+    else:
+        semana = "date(fecha_entrega, '-' || ((CAST(strftime('%w', fecha_entrega) AS INTEGER) + 6) % 7) || ' days')"
+    sql, params = _sql_percentiles_entrega(semana, rango, motor)
+    return sql + " ORDER BY grupo", params
+
+
+def antiguedad(agrupar_por):
+    hoy = pd.Timestamp.today().date()
+    sql, params = sql_antiguedad(agrupar_por, hoy, dialecto())
+    return leer_sql(sql, ["pendientes"], params, f"antiguedad_{agrupar_por}")
+
+
+def tiempos_entrega(agrupar_por, rango):
+    sql, params = sql_tiempos_entrega(agrupar_por, rango, dialecto())
+    return leer_sql(sql, ["entregas_completadas"], params, f"tiempos_entrega_{agrupar_por}")
+
+
+def tendencia_semanal(rango):
+    sql, params = sql_tendencia_semanal(rango, dialecto())
+    return leer_sql(sql, ["entregas_completadas"], params, "tendencia_semanal")
+
+
+# --- Plan de compras (vista "Qué comprar") ---
+# Demanda pendiente de todas las empresas por proveedor/producto/sku, separando lo
+# que ya tiene orden de compra de lo que falta comprar, en una sola agregación.
+def sql_plan_compras():
+    con_oc = "COALESCE(TRIM(orden_compra), '') <> ''"
+    return f"""
+        SELECT COALESCE(NULLIF(TRIM(proveedor), ''), 'Sin proveedor') AS proveedor,
+               producto, sku,
+               SUM(cantidad) AS demanda,
+               SUM(CASE WHEN {con_oc} THEN cantidad ELSE 0 END) AS cubierta,
+               SUM(CASE WHEN {con_oc} THEN 0 ELSE cantidad END) AS a_comprar,
+               COUNT(DISTINCT empresa) AS empresas,
+               MIN(fecha_creacion) AS pendiente_desde
+        FROM pendientes
+        WHERE estado = 'Pendiente'
+        GROUP BY COALESCE(NULLIF(TRIM(proveedor), ''), 'Sin proveedor'), producto, sku
+        ORDER BY proveedor, producto, sku
+    """, {}
+
+
+def plan_compras():
+    sql, params = sql_plan_compras()
+    return leer_sql(sql, ["pendientes"], params, "plan_compras")
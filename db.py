@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine, text
+
+from metricas import medir, registrar
+
+
+# === CONFIGURACIÓN ===
+# Igual que en app.py: primero los Secrets de Streamlit Cloud, luego variables de entorno.
+# Fuera de Streamlit (scripts, CLI) puede no haber archivo de secrets, por eso el try.
+def obtener_config(nombre, defecto=None):
+    try:
+        valor = st.secrets.get(nombre)
+    except Exception:
+        valor = None
+    if valor is None:
+        valor = os.getenv(nombre, defecto)
+    return valor
+
+
+def obtener_config_int(nombre, defecto):
+    valor = obtener_config(nombre)
+    if valor in (None, ""):
+        return defecto
+    return int(valor)
+
+
+# === ENGINE COMPARTIDO ===
+# Un solo engine (y un solo pool de conexiones) por proceso de Streamlit.
+# Antes se creaba uno nuevo en cada rerun, abriendo conexiones TLS nuevas contra Neon.
+# Scripts como los benchmarks apuntan todo el proceso a otra base con usar_url()
+_url_forzada = None
+
+
+def usar_url(url):
+    global _url_forzada
+    _url_forzada = url
+
+
+def obtener_engine(db_url=None):
+    url = db_url or _url_forzada or obtener_config("NEON_DB_URL")
+    if not url:
+        raise RuntimeError("No se encontró NEON_DB_URL en los Secrets ni en las variables de entorno.")
+    return _crear_engine(url)
+
+
+@st.cache_resource(show_spinner=False)
+def _crear_engine(url):
+    opciones = {
+        # Descarta conexiones que Neon cerró por inactividad antes de usarlas
+        "pool_pre_ping": True,
+        # Neon corta conexiones ociosas, mejor reciclarlas antes
+        "pool_recycle": obtener_config_int("DB_POOL_RECYCLE", 300),
+    }
+
+    if url.startswith("sqlite"):
+        # SQLite local (pruebas): sin tamaño de pool ni statement_timeout
+        opciones["connect_args"] = {"check_same_thread": False}
+    else:
+        opciones["pool_size"] = obtener_config_int("DB_POOL_SIZE", 5)
+        opciones["max_overflow"] = obtener_config_int("DB_MAX_OVERFLOW", 5)
+        opciones["pool_timeout"] = obtener_config_int("DB_POOL_TIMEOUT", 30)
+        timeout_ms = obtener_config_int("DB_STATEMENT_TIMEOUT_MS", 15000)
+        opciones["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+
+    return create_engine(url, **opciones)
+
+
+# Con la réplica local activa (replica.py) las lecturas de leer_sql van a la copia
+# SQLite; las escrituras siguen usando obtener_engine() a través de replica.escribir()
+_url_lectura = None
+
+
+def usar_replica(url):
+    global _url_lectura
+    _url_lectura = url
+
+
+def obtener_engine_lectura():
+    return _crear_engine(_url_lectura) if _url_lectura else obtener_engine()
+
+
+def dialecto():
+    # "postgresql" en Neon, "sqlite" en la base local de pruebas o en la réplica
+    return obtener_engine_lectura().dialect.name
+
+
+# === CACHÉ DE LECTURAS ===
+# Cada tabla tiene un contador de versión compartido por todas las sesiones del proceso.
+# Las escrituras lo incrementan con invalidar(), y como la versión forma parte de la
+# clave de st.cache_data, la siguiente lectura de cualquier sesión vuelve a la base.
+# Los cambios hechos desde otros procesos o directamente en Neon los detecta
+# refresco.py; el TTL queda como respaldo si ese hilo no está corriendo.
+CACHE_TTL = obtener_config_int("CACHE_TTL", 60)
+
+
+@st.cache_resource(show_spinner=False)
+def _versiones_tablas():
+    return {"lock": threading.Lock(), "versiones": {}}
+
+
+def version_tablas(*tablas):
+    versiones = _versiones_tablas()["versiones"]
+    return tuple(versiones.get(t, 0) for t in tablas)
+
+
+def invalidar(*tablas):
+    estado = _versiones_tablas()
+    with estado["lock"]:
+        for t in tablas:
+            estado["versiones"][t] = estado["versiones"].get(t, 0) + 1
+
+
+# Tiempos de la última lectura que no estaba en caché (por hilo = por sesión).
+# Se miden dentro de la función cacheada pero se registran fuera, porque lo que
+# se dibuja dentro de una función st.cache_data se repetiría en cada acierto.
+_lectura = threading.local()
+
+
+# === CARGA TIPADA ===
+# Tipos compactos según el nombre de la columna: las de pocos valores repetidos como
+# categorías, cantidad como entero y las fechas ya parseadas.
+TIPOS_COLUMNAS = {
+    "empresa": "categoria",
+    "proveedor": "categoria",
+    "vendedor": "categoria",
+    "estado": "categoria",
+    "tipo_facturacion": "categoria",
+    "cantidad": "entero",
+    "fecha_creacion": "fecha",
+    "fecha_entrega": "fecha",
+    "fecha_nota_venta": "fecha",
+}
+
+# Filas que se traen del cursor por vez al armar las columnas
+FILAS_POR_BLOQUE = 5000
+
+# En resultados chicos (páginas, conteos, agregados) los tipos no ahorran memoria
+# y convertir cuesta más que la consulta misma: se dejan como vienen
+MIN_FILAS_TIPOS = 1000
+
+
+def _aplicar_tipos(df):
+    if len(df) < MIN_FILAS_TIPOS:
+        return df
+    for nombre in df.columns:
+        tipo = TIPOS_COLUMNAS.get(nombre)
+        if tipo == "categoria":
+            df[nombre] = df[nombre].astype("category")
+        elif tipo == "entero":
+            serie = pd.to_numeric(df[nombre])
+            df[nombre] = serie.astype("Int64") if serie.isna().any() else pd.to_numeric(serie, downcast="integer")
+        elif tipo == "fecha":
+            df[nombre] = pd.to_datetime(df[nombre], errors="coerce", format="ISO8601")
+    return df
+
+
+def _armar_dataframe(resultado):
+    # Pasa las filas por bloques directo a listas por columna, sin tener toda la
+    # lista de Row y el DataFrame en memoria al mismo tiempo
+    columnas = list(resultado.keys())
+    datos = [[] for _ in columnas]
+    for bloque in resultado.partitions(FILAS_POR_BLOQUE):
+        for lista, valores in zip(datos, zip(*bloque)):
+            lista.extend(valores)
+    return columnas, datos
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _leer_sql_cacheado(sql, params, version):
+    etapas = []
+    inicio = time.perf_counter()
+    conn = obtener_engine_lectura().connect()
+    etapas.append(("conexion", time.perf_counter() - inicio, None, None))
+    with conn:
+        inicio = time.perf_counter()
+        resultado = conn.execute(text(sql), dict(params))
+        columnas, datos = _armar_dataframe(resultado)
+        n_filas = len(datos[0]) if datos else 0
+        etapas.append(("consulta", time.perf_counter() - inicio, n_filas, None))
+
+    inicio = time.perf_counter()
+    df = _aplicar_tipos(pd.DataFrame(dict(zip(columnas, datos)), columns=columnas))
+    del datos
+    bytes_df = int(df.memory_usage(deep=True).sum())
+    etapas.append(("dataframe", time.perf_counter() - inicio, len(df), bytes_df))
+    _lectura.etapas = etapas
+    return df
+
+
+def limpiar_cache():
+    # Descarta todas las lecturas cacheadas del proceso
+    _leer_sql_cacheado.clear()
+
+
+def leer_sql(sql, tablas, params=None, detalle=""):
+    # tablas: las tablas que lee la consulta, para invalidarla cuando cambien.
+    # detalle: nombre corto de la consulta para las métricas.
+    params = tuple(sorted((params or {}).items()))
+    _lectura.etapas = None
+    with medir("leer_sql", detalle) as m:
+        df = _leer_sql_cacheado(sql, params, version_tablas(*tablas))
+        m["filas"] = len(df)
+    if _lectura.etapas is not None:
+        for etapa, segundos, filas, bytes_df in _lectura.etapas:
+            registrar(etapa, detalle, segundos * 1000, filas, bytes_df)
+    return df
@@ -0,0 +1,85 @@
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from db import obtener_engine, invalidar
+from operaciones import CLAVE_LINEA, CONDICION_LINEA, clave_linea, fusionar_lineas
+
+
+# === LÍNEAS REPETIDAS EN PENDIENTES ===
+# La misma línea de una nota de venta cargada dos veces infla las cantidades de
+# "Qué comprar". Al insertar ya se suma a la existente (operaciones.insertar_pendientes);
+# esto limpia las que quedaron de antes o entraron a la vez desde dos sesiones.
+# Cada grupo se junta en el pendiente más antiguo, con la suma de las cantidades, y el
+# resto se borra (no pasa a entregas: nunca fueron otra entrega).
+
+
+def sql_lineas_repetidas():
+    # El GROUP BY recorre el índice ix_pendientes_linea (migración 8), no la tabla entera
+    clave = ", ".join(CLAVE_LINEA)
+    return f"""
+        SELECT id, empresa, n_nota_venta, sku, orden_compra, producto, cantidad, estado
+        FROM pendientes
+        WHERE {CONDICION_LINEA} AND ({clave}) IN (
+            SELECT {clave} FROM pendientes WHERE {CONDICION_LINEA}
+            GROUP BY {clave} HAVING COUNT(*) > 1
+        )
+        ORDER BY {clave}, id
+    """
+
+
+def lineas_repetidas(engine):
+    # Lista de grupos; cada grupo, las filas de una misma línea del pendiente más antiguo al más nuevo
+    with engine.connect() as conn:
+        filas = conn.execute(text(sql_lineas_repetidas())).mappings().all()
+    grupos = {}
+    for fila in filas:
+        grupos.setdefault(clave_linea(fila), []).append(dict(fila))
+    return [grupo for grupo in grupos.values() if len(grupo) > 1]
+
+
+def fusionar(engine, grupos):
+    # Todo en una transacción; devuelve cuántos pendientes se borraron
+    with engine.begin() as conn:
+        borrados = sum(fusionar_lineas(conn, [fila["id"] for fila in grupo]) for grupo in grupos)
+    invalidar("pendientes")
+    return borrados
+
+
+# === CLI ===
+# python duplicados.py              -> solo lista los grupos repetidos
+# python duplicados.py --fusionar   -> los junta
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encontrar y juntar líneas de nota de venta repetidas en pendientes")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--fusionar", action="store_true", help="Juntar cada grupo en su pendiente más antiguo")
+    args = parser.parse_args(argv)
+
+    engine = obtener_engine(args.url)
+    grupos = lineas_repetidas(engine)
+    if not grupos:
+        print("No hay líneas repetidas.")
+        return 0
+
+    for grupo in grupos:
+        primera = grupo[0]
+        print(f"{primera['empresa']} · NV {primera['n_nota_venta']} · SKU {primera['sku']} · {primera['producto']}")
+        for fila in grupo:
+            print(f"    id {fila['id']:>8}  cantidad {fila['cantidad']:>6}  OC {fila['orden_compra'] or '-'}")
+        print(f"    -> queda el id {primera['id']} con {sum(int(f['cantidad']) for f in grupo)} unidades")
+
+    sobrantes = sum(len(grupo) - 1 for grupo in grupos)
+    if not args.fusionar:
+        print(f"{len(grupos)} líneas repetidas, {sobrantes} pendientes de más. Usa --fusionar para juntarlas.")
+        return 0
+
+    borrados = fusionar(engine, grupos)
+    print(f"Se juntaron {len(grupos)} líneas; se borraron {borrados} pendientes.")
+    if borrados < sobrantes:
+        print("Algunos estaban bloqueados o cambiaron mientras tanto; vuelve a correrlo para revisarlos.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import argparse
+import csv
+import io
+import sys
+from contextlib import nullcontext
+
+import pandas as pd
+from sqlalchemy import text
+
+from consultas import COLUMNAS_LISTA, sql_buscar
+from db import obtener_engine
+from operaciones import COLUMNAS_ARCHIVO
+
+
+# === EXPORTACIÓN DE PENDIENTES Y ENTREGAS (CSV / XLSX / PARQUET) ===
+# Se lee con un cursor del lado del servidor (stream_results) y se escribe bloque a
+# bloque, así la memoria no depende del tamaño de la tabla. Los filtros son los
+# mismos de la búsqueda de cada vista (consultas.sql_buscar), sin LIMIT.
+
+COLUMNAS_EXPORTACION = {
+    "pendientes": COLUMNAS_LISTA,
+    "entregas_completadas": ["id"] + COLUMNAS_ARCHIVO + ["fecha_entrega"],
+}
+
+FORMATOS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FILAS_POR_BLOQUE = 5000
+
+# Límite de filas de una hoja de Excel (sin contar el encabezado)
+MAX_FILAS_XLSX = 1_048_575
+
+
+def _abrir(destino):
+    # destino: ruta o archivo binario ya abierto (que queda abierto al terminar)
+    return open(destino, "wb") if isinstance(destino, str) else nullcontext(destino)
+
+
+def _escribir_csv(destino, columnas, bloques):
+    # ";" y BOM para que Excel en español lo abra directo; importar.py lee ambos
+    filas = 0
+    with _abrir(destino) as archivo:
+        texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+        escritor = csv.writer(texto, delimiter=";")
+        escritor.writerow(columnas)
+        for bloque in bloques:
+            escritor.writerows(bloque)
+            filas += len(bloque)
+        texto.flush()
+        texto.detach()
+    return filas
+
+
+def _escribir_xlsx(destino, columnas, bloques):
+    from openpyxl import Workbook
+
+    # write_only va guardando las filas en un temporal en vez de tenerlas en memoria
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("datos")
+    hoja.append(columnas)
+    filas = 0
+    for bloque in bloques:
+        filas += len(bloque)
+        if filas > MAX_FILAS_XLSX:
+            raise ValueError(f"Más de {MAX_FILAS_XLSX} filas no caben en una hoja de Excel; usa CSV o Parquet.")
+        for fila in bloque:
+            hoja.append(list(fila))
+    libro.save(destino)
+    return filas
+
+
+def _tipo_arrow(pa, columna):
+    if columna.startswith("fecha_"):
+        return pa.timestamp("us")
+    if columna in ("id", "cantidad", "version"):
+        return pa.int64()
+    return pa.string()
+
+
+def _escribir_parquet(destino, columnas, bloques):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Esquema fijo: si un bloque trae solo nulos en una columna, el tipo no cambia
+    esquema = pa.schema([(c, _tipo_arrow(pa, c)) for c in columnas])
+    filas = 0
+    with _abrir(destino) as archivo, pq.ParquetWriter(archivo, esquema) as escritor:
+        for bloque in bloques:
+            df = pd.DataFrame(bloque, columns=columnas)
+            for c in columnas:
+                if c.startswith("fecha_"):
+                    # SQLite devuelve las fechas como texto
+                    df[c] = pd.to_datetime(df[c], errors="coerce", format="ISO8601")
+            escritor.write_table(pa.Table.from_pandas(df, schema=esquema, preserve_index=False))
+            filas += len(df)
+    return filas
+
+
+ESCRITORES = {
+    "csv": _escribir_csv,
+    "xlsx": _escribir_xlsx,
+    "parquet": _escribir_parquet,
+}
+
+
+def exportar(engine, tabla, destino, formato, tamano_bloque=FILAS_POR_BLOQUE, rango=None, vendedor=None, **terminos):
+    # terminos, rango y vendedor: los mismos filtros de consultas.buscar. Devuelve las filas escritas.
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato no soportado: {formato}")
+    sql, params = sql_buscar(tabla, terminos, None, engine.dialect.name, COLUMNAS_EXPORTACION[tabla], rango, vendedor)
+    with engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, yield_per=tamano_bloque).execute(text(sql), params)
+        return ESCRITORES[formato](destino, list(resultado.keys()), resultado.partitions(tamano_bloque))
+
+
+# === CLI ===
+# python exportar.py pendientes pendientes.xlsx
+# python exportar.py entregas_completadas entregas.parquet --proveedor acme
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportar pendientes o entregas a CSV, XLSX o Parquet")
+    parser.add_argument("tabla", choices=list(COLUMNAS_EXPORTACION))
+    parser.add_argument("archivo", help="Destino; el formato sale de la extensión")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--formato", choices=list(FORMATOS), help="Forzar el formato")
+    parser.add_argument("--bloque", type=int, default=FILAS_POR_BLOQUE, help="Filas por lectura del cursor")
+    parser.add_argument("--empresa", default="", help="Filtrar por empresa (contiene)")
+    parser.add_argument("--producto", default="", help="Filtrar por producto (contiene)")
+    parser.add_argument("--proveedor", default="", help="Filtrar por proveedor (contiene)")
+    args = parser.parse_args(argv)
+
+    formato = args.formato or args.archivo.rsplit(".", 1)[-1].lower()
+    if formato not in FORMATOS:
+        parser.error(f"No se reconoce el formato de '{args.archivo}'; usa --formato.")
+
+    terminos = {"empresa": args.empresa, "producto": args.producto, "proveedor": args.proveedor}
+    terminos = {c: v for c, v in terminos.items() if v}
+    filas = exportar(obtener_engine(args.url), args.tabla, args.archivo, formato, args.bloque, **terminos)
+    print(f"Exportadas {filas} filas a {args.archivo}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import pandas as pd
+import streamlit as st
+
+from db import CACHE_TTL, obtener_config_int
+
+
+# === GRÁFICOS DE BARRAS ACOTADOS ===
+# Con miles de productos, una barra por producto deja un JSON de varios MB y el
+# navegador se traba. Se grafican las GRAFICO_MAX_BARRAS categorías con más unidades
+# y el resto se suma en una sola barra "Otros"; la tabla de al lado sigue completa.
+#
+# La figura se cachea por filtros y versión de la tabla (db.version_tablas): si nada
+# cambió no se vuelve a armar, y como el JSON sale idéntico, Streamlit tampoco lo
+# reenvía al navegador (caché de mensajes del cliente, global.minCachedMessageSize).
+
+GRAFICO_MAX_BARRAS = obtener_config_int("GRAFICO_MAX_BARRAS", 25)
+
+ETIQUETA_OTROS = "Otros"
+
+
+def top_n(df, categoria, valor, n, color=None):
+    # Las n categorías con más valor, en ese orden; el resto suma en una fila
+    # "Otros (k)". Devuelve (tabla, orden de las categorías para el eje).
+    totales = df.groupby(categoria, sort=False, observed=True)[valor].sum().sort_values(ascending=False, kind="stable")
+    if len(totales) <= n:
+        return df, [str(c) for c in totales.index]
+    principales = totales.index[:n]
+    dentro = df[categoria].isin(principales)
+    etiqueta = f"{ETIQUETA_OTROS} ({len(totales) - n})"
+    otros = {categoria: etiqueta, valor: df.loc[~dentro, valor].sum()}
+    if color:
+        otros[color] = ETIQUETA_OTROS
+    columnas = [categoria, valor] + ([color] if color else [])
+    tabla = pd.concat([df.loc[dentro, columnas].astype({categoria: str}), pd.DataFrame([otros])], ignore_index=True)
+    return tabla, [str(c) for c in principales] + [etiqueta]
+
+
+def armar_barras(tabla, x, y, titulo, color=None, colores=None, etiquetas=None, max_barras=GRAFICO_MAX_BARRAS, fondo=None):
+    # Devuelve la figura como dict: sale de la caché sin revalidar el objeto Figure
+    import plotly.express as px
+
+    datos, orden = top_n(tabla, x, y, max_barras, color)
+    fig = px.bar(
+        datos,
+        x=x,
+        y=y,
+        color=color,
+        text=y,
+        title=titulo,
+        labels=etiquetas,
+        category_orders={x: orden},
+        color_discrete_sequence=colores,
+    )
+    if fondo:
+        fig.update_layout(**fondo)
+    return fig.to_dict()
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=200, show_spinner=False)
+def figura_barras(_tabla, clave, x, y, titulo, color=None, colores=None, etiquetas=None, max_barras=GRAFICO_MAX_BARRAS, fondo=None):
+    # _tabla no entra en la clave de la caché (el "_" la excluye del hash): clave
+    # tiene que identificarla, p. ej. (filtros, db.version_tablas("pendientes"))
+    return armar_barras(_tabla, x, y, titulo, color, colores, etiquetas, max_barras, fondo)
@@ -0,0 +1,204 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+from consultas import COLUMNAS_SELECCION, buscar
+from db import CACHE_TTL, invalidar, obtener_config, obtener_config_int, obtener_engine
+from exportar import exportar
+
+
+# === HISTORIAL FRÍO DE ENTREGAS (PARQUET POR MES) ===
+# entregas_completadas solo crece. Los meses anteriores a la ventana activa se
+# compactan en un Parquet por mes (HISTORICO_DIR/entregas_AAAA_MM.parquet) y se borran
+# de la base. La vista "Entregas Completadas" filtra por rango de fechas y solo abre
+# los archivos de los meses que caen dentro del rango pedido.
+#
+# Los archivos son la única copia de esos meses. HISTORICO_DIR tiene que ser una ruta
+# absoluta a un disco que sobreviva a los reinicios y redespliegues, y el mismo que lee
+# la app: sin él no se compacta (y la app no lee historial). Antes de borrar se
+# comprueba que el archivo escrito tenga todas las filas del mes.
+
+HISTORICO_DIR = obtener_config("HISTORICO_DIR")
+
+# Meses completos que quedan en la base al compactar (además del mes en curso)
+MESES_ACTIVOS = obtener_config_int("HISTORICO_MESES_ACTIVOS", 12)
+
+
+def ruta_mes(periodo, directorio=None):
+    return os.path.join(directorio or HISTORICO_DIR, f"entregas_{periodo.strftime('%Y_%m')}.parquet")
+
+
+def meses_compactados(directorio=None):
+    # {Period mensual: ruta} de los archivos existentes
+    directorio = directorio or HISTORICO_DIR
+    if not directorio or not os.path.isdir(directorio):
+        return {}
+    meses = {}
+    for nombre in os.listdir(directorio):
+        if nombre.startswith("entregas_") and nombre.endswith(".parquet"):
+            anio, mes = nombre[len("entregas_"):-len(".parquet")].split("_")
+            meses[pd.Period(f"{anio}-{mes}", freq="M")] = os.path.join(directorio, nombre)
+    return meses
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _leer_mes(ruta, modificado):
+    # modificado (mtime) es parte de la clave: si se vuelve a compactar el mes, se relee
+    return pd.read_parquet(ruta, columns=COLUMNAS_SELECCION["entregas_completadas"])
+
+
+def _filtrar_texto(df, terminos):
+    # Mismo criterio que el LIKE de consultas.buscar: contiene, sin distinguir mayúsculas
+    for columna, valor in terminos.items():
+        valor = (valor or "").strip()
+        if valor:
+            df = df[df[columna].fillna("").str.contains(valor, case=False, regex=False)]
+    return df
+
+
+def leer_historico(rango, limite, directorio=None, **terminos):
+    # Solo se abren los meses que se cruzan con [desde, hasta)
+    desde, hasta = (pd.Timestamp(f) for f in rango)
+    partes = []
+    for periodo, ruta in sorted(meses_compactados(directorio).items()):
+        if periodo.end_time < desde or periodo.start_time >= hasta:
+            continue
+        df = _leer_mes(ruta, os.path.getmtime(ruta))
+        df = df[(df["fecha_entrega"] >= desde) & (df["fecha_entrega"] < hasta)]
+        partes.append(_filtrar_texto(df, terminos))
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS_SELECCION["entregas_completadas"])
+    df = pd.concat(partes, ignore_index=True)
+    return df.sort_values(["fecha_entrega", "id"], ascending=False).head(limite)
+
+
+def buscar_entregas(rango, limite=200, directorio=None, **terminos):
+    # Base + meses compactados del rango. Un mes recién compactado puede estar en los
+    # dos lados si falló el borrado: se descartan los id repetidos.
+    df = buscar("entregas_completadas", limite, rango=rango, **terminos)
+    if len(df) >= limite:
+        # Los meses compactados son anteriores a todo lo que queda en la base: con la
+        # página llena, ninguna fila del historial entraría entre las más recientes
+        return df
+    historico = leer_historico(rango, limite, directorio, **terminos)
+    if historico.empty:
+        return df
+    df = df.assign(fecha_entrega=pd.to_datetime(df["fecha_entrega"], format="ISO8601"))
+    df = pd.concat([df, historico], ignore_index=True).drop_duplicates("id")
+    return df.sort_values(["fecha_entrega", "id"], ascending=False).head(limite)
+
+
+def directorio_compactacion(directorio=None):
+    # El directorio donde se puede compactar; RuntimeError si no está configurado a propósito
+    directorio = directorio or HISTORICO_DIR
+    if not directorio:
+        raise RuntimeError(
+            "Define HISTORICO_DIR (o --directorio) con una ruta absoluta en un disco persistente, "
+            "el mismo que lee la app: los meses compactados se borran de la base."
+        )
+    if not os.path.isabs(directorio):
+        raise RuntimeError(f"HISTORICO_DIR tiene que ser una ruta absoluta, no '{directorio}'.")
+    return directorio
+
+
+def _ids_archivo(ruta):
+    import pyarrow.parquet as pq
+
+    return set(pq.read_table(ruta, columns=["id"]).column("id").to_pylist())
+
+
+def compactar_mes(engine, periodo, directorio=None):
+    # Escribe el mes en Parquet (sumándolo al archivo si ya existía) y después lo
+    # borra de la base, solo si el archivo ya escrito tiene todas sus filas.
+    # Devuelve cuántas filas se movieron.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    destino = ruta_mes(periodo, directorio)
+    temporal = destino + ".tmp"
+    rango = (periodo.start_time.to_pydatetime(), (periodo + 1).start_time.to_pydatetime())
+    filas = exportar(engine, "entregas_completadas", temporal, "parquet", rango=rango)
+    if not filas:
+        os.remove(temporal)
+        return 0
+
+    if os.path.exists(destino):
+        # Filas que llegaron tarde al mes, o un reintento después de un borrado fallido
+        df = pd.concat([pd.read_parquet(destino), pd.read_parquet(temporal)], ignore_index=True)
+        df = df.drop_duplicates("id", keep="last")
+        pq.write_table(pa.Table.from_pandas(df, schema=pq.read_schema(temporal), preserve_index=False), temporal)
+    os.replace(temporal, destino)
+    escritos = _ids_archivo(destino)
+
+    with engine.begin() as conn:
+        ids = [f[0] for f in conn.execute(
+            text("SELECT id FROM entregas_completadas WHERE fecha_entrega >= :desde AND fecha_entrega < :hasta"),
+            {"desde": rango[0], "hasta": rango[1]}
+        )]
+        faltan = set(ids) - escritos
+        if faltan:
+            raise RuntimeError(f"{periodo}: faltan {len(faltan)} filas en {destino}; no se borró nada de la base.")
+        borradas = conn.execute(
+            text("DELETE FROM entregas_completadas WHERE fecha_entrega >= :desde AND fecha_entrega < :hasta"),
+            {"desde": rango[0], "hasta": rango[1]}
+        ).rowcount
+        if borradas != filas:
+            # Llegaron filas nuevas al mes mientras se escribía: no se borra nada y se
+            # reintenta en la próxima pasada (las filas repetidas se descartan al leer)
+            raise RuntimeError(f"{periodo}: se escribieron {filas} filas pero se iban a borrar {borradas}.")
+    invalidar("entregas_completadas")
+    return filas
+
+
+def compactar(engine, meses_activos=MESES_ACTIVOS, directorio=None):
+    # Compacta todos los meses completos anteriores a la ventana activa
+    directorio = directorio_compactacion(directorio)
+    os.makedirs(directorio, exist_ok=True)
+    limite = pd.Timestamp.today().to_period("M") - meses_activos
+    with engine.connect() as conn:
+        mas_antigua = conn.execute(
+            text("SELECT MIN(fecha_entrega) FROM entregas_completadas WHERE fecha_entrega < :limite"),
+            {"limite": limite.start_time.to_pydatetime()}
+        ).scalar()
+    if mas_antigua is None:
+        return {}
+
+    movidas = {}
+    periodo = pd.Timestamp(mas_antigua).to_period("M")
+    while periodo < limite:
+        filas = compactar_mes(engine, periodo, directorio)
+        if filas:
+            movidas[periodo] = filas
+        periodo += 1
+    return movidas
+
+
+# === CLI ===
+# python historico.py                        -> compacta lo anterior a HISTORICO_MESES_ACTIVOS
+# python historico.py --meses-activos 6 --directorio /datos/historico
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compactar entregas antiguas en Parquet por mes")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--meses-activos", type=int, default=MESES_ACTIVOS, help="Meses completos que quedan en la base")
+    parser.add_argument("--directorio", help="Ruta absoluta en disco persistente (por defecto HISTORICO_DIR)")
+    args = parser.parse_args(argv)
+
+    try:
+        directorio = directorio_compactacion(args.directorio)
+        movidas = compactar(obtener_engine(args.url), args.meses_activos, directorio)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for periodo, filas in movidas.items():
+        print(f"{periodo}: {filas} entregas -> {ruta_mes(periodo, directorio)}")
+    if not movidas:
+        print("No hay meses para compactar.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
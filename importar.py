@@ -0,0 +1,178 @@
+import argparse
+import math
+import sys
+from datetime import date, datetime
+
+import pandas as pd
+
+from db import obtener_engine, invalidar
+from operaciones import CAMPOS_PENDIENTE, TIPOS_FACTURACION, insertar_pendientes
+
+
+# === IMPORTACIÓN MASIVA DE PENDIENTES (CSV / XLSX) ===
+# Se valida cada fila con las mismas reglas del formulario "Agregar pendiente" y las
+# filas válidas se insertan por lotes en una sola transacción.
+
+# Encabezados aceptados además del nombre de la columna (los que muestra la app)
+ALIAS_COLUMNAS = {
+    "rut empresa": "rut_empresa",
+    "fecha nota venta": "fecha_nota_venta",
+    "fecha de entrega": "fecha_entrega",
+    "n° nota venta": "n_nota_venta",
+    "tipo de facturación": "tipo_facturacion",
+    "orden de compra": "orden_compra",
+    "motivo o comentario": "motivo",
+}
+
+OBLIGATORIOS = ["empresa", "producto", "cantidad"]
+
+# cantidad es INTEGER en la base: más que esto falla recién al insertar en Postgres
+CANTIDAD_MAX = 2_147_483_647
+
+
+def _normalizar_encabezado(nombre):
+    nombre = str(nombre).strip().lower()
+    return ALIAS_COLUMNAS.get(nombre, nombre).replace(" ", "_")
+
+
+def leer_archivo(archivo, nombre=None):
+    # archivo: ruta o archivo subido con st.file_uploader
+    nombre = (nombre or getattr(archivo, "name", None) or str(archivo)).lower()
+    if nombre.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(archivo, dtype=str)
+    else:
+        # sep=None detecta "," o ";" (Excel en español exporta con ";")
+        df = pd.read_csv(archivo, dtype=str, sep=None, engine="python", keep_default_na=False)
+    df.columns = [_normalizar_encabezado(c) for c in df.columns]
+    return df
+
+
+def _texto(valor):
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return ""
+    return str(valor).strip()
+
+
+def _fecha(valor, campo):
+    if isinstance(valor, (date, datetime)):
+        return pd.Timestamp(valor).date()
+    valor = _texto(valor)
+    if not valor:
+        return None
+    # Primero ISO (AAAA-MM-DD): así llegan las celdas de fecha de Excel leídas como texto
+    # ("2024-01-05 00:00:00"), y con dayfirst se invertirían día y mes. Si no, dd/mm/aaaa.
+    try:
+        return pd.to_datetime(valor, format="ISO8601").date()
+    except (ValueError, TypeError):
+        pass
+    try:
+        return pd.to_datetime(valor, dayfirst=True).date()
+    except (ValueError, TypeError):
+        raise ValueError(f"{campo}: fecha inválida '{valor}'")
+
+
+def _cantidad(valor):
+    valor = _texto(valor)
+    try:
+        numero = float(valor.replace(",", "."))
+    except ValueError:
+        raise ValueError(f"cantidad: '{valor}' no es un número")
+    # "inf" y "nan" también pasan por float()
+    if not math.isfinite(numero) or numero != int(numero) or numero < 1:
+        raise ValueError(f"cantidad: debe ser un entero mayor o igual a 1 ('{valor}')")
+    if numero > CANTIDAD_MAX:
+        raise ValueError(f"cantidad: no puede pasar de {CANTIDAD_MAX} ('{valor}')")
+    return int(numero)
+
+
+def _tipo_facturacion(valor):
+    valor = _texto(valor)
+    if not valor:
+        return TIPOS_FACTURACION[0]
+    for tipo in TIPOS_FACTURACION:
+        if valor.lower() == tipo.lower():
+            return tipo
+    raise ValueError(f"tipo_facturacion: '{valor}' no es uno de {TIPOS_FACTURACION}")
+
+
+def validar_fila(registro):
+    for campo in OBLIGATORIOS:
+        if not _texto(registro.get(campo)):
+            raise ValueError(f"{campo}: es obligatorio")
+
+    fila = {c: _texto(registro.get(c)) for c in CAMPOS_PENDIENTE}
+    fila["fecha_nota_venta"] = _fecha(registro.get("fecha_nota_venta"), "fecha_nota_venta")
+    fila["fecha_entrega"] = _fecha(registro.get("fecha_entrega"), "fecha_entrega")
+    fila["cantidad"] = _cantidad(registro.get("cantidad"))
+    fila["tipo_facturacion"] = _tipo_facturacion(registro.get("tipo_facturacion"))
+    fila["estado"] = "Pendiente"
+    return fila
+
+
+def validar(df):
+    # Devuelve (filas válidas, DataFrame de errores con el número de fila del archivo)
+    faltan = [c for c in OBLIGATORIOS if c not in df.columns]
+    if faltan:
+        raise ValueError("Faltan columnas obligatorias: " + ", ".join(faltan))
+
+    filas, errores = [], []
+    for i, registro in enumerate(df.to_dict("records")):
+        try:
+            filas.append(validar_fila(registro))
+        except ValueError as e:
+            # +2: la fila 1 del archivo es el encabezado
+            errores.append({"fila": i + 2, "error": str(e)})
+    return filas, pd.DataFrame(errores, columns=["fila", "error"])
+
+
+def importar(engine, filas, tamano_lote=500):
+    # Todo o nada: si falla un lote se deshace la importación completa.
+    # Devuelve (creados, sumadas), como insertar_pendientes.
+    with engine.begin() as conn:
+        creados, sumadas = insertar_pendientes(conn, filas, tamano_lote)
+    invalidar("pendientes")
+    return creados, sumadas
+
+
+def describir_sumadas(filas, sumadas):
+    # Las filas que no crean un pendiente (de destinos_filas o insertar_pendientes) y a qué se suman
+    return pd.DataFrame(
+        [{
+            "empresa": filas[s["fila"]]["empresa"],
+            "n_nota_venta": filas[s["fila"]]["n_nota_venta"],
+            "sku": filas[s["fila"]]["sku"],
+            "cantidad": filas[s["fila"]]["cantidad"],
+            "se suma a": f"pendiente {s['id']}" if "id" in s else "otra fila del archivo",
+        } for s in sumadas],
+        columns=["empresa", "n_nota_venta", "sku", "cantidad", "se suma a"]
+    )
+
+
+# === CLI ===
+# python importar.py nota_venta.xlsx
+# python importar.py pendientes.csv --parcial   -> importa las filas válidas aunque haya errores
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importar pendientes desde CSV o XLSX")
+    parser.add_argument("archivo")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--lote", type=int, default=500, help="Filas por INSERT")
+    parser.add_argument("--parcial", action="store_true", help="Importar las filas válidas aunque otras tengan errores")
+    args = parser.parse_args(argv)
+
+    filas, errores = validar(leer_archivo(args.archivo))
+    for e in errores.itertuples():
+        print(f"Fila {e.fila}: {e.error}", file=sys.stderr)
+
+    if not errores.empty and not args.parcial:
+        print(f"{len(errores)} filas con errores; no se importó nada (usa --parcial para importar las válidas).", file=sys.stderr)
+        return 1
+
+    creados, sumadas = importar(obtener_engine(args.url), filas, args.lote)
+    for _, s in describir_sumadas(filas, sumadas).iterrows():
+        print(f"{s['empresa']} · NV {s['n_nota_venta']} · SKU {s['sku']}: {s['cantidad']} unidades sumadas a {s['se suma a']}")
+    print(f"Importadas {len(filas)} filas: {creados} pendientes nuevos y {len(sumadas)} sumadas a una línea ya cargada o repetida en el archivo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+# === MÉTRICAS DE RENDIMIENTO ===
+# medir() toma el tiempo de una etapa (conexión, consulta, armado del DataFrame,
+# transformaciones de pandas, gráficos, render) y lo deja en tres lugares:
+# - la lista de la sesión para el rerun actual (panel lateral)
+# - un log estructurado en JSON (logger "pendientes.metricas")
+# - acumulados del proceso en formato Prometheus (texto_prometheus)
+
+# Etapas que se miden dentro de una lectura no cacheada (ver db.leer_sql)
+ETAPAS_INTERNAS = ("conexion", "consulta", "dataframe")
+
+logger = logging.getLogger("pendientes.metricas")
+if os.getenv("LOG_METRICAS") == "1" and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+@st.cache_resource(show_spinner=False)
+def _acumulados():
+    # {(vista, etapa): {"n", "ms", "filas", "bytes"}} compartido por todas las sesiones
+    return {"lock": threading.Lock(), "series": {}}
+
+
+def _en_sesion():
+    return get_script_run_ctx() is not None
+
+
+def iniciar(vista):
+    # Al comienzo de cada rerun: vista actual y lista vacía de mediciones
+    if not _en_sesion():
+        return
+    st.session_state["_metricas_vista"] = vista
+    st.session_state["_metricas"] = []
+    st.session_state.pop("_metricas_panel", None)
+
+
+def mostrar_panel():
+    # El panel se redibuja después de cada medición, así también aparece en las
+    # vistas que terminan antes con st.stop()
+    with st.sidebar.expander("⏱️ Rendimiento", expanded=True):
+        st.session_state["_metricas_panel"] = st.empty()
+        st.download_button(
+            "Descargar métricas del proceso (Prometheus)",
+            texto_prometheus(),
+            file_name="metricas.prom",
+            mime="text/plain"
+        )
+    _dibujar_panel()
+
+
+def _dibujar_panel():
+    panel = st.session_state.get("_metricas_panel")
+    if panel is None:
+        return
+    mediciones = st.session_state.get("_metricas", [])
+    with panel.container():
+        if not mediciones:
+            st.caption("Sin mediciones en este rerun.")
+            return
+        # conexion/consulta/dataframe ya están contadas dentro de leer_sql
+        total = sum(m["ms"] for m in mediciones if m["etapa"] not in ETAPAS_INTERNAS)
+        st.caption(f"Total medido: {total:.1f} ms")
+        st.dataframe(
+            [{k: m[k] for k in ("etapa", "detalle", "ms", "filas", "bytes")} for m in mediciones],
+            hide_index=True
+        )
+
+
+@contextmanager
+def medir(etapa, detalle=""):
+    # Uso: with medir("consulta", "pagina") as m: ...; m["filas"] = len(filas)
+    datos = {"filas": None, "bytes": None}
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        registrar(etapa, detalle, ms, datos["filas"], datos["bytes"])
+
+
+def registrar(etapa, detalle, ms, filas, bytes_):
+    vista = st.session_state.get("_metricas_vista", "") if _en_sesion() else ""
+    medicion = {
+        "vista": vista,
+        "etapa": etapa,
+        "detalle": detalle,
+        "ms": round(ms, 2),
+        "filas": filas,
+        "bytes": bytes_,
+    }
+
+    logger.info(json.dumps(medicion, ensure_ascii=False))
+
+    acumulados = _acumulados()
+    with acumulados["lock"]:
+        serie = acumulados["series"].setdefault((vista, etapa), {"n": 0, "ms": 0.0, "filas": 0, "bytes": 0})
+        serie["n"] += 1
+        serie["ms"] += ms
+        serie["filas"] += filas or 0
+        serie["bytes"] += bytes_ or 0
+
+    if _en_sesion():
+        st.session_state.setdefault("_metricas", []).append(medicion)
+        _dibujar_panel()
+
+
+def texto_prometheus():
+    # Formato de exposición de Prometheus con los acumulados del proceso
+    lineas = [
+        "# TYPE pendientes_etapa_segundos_total counter",
+        "# TYPE pendientes_etapa_total counter",
+        "# TYPE pendientes_etapa_filas_total counter",
+        "# TYPE pendientes_etapa_bytes_total counter",
+    ]
+    acumulados = _acumulados()
+    with acumulados["lock"]:
+        series = dict(acumulados["series"])
+    for (vista, etapa), serie in sorted(series.items()):
+        etiquetas = f'vista="{vista}",etapa="{etapa}"'
+        lineas.append(f"pendientes_etapa_segundos_total{{{etiquetas}}} {serie['ms'] / 1000:.6f}")
+        lineas.append(f"pendientes_etapa_total{{{etiquetas}}} {serie['n']}")
+        lineas.append(f"pendientes_etapa_filas_total{{{etiquetas}}} {serie['filas']}")
+        lineas.append(f"pendientes_etapa_bytes_total{{{etiquetas}}} {serie['bytes']}")
+    return "\n".join(lineas) + "\n"
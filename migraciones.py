@@ -0,0 +1,429 @@
+import argparse
+
+from sqlalchemy import text
+
+from db import obtener_engine
+
+
+# === MIGRACIONES DE ESQUEMA ===
+# Cada migración es (versión, descripción, {dialecto: [sentencias]}).
+# Se aplican en orden, cada una en su propia transacción, y quedan registradas en
+# schema_migraciones. Nunca modificar una migración ya aplicada: agregar una nueva.
+# "postgresql" es Neon; "sqlite" es la base local que se usa para pruebas.
+
+_TABLAS_POSTGRES = [
+    """
+    CREATE TABLE IF NOT EXISTS pendientes (
+        id SERIAL PRIMARY KEY,
+        empresa TEXT,
+        rut_empresa TEXT,
+        fecha_nota_venta DATE,
+        fecha_entrega DATE,
+        n_nota_venta TEXT,
+        tipo_facturacion TEXT,
+        orden_compra TEXT,
+        producto TEXT,
+        cantidad INTEGER NOT NULL DEFAULT 1,
+        proveedor TEXT,
+        estado TEXT NOT NULL DEFAULT 'Pendiente',
+        motivo TEXT,
+        vendedor TEXT,
+        sku TEXT,
+        fecha_creacion TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entregas_completadas (
+        id SERIAL PRIMARY KEY,
+        empresa TEXT,
+        rut_empresa TEXT,
+        producto TEXT,
+        sku TEXT,
+        cantidad INTEGER,
+        proveedor TEXT,
+        tipo_facturacion TEXT,
+        orden_compra TEXT,
+        fecha_nota_venta DATE,
+        n_nota_venta TEXT,
+        estado TEXT,
+        motivo TEXT,
+        vendedor TEXT,
+        fecha_creacion TIMESTAMP,
+        fecha_entrega TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+_TABLAS_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS pendientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        empresa TEXT,
+        rut_empresa TEXT,
+        fecha_nota_venta DATE,
+        fecha_entrega DATE,
+        n_nota_venta TEXT,
+        tipo_facturacion TEXT,
+        orden_compra TEXT,
+        producto TEXT,
+        cantidad INTEGER NOT NULL DEFAULT 1,
+        proveedor TEXT,
+        estado TEXT NOT NULL DEFAULT 'Pendiente',
+        motivo TEXT,
+        vendedor TEXT,
+        sku TEXT,
+        fecha_creacion TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entregas_completadas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        empresa TEXT,
+        rut_empresa TEXT,
+        producto TEXT,
+        sku TEXT,
+        cantidad INTEGER,
+        proveedor TEXT,
+        tipo_facturacion TEXT,
+        orden_compra TEXT,
+        fecha_nota_venta DATE,
+        n_nota_venta TEXT,
+        estado TEXT,
+        motivo TEXT,
+        vendedor TEXT,
+        fecha_creacion TIMESTAMP,
+        fecha_entrega TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Índices btree comunes a ambos motores:
+# - (fecha_creacion, id) para el ORDER BY y la paginación keyset de la lista
+# - parcial sobre estado = 'Pendiente' para el conteo de atrasados
+# - empresa / proveedor para los filtros y GROUP BY de Dashboard y "Qué comprar"
+# - fecha_entrega para el historial de entregas
+_INDICES = [
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_fecha_creacion_id ON pendientes (fecha_creacion DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_pendiente_fecha ON pendientes (fecha_creacion) WHERE estado = 'Pendiente'",
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_empresa ON pendientes (empresa)",
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_proveedor ON pendientes (proveedor)",
+    "CREATE INDEX IF NOT EXISTS ix_entregas_fecha_entrega ON entregas_completadas (fecha_entrega DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_entregas_empresa ON entregas_completadas (empresa)",
+    "CREATE INDEX IF NOT EXISTS ix_entregas_proveedor ON entregas_completadas (proveedor)",
+]
+
+# Trigramas para las búsquedas ILIKE '%texto%' (solo Postgres)
+_INDICES_TRIGRAMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_empresa_trgm ON pendientes USING gin (empresa gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_producto_trgm ON pendientes USING gin (producto gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_entregas_empresa_trgm ON entregas_completadas USING gin (empresa gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_entregas_proveedor_trgm ON entregas_completadas USING gin (proveedor gin_trgm_ops)",
+]
+
+# Resumen de cantidades por empresa/proveedor/producto/sku, mantenido por triggers en
+# cada INSERT, UPDATE y DELETE (incluido el archivado) de pendientes. El Dashboard y
+# "Qué comprar" agregan sobre esta tabla, que crece con el catálogo y no con las filas.
+_CLAVE_RESUMEN = "empresa, proveedor, producto, sku"
+
+_RESUMEN_POSTGRES = [
+    """
+    CREATE TABLE IF NOT EXISTS resumen_pendientes (
+        empresa TEXT,
+        proveedor TEXT,
+        producto TEXT,
+        sku TEXT,
+        cantidad BIGINT NOT NULL DEFAULT 0,
+        filas INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    # NULLS NOT DISTINCT (Postgres 15+) para que ON CONFLICT también agrupe claves nulas
+    f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_resumen_pendientes_clave
+    ON resumen_pendientes ({_CLAVE_RESUMEN}) NULLS NOT DISTINCT
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_resumen_pendientes_vacios ON resumen_pendientes (filas) WHERE filas <= 0",
+    """
+    CREATE OR REPLACE FUNCTION resumen_pendientes_actualizar() RETURNS trigger AS $$
+    BEGIN
+        -- Restar la fila vieja y sumar la nueva con el mismo upsert, para que la
+        -- búsqueda de la clave siempre use el índice único (también con NULL)
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO resumen_pendientes (empresa, proveedor, producto, sku, cantidad, filas)
+            VALUES (OLD.empresa, OLD.proveedor, OLD.producto, OLD.sku, -OLD.cantidad, -1)
+            ON CONFLICT (empresa, proveedor, producto, sku) DO UPDATE
+            SET cantidad = resumen_pendientes.cantidad + EXCLUDED.cantidad,
+                filas = resumen_pendientes.filas + EXCLUDED.filas;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO resumen_pendientes (empresa, proveedor, producto, sku, cantidad, filas)
+            VALUES (NEW.empresa, NEW.proveedor, NEW.producto, NEW.sku, NEW.cantidad, 1)
+            ON CONFLICT (empresa, proveedor, producto, sku) DO UPDATE
+            SET cantidad = resumen_pendientes.cantidad + EXCLUDED.cantidad,
+                filas = resumen_pendientes.filas + EXCLUDED.filas;
+        END IF;
+        -- Grupos que quedaron vacíos (el índice parcial hace esto barato)
+        DELETE FROM resumen_pendientes WHERE filas <= 0;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tr_resumen_pendientes ON pendientes",
+    """
+    CREATE TRIGGER tr_resumen_pendientes
+    AFTER INSERT OR DELETE OR UPDATE OF empresa, proveedor, producto, sku, cantidad ON pendientes
+    FOR EACH ROW EXECUTE FUNCTION resumen_pendientes_actualizar()
+    """,
+    "DELETE FROM resumen_pendientes",
+    f"""
+    INSERT INTO resumen_pendientes ({_CLAVE_RESUMEN}, cantidad, filas)
+    SELECT {_CLAVE_RESUMEN}, SUM(cantidad), COUNT(*) FROM pendientes
+    GROUP BY {_CLAVE_RESUMEN}
+    """,
+]
+
+# En SQLite los NULL no chocan en índices únicos, así que los triggers buscan la
+# fila con IS y la crean si no existe.
+_SUMAR_RESUMEN_SQLITE = """
+    UPDATE resumen_pendientes
+    SET cantidad = cantidad + NEW.cantidad, filas = filas + 1
+    WHERE empresa IS NEW.empresa AND proveedor IS NEW.proveedor
+      AND producto IS NEW.producto AND sku IS NEW.sku;
+    INSERT INTO resumen_pendientes (empresa, proveedor, producto, sku, cantidad, filas)
+    SELECT NEW.empresa, NEW.proveedor, NEW.producto, NEW.sku, NEW.cantidad, 1
+    WHERE NOT EXISTS (
+        SELECT 1 FROM resumen_pendientes
+        WHERE empresa IS NEW.empresa AND proveedor IS NEW.proveedor
+          AND producto IS NEW.producto AND sku IS NEW.sku
+    );
+"""
+
+_RESTAR_RESUMEN_SQLITE = """
+    UPDATE resumen_pendientes
+    SET cantidad = cantidad - OLD.cantidad, filas = filas - 1
+    WHERE empresa IS OLD.empresa AND proveedor IS OLD.proveedor
+      AND producto IS OLD.producto AND sku IS OLD.sku;
+    DELETE FROM resumen_pendientes
+    WHERE filas <= 0 AND empresa IS OLD.empresa AND proveedor IS OLD.proveedor
+      AND producto IS OLD.producto AND sku IS OLD.sku;
+"""
+
+_RESUMEN_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS resumen_pendientes (
+        empresa TEXT,
+        proveedor TEXT,
+        producto TEXT,
+        sku TEXT,
+        cantidad INTEGER NOT NULL DEFAULT 0,
+        filas INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS ix_resumen_pendientes_clave ON resumen_pendientes ({_CLAVE_RESUMEN})",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tr_resumen_pendientes_insert AFTER INSERT ON pendientes
+    BEGIN {_SUMAR_RESUMEN_SQLITE} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tr_resumen_pendientes_delete AFTER DELETE ON pendientes
+    BEGIN {_RESTAR_RESUMEN_SQLITE} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tr_resumen_pendientes_update
+    AFTER UPDATE OF empresa, proveedor, producto, sku, cantidad ON pendientes
+    BEGIN {_RESTAR_RESUMEN_SQLITE} {_SUMAR_RESUMEN_SQLITE} END
+    """,
+    "DELETE FROM resumen_pendientes",
+    f"""
+    INSERT INTO resumen_pendientes ({_CLAVE_RESUMEN}, cantidad, filas)
+    SELECT {_CLAVE_RESUMEN}, SUM(cantidad), COUNT(*) FROM pendientes
+    GROUP BY {_CLAVE_RESUMEN}
+    """,
+]
+
+# Versión de cada pendiente para la edición con compare-and-swap (operaciones.py)
+_VERSION_PENDIENTES = [
+    "ALTER TABLE pendientes ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+]
+
+# Avisos de cambios para el refresco en segundo plano (refresco.py).
+# Postgres: NOTIFY por sentencia, sin contador, para no hacer que todas las escrituras
+# esperen el lock de una misma fila. SQLite (que ya serializa las escrituras): una
+# tabla con un contador por tabla que el refresco consulta cada pocos segundos.
+_TABLAS_AVISADAS = ["pendientes", "entregas_completadas"]
+
+_CAMBIOS_POSTGRES = [
+    """
+    CREATE OR REPLACE FUNCTION cambios_tablas_notificar() RETURNS trigger AS $$
+    BEGIN
+        -- Se entrega al confirmar la transacción; avisos iguales se juntan en uno
+        PERFORM pg_notify('cambios_tablas', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+] + [
+    sentencia
+    for tabla in _TABLAS_AVISADAS
+    for sentencia in (
+        f"DROP TRIGGER IF EXISTS tr_cambios_{tabla} ON {tabla}",
+        f"""
+        CREATE TRIGGER tr_cambios_{tabla}
+        AFTER INSERT OR UPDATE OR DELETE ON {tabla}
+        FOR EACH STATEMENT EXECUTE FUNCTION cambios_tablas_notificar()
+        """,
+    )
+]
+
+_CAMBIOS_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS cambios_tablas (
+        tabla TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO cambios_tablas (tabla) VALUES " + ", ".join(f"('{t}')" for t in _TABLAS_AVISADAS),
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tr_cambios_{tabla}_{operacion.lower()} AFTER {operacion} ON {tabla}
+    BEGIN UPDATE cambios_tablas SET version = version + 1 WHERE tabla = '{tabla}'; END
+    """
+    for tabla in _TABLAS_AVISADAS
+    for operacion in ("INSERT", "UPDATE", "DELETE")
+]
+
+# Cuentas de usuario (usuarios.py): contraseña con bcrypt, rol y el nombre con el que
+# aparece como vendedor. El índice sirve a las vistas filtradas por vendedor.
+_USUARIOS = [
+    """
+    CREATE TABLE IF NOT EXISTS usuarios (
+        usuario TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        rol TEXT NOT NULL DEFAULT 'vendedor',
+        vendedor TEXT,
+        activo BOOLEAN NOT NULL DEFAULT TRUE,
+        creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_pendientes_vendedor_fecha ON pendientes (vendedor, fecha_creacion DESC, id DESC)",
+]
+
+# Busca líneas repetidas (operaciones.CLAVE_LINEA) al insertar y en duplicados.py.
+# Las expresiones y la condición tienen que ser idénticas a las de las consultas para
+# que el planner use el índice. No es UNIQUE: puede haber repetidos anteriores, y una
+# edición no debe fallar por dejar dos filas iguales; duplicados.py las junta.
+_LINEAS = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_pendientes_linea ON pendientes (
+        UPPER(TRIM(n_nota_venta)), UPPER(TRIM(sku)), LOWER(TRIM(empresa)),
+        UPPER(TRIM(COALESCE(orden_compra, '')))
+    ) WHERE estado = 'Pendiente' AND n_nota_venta <> '' AND sku <> ''
+    """,
+]
+
+MIGRACIONES = [
+    (1, "Tablas pendientes y entregas_completadas", {
+        "postgresql": _TABLAS_POSTGRES,
+        "sqlite": _TABLAS_SQLITE,
+    }),
+    (2, "Índices para orden, filtros y paginación", {
+        "postgresql": _INDICES,
+        "sqlite": _INDICES,
+    }),
+    (3, "Índices de trigramas para búsquedas", {
+        "postgresql": _INDICES_TRIGRAMA,
+        "sqlite": [],
+    }),
+    (4, "Tabla resumen_pendientes mantenida por triggers", {
+        "postgresql": _RESUMEN_POSTGRES,
+        "sqlite": _RESUMEN_SQLITE,
+    }),
+    (5, "Columna version en pendientes para edición concurrente", {
+        "postgresql": _VERSION_PENDIENTES,
+        "sqlite": _VERSION_PENDIENTES,
+    }),
+    (6, "Avisos de cambios en pendientes y entregas", {
+        "postgresql": _CAMBIOS_POSTGRES,
+        "sqlite": _CAMBIOS_SQLITE,
+    }),
+    (7, "Usuarios con contraseña bcrypt e índice por vendedor", {
+        "postgresql": _USUARIOS,
+        "sqlite": _USUARIOS,
+    }),
+    (8, "Índice para encontrar líneas de nota de venta repetidas", {
+        "postgresql": _LINEAS,
+        "sqlite": _LINEAS,
+    }),
+]
+
+
+def _crear_tabla_control(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def versiones_aplicadas(engine):
+    with engine.begin() as conn:
+        _crear_tabla_control(conn)
+        filas = conn.execute(text("SELECT version FROM schema_migraciones")).fetchall()
+    return {f[0] for f in filas}
+
+
+def aplicar_migraciones(engine, hasta=None):
+    dialecto = engine.dialect.name
+    aplicadas = versiones_aplicadas(engine)
+    nuevas = []
+
+    for version, descripcion, sentencias in MIGRACIONES:
+        if version in aplicadas or (hasta is not None and version > hasta):
+            continue
+        if dialecto not in sentencias:
+            raise RuntimeError(f"La migración {version} no soporta el motor '{dialecto}'.")
+
+        with engine.begin() as conn:
+            for sentencia in sentencias[dialecto]:
+                conn.execute(text(sentencia))
+            conn.execute(
+                text("INSERT INTO schema_migraciones (version, descripcion) VALUES (:version, :descripcion)"),
+                {"version": version, "descripcion": descripcion}
+            )
+        nuevas.append(version)
+
+    return nuevas
+
+
+# === CLI ===
+# python migraciones.py                 -> aplica las pendientes sobre NEON_DB_URL
+# python migraciones.py --url sqlite:///local.db
+# python migraciones.py --estado        -> solo muestra qué versiones faltan
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migraciones de esquema del Sistema de Pendientes")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    parser.add_argument("--hasta", type=int, help="Aplicar solo hasta esta versión")
+    parser.add_argument("--estado", action="store_true", help="Mostrar el estado sin aplicar nada")
+    args = parser.parse_args(argv)
+
+    engine = obtener_engine(args.url)
+
+    if args.estado:
+        aplicadas = versiones_aplicadas(engine)
+        for version, descripcion, _ in MIGRACIONES:
+            marca = "x" if version in aplicadas else " "
+            print(f"[{marca}] {version:03d} {descripcion}")
+        return
+
+    nuevas = aplicar_migraciones(engine, args.hasta)
+    if nuevas:
+        print("Migraciones aplicadas: " + ", ".join(str(v) for v in nuevas))
+    else:
+        print("El esquema ya está al día.")
+
+
+if __name__ == "__main__":
+    main()
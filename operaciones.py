@@ -0,0 +1,260 @@
+import hashlib
+
+from sqlalchemy import bindparam, column, insert, table, text
+
+
+# === OPERACIONES DE ESCRITURA ===
+# Quien llama abre la transacción (engine.begin()) y después invalida la caché
+# con db.invalidar() para las tablas que cambiaron.
+#
+# Concurrencia: cada pendiente tiene una columna version (migración 5) que sube en
+# cada UPDATE. La edición individual solo escribe si la versión sigue siendo la que
+# leyó el usuario; las operaciones masivas bloquean sus filas con FOR UPDATE SKIP
+# LOCKED en Postgres y se saltan las que otra transacción está modificando.
+
+# Campos que se cargan al crear un pendiente (los mismos del formulario "Agregar pendiente")
+CAMPOS_PENDIENTE = [
+    "empresa", "rut_empresa", "fecha_nota_venta", "fecha_entrega", "n_nota_venta",
+    "tipo_facturacion", "orden_compra", "producto", "cantidad", "proveedor",
+    "estado", "motivo", "vendedor", "sku",
+]
+
+TIPOS_FACTURACION = ["Parcializada c/ constancia", "Completa"]
+
+_tabla_pendientes = table("pendientes", *[column(c) for c in CAMPOS_PENDIENTE])
+
+
+# --- Líneas repetidas ---
+# Una línea de nota de venta es empresa + N° de nota de venta + SKU + orden de compra,
+# sin contar mayúsculas ni los espacios de los extremos. Solo entre pendientes en estado Pendiente con nota
+# de venta y SKU: sin SKU, dos líneas de la misma nota pueden ser productos distintos, y
+# una línea con orden de compra ya está comprada y no se junta con una que no la tiene.
+# Son las expresiones del índice de la migración 8; si cambian aquí, el índice deja de usarse.
+# TRIM() solo quita espacios (no tabs ni saltos de línea), y clave_linea hace lo mismo.
+CLAVE_LINEA = [
+    "UPPER(TRIM(n_nota_venta))", "UPPER(TRIM(sku))", "LOWER(TRIM(empresa))",
+    "UPPER(TRIM(COALESCE(orden_compra, '')))",
+]
+CONDICION_LINEA = "estado = 'Pendiente' AND n_nota_venta <> '' AND sku <> ''"
+
+
+def clave_linea(fila):
+    # La misma clave calculada en Python; None si la fila no entra en la comparación
+    nota = (fila.get("n_nota_venta") or "").strip(" ").upper()
+    sku = (fila.get("sku") or "").strip(" ").upper()
+    if not nota or not sku or (fila.get("estado") or "Pendiente") != "Pendiente":
+        return None
+    return nota, sku, (fila.get("empresa") or "").strip(" ").lower(), (fila.get("orden_compra") or "").strip(" ").upper()
+
+
+def _bloquear_claves(conn, claves):
+    # En Postgres, un advisory lock por clave hasta el commit. FOR UPDATE no sirve para
+    # una línea que todavía no existe: dos importaciones a la vez la verían ausente y la
+    # insertarían las dos. Con el lock, la segunda espera a que la primera termine y ya
+    # la encuentra. Se toman en orden para que dos lotes no se esperen en cruz.
+    # En SQLite no hace falta: las escrituras ya van de una en una.
+    if conn.dialect.name != "postgresql" or not claves:
+        return
+    numeros = sorted({
+        int.from_bytes(hashlib.blake2b("\x1f".join(clave).encode(), digest_size=8).digest(), "big", signed=True)
+        for clave in claves
+    })
+    conn.execute(
+        text("SELECT pg_advisory_xact_lock(n) FROM (SELECT unnest(CAST(:numeros AS bigint[])) AS n ORDER BY n) AS c"),
+        {"numeros": numeros}
+    )
+
+
+def _lineas_existentes(conn, claves, bloquear):
+    # {clave: id del pendiente más antiguo con esa clave}. Con bloquear, en Postgres los
+    # bloquea hasta el commit para que nadie los archive entre esta lectura y la suma.
+    bloqueo = " FOR UPDATE" if bloquear and conn.dialect.name == "postgresql" else ""
+    filas = conn.execute(
+        text(f"""
+            SELECT id, n_nota_venta, sku, empresa, orden_compra, estado FROM pendientes
+            WHERE {CONDICION_LINEA}
+              AND UPPER(TRIM(n_nota_venta)) IN :notas AND UPPER(TRIM(sku)) IN :skus
+            ORDER BY id{bloqueo}
+        """).bindparams(bindparam("notas", expanding=True), bindparam("skus", expanding=True)),
+        {"notas": sorted({c[0] for c in claves}), "skus": sorted({c[1] for c in claves})}
+    ).mappings()
+    existentes = {}
+    for fila in filas:
+        existentes.setdefault(clave_linea(fila), fila["id"])
+    return existentes
+
+
+def destinos_filas(conn, filas, bloquear=False, tamano_lote=500):
+    # Qué hace cada fila al insertarse: None si crea un pendiente, {"id": ...} si suma su
+    # cantidad a ese pendiente existente, o {"fila_igual": j} si la suma a la fila j de filas
+    claves = [clave_linea(fila) for fila in filas]
+    con_clave = [c for c in claves if c]
+    if bloquear:
+        _bloquear_claves(conn, con_clave)
+    existentes = {}
+    for i in range(0, len(con_clave), tamano_lote):
+        existentes.update(_lineas_existentes(conn, con_clave[i:i + tamano_lote], bloquear))
+    destinos, primera = [], {}
+    for i, clave in enumerate(claves):
+        if clave in existentes:
+            destinos.append({"id": existentes[clave]})
+        elif clave in primera:
+            destinos.append({"fila_igual": primera[clave]})
+        else:
+            destinos.append(None)
+            if clave:
+                primera[clave] = i
+    return destinos
+
+
+def insertar_pendientes(conn, filas, tamano_lote=500):
+    # Inserta por lotes dentro de la transacción de conn. Con insert() de SQLAlchemy
+    # cada lote viaja como un INSERT multi-fila, no una ida a la base por fila.
+    # Una fila con la misma clave_linea que un pendiente existente, o que otra fila
+    # anterior, no crea otro: suma su cantidad a ese (ver destinos_filas).
+    # Devuelve (creados, sumadas): sumadas es [{"fila": i, **destino}] por cada fila sumada.
+    destinos = destinos_filas(conn, filas, bloquear=True, tamano_lote=tamano_lote)
+    nuevas, posicion, sumas, sumadas = [], {}, {}, []
+    for i, (fila, destino) in enumerate(zip(filas, destinos)):
+        if destino is None:
+            posicion[i] = len(nuevas)
+            nuevas.append(dict(fila))
+            continue
+        sumadas.append({"fila": i, **destino})
+        if "id" in destino:
+            sumas[destino["id"]] = sumas.get(destino["id"], 0) + int(fila["cantidad"])
+        else:
+            nueva = nuevas[posicion[destino["fila_igual"]]]
+            nueva["cantidad"] = int(nueva["cantidad"]) + int(fila["cantidad"])
+    if sumas:
+        conn.execute(
+            text("UPDATE pendientes SET cantidad = cantidad + :cantidad, version = version + 1 WHERE id = :id"),
+            [{"id": id_, "cantidad": cantidad} for id_, cantidad in sumas.items()]
+        )
+    for i in range(0, len(nuevas), tamano_lote):
+        conn.execute(insert(_tabla_pendientes), nuevas[i:i + tamano_lote])
+    return len(nuevas), sumadas
+
+
+# Columnas que se copian de pendientes a entregas_completadas al archivar
+# (fecha_entrega toma el valor por defecto: el momento en que se archiva)
+COLUMNAS_ARCHIVO = [
+    "empresa", "rut_empresa", "producto", "sku", "cantidad", "proveedor", "tipo_facturacion",
+    "orden_compra", "fecha_nota_venta", "n_nota_venta", "estado", "motivo", "vendedor", "fecha_creacion",
+]
+
+# Campos que se pueden modificar en bloque desde "Eliminar de pendientes"
+CAMPOS_EDICION_MASIVA = ["estado", "fecha_entrega", "orden_compra", "proveedor", "vendedor"]
+
+
+# Campos del formulario "Editar pendiente"
+CAMPOS_EDICION = [
+    "empresa", "rut_empresa", "fecha_nota_venta", "n_nota_venta", "tipo_facturacion",
+    "orden_compra", "producto", "sku", "cantidad", "proveedor", "estado", "motivo", "vendedor",
+]
+
+
+def _bloquear(conn, ids):
+    # Devuelve los ids que esta transacción pudo bloquear. En SQLite no hace falta:
+    # la primera escritura toma el lock de toda la base hasta el commit.
+    if conn.dialect.name != "postgresql":
+        return ids
+    filas = conn.execute(
+        text("SELECT id FROM pendientes WHERE id IN :ids FOR UPDATE SKIP LOCKED")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )
+    return [f[0] for f in filas]
+
+
+def editar_pendiente(conn, id_, version, valores):
+    # Compare-and-swap: 1 si se guardó, 0 si otro usuario lo cambió o archivó
+    # después de que se leyó la versión
+    for campo in valores:
+        if campo not in CAMPOS_EDICION:
+            raise ValueError(f"Campo no permitido: {campo}")
+    asignaciones = ", ".join(f"{campo} = :{campo}" for campo in valores)
+    resultado = conn.execute(
+        text(f"""
+            UPDATE pendientes SET {asignaciones}, version = version + 1
+            WHERE id = :id AND version = :version
+        """),
+        {**valores, "id": int(id_), "version": int(version)}
+    )
+    return resultado.rowcount
+
+
+def archivar_pendientes(conn, ids):
+    # Mueve los pendientes a entregas_completadas con un INSERT ... SELECT y un DELETE,
+    # sin importar cuántos ids sean. Las filas bloqueadas por otra transacción (que
+    # probablemente las está archivando) se saltan, así nunca se copian dos veces.
+    # Devuelve cuántos se archivaron.
+    ids = _bloquear(conn, [int(i) for i in ids])
+    if not ids:
+        return 0
+    columnas = ", ".join(COLUMNAS_ARCHIVO)
+    conn.execute(
+        text(f"""
+            INSERT INTO entregas_completadas ({columnas})
+            SELECT {columnas} FROM pendientes WHERE id IN :ids
+        """).bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )
+    resultado = conn.execute(
+        text("DELETE FROM pendientes WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    )
+    return resultado.rowcount
+
+
+def actualizar_pendientes(conn, ids, cambios):
+    # cambios: {campo: valor}, solo con campos de CAMPOS_EDICION_MASIVA
+    for campo in cambios:
+        if campo not in CAMPOS_EDICION_MASIVA:
+            raise ValueError(f"Campo no permitido: {campo}")
+    ids = _bloquear(conn, [int(i) for i in ids]) if cambios else []
+    if not ids:
+        return 0
+    asignaciones = ", ".join(f"{campo} = :{campo}" for campo in cambios)
+    resultado = conn.execute(
+        text(f"UPDATE pendientes SET {asignaciones}, version = version + 1 WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {**cambios, "ids": ids}
+    )
+    return resultado.rowcount
+
+
+def fusionar_lineas(conn, ids):
+    # Junta en el pendiente más antiguo los ids que, ya bloqueados, siguen siendo la misma
+    # línea (clave_linea): suma las cantidades y borra los demás. Las filas bloqueadas por
+    # otra transacción se saltan. Devuelve cuántos pendientes se borraron.
+    ids = _bloquear(conn, [int(i) for i in ids])
+    if len(ids) < 2:
+        return 0
+    filas = conn.execute(
+        text(f"""
+            SELECT id, n_nota_venta, sku, empresa, orden_compra, estado FROM pendientes
+            WHERE id IN :ids AND {CONDICION_LINEA} ORDER BY id
+        """).bindparams(bindparam("ids", expanding=True)),
+        {"ids": ids}
+    ).mappings()
+    grupos = {}
+    for fila in filas:
+        grupos.setdefault(clave_linea(fila), []).append(fila["id"])
+
+    borrados = 0
+    for conservado, *resto in grupos.values():
+        if not resto:
+            continue
+        conn.execute(
+            text("""
+                UPDATE pendientes SET version = version + 1,
+                    cantidad = (SELECT SUM(cantidad) FROM pendientes WHERE id IN :ids)
+                WHERE id = :id
+            """).bindparams(bindparam("ids", expanding=True)),
+            {"ids": [conservado] + resto, "id": conservado}
+        )
+        borrados += conn.execute(
+            text("DELETE FROM pendientes WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": resto}
+        ).rowcount
+    return borrados
@@ -0,0 +1,114 @@
+import logging
+import select
+import threading
+import time
+
+import streamlit as st
+from sqlalchemy import text
+
+from db import invalidar, obtener_config_int, obtener_engine, version_tablas
+
+
+# === REFRESCO EN SEGUNDO PLANO ===
+# Un hilo por proceso se entera de los cambios en la base (de cualquier proceso o
+# usuario) y llama a db.invalidar() para esas tablas. Las sesiones siguen leyendo de
+# la caché compartida de db.leer_sql: la base se vuelve a consultar una vez por
+# cambio y por consulta distinta, no una vez por usuario y clic.
+# - Postgres: LISTEN cambios_tablas (triggers de la migración 6)
+# - SQLite: sondeo de la tabla cambios_tablas cada REFRESCO_SEGUNDOS
+#
+# En las vistas, revisar_cambios() vuelve a dibujar la página cuando cambia alguna
+# de sus tablas, sin que el usuario tenga que hacer clic.
+
+TABLAS = ("pendientes", "entregas_completadas")
+CANAL = "cambios_tablas"
+
+# 0 desactiva el hilo y la revisión periódica de las vistas
+REFRESCO_SEGUNDOS = obtener_config_int("REFRESCO_SEGUNDOS", 5)
+
+# Espera máxima entre reintentos si se cae la conexión o falta la migración
+MAX_ESPERA_REINTENTO = 60
+
+logger = logging.getLogger("pendientes.refresco")
+
+
+@st.cache_resource(show_spinner=False)
+def iniciar_refresco(url):
+    # cache_resource: un solo hilo por proceso aunque haya muchas sesiones
+    engine = obtener_engine(url)
+    objetivo = _escuchar if engine.dialect.name == "postgresql" else _sondear
+    hilo = threading.Thread(target=_ciclo, args=(engine, objetivo), name="refresco-pendientes", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _ciclo(engine, objetivo):
+    espera = REFRESCO_SEGUNDOS
+    while True:
+        inicio = time.monotonic()
+        try:
+            objetivo(engine)
+        except Exception as e:
+            # Si se cortó enseguida es que falla al conectar: espera creciente para no llenar el log
+            if time.monotonic() - inicio > MAX_ESPERA_REINTENTO:
+                espera = REFRESCO_SEGUNDOS
+            else:
+                espera = min(espera * 2, MAX_ESPERA_REINTENTO)
+            logger.warning("Refresco interrumpido (%s); reintento en %s s", e, espera)
+            time.sleep(espera)
+
+
+def _escuchar(engine):
+    # Conexión propia, fuera del pool y sin statement_timeout, que queda escuchando.
+    # Neon: usar el endpoint directo, el pooler (-pooler) no soporta LISTEN.
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    conn = engine.dialect.connect(*cargs, **cparams)
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CANAL}")
+        # Lo que cambió mientras no se escuchaba (arranque o reconexión) no llegó como aviso
+        invalidar(*TABLAS)
+        while True:
+            if select.select([conn], [], [], REFRESCO_SEGUNDOS * 6)[0]:
+                conn.poll()
+                tablas = {aviso.payload for aviso in conn.notifies}
+                conn.notifies.clear()
+                if tablas:
+                    invalidar(*tablas)
+            else:
+                # Sin avisos: mantener viva la conexión (Neon corta las ociosas)
+                cursor.execute("SELECT 1")
+    finally:
+        conn.close()
+
+
+def _sondear(engine):
+    ultimas = None
+    while True:
+        with engine.connect() as conn:
+            versiones = dict(conn.execute(text("SELECT tabla, version FROM cambios_tablas")).fetchall())
+        if ultimas is None:
+            invalidar(*TABLAS)
+        else:
+            cambiadas = [t for t, v in versiones.items() if ultimas.get(t) != v]
+            if cambiadas:
+                invalidar(*cambiadas)
+        ultimas = versiones
+        time.sleep(REFRESCO_SEGUNDOS)
+
+
+def revisar_cambios(*tablas):
+    # Se llama en cada rerun completo de la vista: guarda la versión que se dibujó y
+    # deja un fragmento que cada REFRESCO_SEGUNDOS solo compara contadores en memoria
+    if not REFRESCO_SEGUNDOS:
+        return
+    clave = "_refresco_" + "_".join(tablas)
+    st.session_state[clave] = version_tablas(*tablas)
+    _vigilar(tablas, clave)
+
+
+@st.fragment(run_every=REFRESCO_SEGUNDOS or None)
+def _vigilar(tablas, clave):
+    if version_tablas(*tablas) != st.session_state.get(clave):
+        st.rerun()
@@ -0,0 +1,367 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import streamlit as st
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from consultas import COLUMNAS_SELECCION
+from db import invalidar, obtener_config, obtener_config_int, obtener_engine, usar_replica
+from migraciones import aplicar_migraciones
+from operaciones import COLUMNAS_ARCHIVO, actualizar_pendientes, archivar_pendientes, editar_pendiente, insertar_pendientes
+
+
+# === RÉPLICA LOCAL (SQLITE) ===
+# Opcional, con REPLICA_DB=ruta/replica.db. Copia local de pendientes y
+# entregas_completadas: las lecturas de leer_sql van a la copia (sin ida y vuelta a
+# Neon) y la app sigue funcionando mientras Neon despierta o no responde.
+# - Escrituras (escribir): se aplican en la copia y quedan en cola_escrituras. Un hilo
+#   las envía a Neon en orden, con las mismas funciones de operaciones.py. Si en Neon el
+#   pendiente cambió (otra versión) o ya se archivó, la operación queda como conflicto
+#   y se avisa en la barra lateral; lo que vale es lo de Neon.
+# - Traída, solo con la cola vacía: de entregas_completadas, que solo crece, los id
+#   nuevos; de pendientes, las filas cuyo (id, version) difiere, y solo si cambió la
+#   huella (cantidad, id máximo, suma de versiones).
+# - Lo creado en la copia lleva un id provisional (mayor que el último id traído de
+#   Neon) y se reemplaza por la fila de Neon al sincronizar.
+
+REPLICA_DB = obtener_config("REPLICA_DB", "")
+
+# Cada cuánto se sincroniza sin escrituras de por medio (con escrituras, enseguida)
+REPLICA_SEGUNDOS = obtener_config_int("REPLICA_SEGUNDOS", 30)
+
+TABLAS = ("pendientes", "entregas_completadas")
+
+COLUMNAS_REPLICA = {
+    "pendientes": COLUMNAS_SELECCION["pendientes"],
+    "entregas_completadas": ["id"] + COLUMNAS_ARCHIVO + ["fecha_entrega"],
+}
+
+OPERACIONES = {
+    "insertar": insertar_pendientes,
+    "archivar": archivar_pendientes,
+    "actualizar": actualizar_pendientes,
+    "editar": editar_pendiente,
+}
+
+# ids por consulta al traer filas de pendientes
+FILAS_POR_BLOQUE = 500
+
+# Entregas que se vuelven a pedir hacia atrás: en Postgres un id menor puede
+# confirmarse después que uno mayor
+MARGEN_IDS_ENTREGAS = 100
+
+MAX_ESPERA_REINTENTO = 300
+
+logger = logging.getLogger("pendientes.replica")
+
+_TABLAS_LOCALES = [
+    """
+    CREATE TABLE IF NOT EXISTS cola_escrituras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        operacion TEXT NOT NULL,
+        argumentos TEXT NOT NULL,
+        creada TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        estado TEXT NOT NULL DEFAULT 'pendiente',
+        detalle TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS replica_estado (
+        tabla TEXT PRIMARY KEY,
+        ultimo_id INTEGER NOT NULL,
+        sincronizada TIMESTAMP NOT NULL
+    )
+    """,
+]
+
+# Una escritura local no puede colarse entre que la traída revisa la cola y reemplaza filas
+_bloqueo = threading.Lock()
+
+
+def url_replica():
+    return "sqlite:///" + os.path.abspath(REPLICA_DB)
+
+
+@st.cache_resource(show_spinner=False)
+def _estado():
+    # activa: las lecturas ya van a la copia (después de la primera traída completa)
+    return {"evento": threading.Event(), "activa": False, "sincronizada": None, "error": None}
+
+
+def preparar(local):
+    # Mismo esquema que Neon (migraciones, con sus triggers) más las tablas de la réplica
+    aplicar_migraciones(local)
+    with local.connect() as conn:
+        # Lecturas de la app sin esperar a que termine una traída
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    with local.begin() as conn:
+        for sentencia in _TABLAS_LOCALES:
+            conn.execute(text(sentencia))
+
+
+def _ultimos_ids(conn):
+    return dict(conn.execute(text("SELECT tabla, ultimo_id FROM replica_estado")).fetchall())
+
+
+def _a_json(valor):
+    # Enteros de numpy y fechas de los formularios
+    return valor.item() if hasattr(valor, "item") else str(valor)
+
+
+def escribir(operacion, *argumentos):
+    # Mismos argumentos y resultado que la función de operaciones.py (sin conn).
+    # Sin réplica, o mientras se hace la primera copia, va directo a Neon.
+    if not REPLICA_DB or not _estado()["activa"]:
+        with obtener_engine().begin() as conn:
+            return OPERACIONES[operacion](conn, *argumentos)
+
+    with _bloqueo, obtener_engine(url_replica()).begin() as conn:
+        if operacion != "insertar":
+            ids = [argumentos[0]] if operacion == "editar" else argumentos[0]
+            ultimo = _ultimos_ids(conn).get("pendientes", 0)
+            if any(int(i) > ultimo for i in ids):
+                raise ValueError(
+                    "Ese pendiente se creó sin conexión y todavía no llega a la base central; "
+                    "espera a que se sincronice para modificarlo."
+                )
+        resultado = OPERACIONES[operacion](conn, *argumentos)
+        if resultado:
+            conn.execute(
+                text("INSERT INTO cola_escrituras (operacion, argumentos) VALUES (:operacion, :argumentos)"),
+                {"operacion": operacion, "argumentos": json.dumps(argumentos, default=_a_json)}
+            )
+    _estado()["evento"].set()
+    return resultado
+
+
+# --- Envío de la cola ---
+def _resultado_envio(operacion, argumentos, resultado):
+    if operacion == "insertar":
+        return "enviada", None
+    if operacion == "editar":
+        if resultado:
+            return "enviada", None
+        return "conflicto", f"El pendiente {argumentos[0]} cambió o ya se movió en la base central; no se guardó la edición."
+    pedidos = len(argumentos[0])
+    if resultado == pedidos:
+        return "enviada", None
+    return "conflicto", f"Se aplicó a {resultado} de {pedidos} pendientes; el resto cambió o ya no estaba en la base central."
+
+
+def _empujar(remoto, local):
+    with local.connect() as conn:
+        cola = conn.execute(text(
+            "SELECT id, operacion, argumentos FROM cola_escrituras WHERE estado = 'pendiente' ORDER BY id"
+        )).fetchall()
+    for id_, operacion, argumentos in cola:
+        argumentos = json.loads(argumentos)
+        try:
+            with remoto.begin() as conn:
+                resultado = OPERACIONES[operacion](conn, *argumentos)
+        except (OperationalError, InterfaceError):
+            # Sin conexión: esta y las siguientes quedan para el próximo intento
+            raise
+        except (DBAPIError, ValueError) as e:
+            estado, detalle = "error", str(e).splitlines()[0]
+        else:
+            estado, detalle = _resultado_envio(operacion, argumentos, resultado)
+
+        with _bloqueo, local.begin() as conn:
+            if estado == "enviada":
+                conn.execute(text("DELETE FROM cola_escrituras WHERE id = :id"), {"id": id_})
+                continue
+            logger.warning("Escritura %s (%s) no aplicada: %s", id_, operacion, detalle)
+            conn.execute(
+                text("UPDATE cola_escrituras SET estado = :estado, detalle = :detalle WHERE id = :id"),
+                {"estado": estado, "detalle": detalle, "id": id_}
+            )
+            if operacion != "insertar":
+                # La copia subió la versión igual que pudo hacerlo otro usuario en Neon:
+                # se descartan esas filas y la traída las vuelve a copiar tal como están allá
+                ids = [argumentos[0]] if operacion == "editar" else argumentos[0]
+                conn.execute(
+                    text("DELETE FROM pendientes WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                    {"ids": [int(i) for i in ids]}
+                )
+
+
+# --- Traída desde Neon ---
+def _huella_pendientes(conn):
+    return tuple(conn.execute(text(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(version), 0) FROM pendientes"
+    )).one())
+
+
+def _insertar_sql(tabla, ignorar=False):
+    columnas = COLUMNAS_REPLICA[tabla]
+    return text(
+        f"INSERT {'OR IGNORE ' if ignorar else ''}INTO {tabla} ({', '.join(columnas)}) "
+        f"VALUES ({', '.join(':' + c for c in columnas)})"
+    )
+
+
+def _fila_local(fila):
+    # Mismo formato que CURRENT_TIMESTAMP de SQLite; sin esto, las fechas de Postgres con
+    # microsegundos quedan mezcladas con las que no tienen y pandas no las lee juntas
+    return {c: v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v for c, v in fila.items()}
+
+
+def _por_bloques(ids):
+    for i in range(0, len(ids), FILAS_POR_BLOQUE):
+        yield ids[i:i + FILAS_POR_BLOQUE]
+
+
+def _traer(remoto, local):
+    # Devuelve las tablas que cambiaron en la copia, o None si mientras tanto llegó
+    # una escritura local a la cola (se reintenta después de enviarla)
+    with local.connect() as conn:
+        ultimos = _ultimos_ids(conn)
+        huella_local = _huella_pendientes(conn)
+        versiones_locales = None
+
+    # Una sola foto de Neon para las dos tablas: lo que se archiva mientras tanto no
+    # aparece en ambas ni en ninguna
+    nivel = "REPEATABLE READ" if remoto.dialect.name == "postgresql" else "SERIALIZABLE"
+    with remoto.connect().execution_options(isolation_level=nivel) as conn, conn.begin():
+        huella = _huella_pendientes(conn)
+        ultimo_pendientes = ultimos.get("pendientes", 0)
+        borrar, filas = [], []
+        if huella != huella_local or huella_local[1] > ultimo_pendientes:
+            remotas = dict(conn.execute(text("SELECT id, version FROM pendientes")).fetchall())
+            with local.connect() as conn_local:
+                versiones_locales = dict(conn_local.execute(text("SELECT id, version FROM pendientes")).fetchall())
+            # Las provisionales se borran siempre: su id puede coincidir con otra fila de Neon
+            borrar = [i for i, v in versiones_locales.items() if i > ultimo_pendientes or remotas.get(i) != v]
+            vigentes = {i: v for i, v in versiones_locales.items() if i <= ultimo_pendientes}
+            traer = [i for i, v in remotas.items() if vigentes.get(i) != v]
+            consulta = text(
+                f"SELECT {', '.join(COLUMNAS_REPLICA['pendientes'])} FROM pendientes WHERE id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True))
+            for bloque in _por_bloques(traer):
+                filas.extend(_fila_local(f._mapping) for f in conn.execute(consulta, {"ids": bloque}))
+
+        ultimo_entregas = ultimos.get("entregas_completadas", 0)
+        max_entregas = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM entregas_completadas")).scalar()
+
+        with _bloqueo, local.begin() as conn_local:
+            if conn_local.execute(text("SELECT COUNT(*) FROM cola_escrituras WHERE estado = 'pendiente'")).scalar():
+                return None
+            if versiones_locales is not None and _huella_pendientes(conn_local) != huella_local:
+                return None
+
+            cambiadas = []
+            if borrar or filas:
+                for bloque in _por_bloques(borrar):
+                    conn_local.execute(
+                        text("DELETE FROM pendientes WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                        {"ids": bloque}
+                    )
+                if filas:
+                    conn_local.execute(_insertar_sql("pendientes"), filas)
+                cambiadas.append("pendientes")
+
+            max_local = conn_local.execute(text("SELECT COALESCE(MAX(id), 0) FROM entregas_completadas")).scalar()
+            if max_entregas > ultimo_entregas or max_local > ultimo_entregas:
+                conn_local.execute(text("DELETE FROM entregas_completadas WHERE id > :ultimo"), {"ultimo": ultimo_entregas})
+                resultado = conn.execution_options(stream_results=True, yield_per=FILAS_POR_BLOQUE).execute(
+                    text(
+                        f"SELECT {', '.join(COLUMNAS_REPLICA['entregas_completadas'])} FROM entregas_completadas "
+                        "WHERE id > :desde ORDER BY id"
+                    ),
+                    {"desde": max(0, ultimo_entregas - MARGEN_IDS_ENTREGAS)}
+                )
+                for bloque in resultado.mappings().partitions(FILAS_POR_BLOQUE):
+                    conn_local.execute(_insertar_sql("entregas_completadas", ignorar=True), [_fila_local(f) for f in bloque])
+                cambiadas.append("entregas_completadas")
+
+            ahora = time.strftime("%Y-%m-%d %H:%M:%S")
+            for tabla, ultimo in (("pendientes", huella[1]), ("entregas_completadas", max_entregas)):
+                conn_local.execute(
+                    text("INSERT OR REPLACE INTO replica_estado (tabla, ultimo_id, sincronizada) VALUES (:tabla, :ultimo, :ahora)"),
+                    {"tabla": tabla, "ultimo": ultimo, "ahora": ahora}
+                )
+    return cambiadas
+
+
+def sincronizar(remoto, local):
+    _empujar(remoto, local)
+    return _traer(remoto, local)
+
+
+# === HILO DE SINCRONIZACIÓN ===
+@st.cache_resource(show_spinner=False)
+def iniciar_replica(url):
+    # cache_resource: una copia y un hilo por proceso
+    local = obtener_engine(url_replica())
+    preparar(local)
+    estado = _estado()
+    with local.connect() as conn:
+        if _ultimos_ids(conn):
+            # Ya hubo una copia completa: se lee de ella desde el arranque, aunque Neon no responda
+            usar_replica(url_replica())
+            estado["activa"] = True
+    hilo = threading.Thread(target=_ciclo, args=(obtener_engine(url), local), name="replica-pendientes", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _ciclo(remoto, local):
+    estado = _estado()
+    espera = REPLICA_SEGUNDOS
+    while True:
+        try:
+            cambiadas = sincronizar(remoto, local)
+        except Exception as e:
+            estado["error"] = str(e).splitlines()[0]
+            espera = min(max(espera, REPLICA_SEGUNDOS) * 2, MAX_ESPERA_REINTENTO)
+            logger.warning("Sincronización fallida (%s); reintento en %s s", estado["error"], espera)
+        else:
+            estado["error"] = None
+            espera = REPLICA_SEGUNDOS
+            if cambiadas is None:
+                # Llegó una escritura durante la traída: se envía y se vuelve a traer
+                espera = 0
+            else:
+                estado["sincronizada"] = time.time()
+                if not estado["activa"]:
+                    usar_replica(url_replica())
+                    estado["activa"] = True
+                    invalidar(*TABLAS)
+                elif cambiadas:
+                    invalidar(*cambiadas)
+        estado["evento"].wait(espera)
+        estado["evento"].clear()
+
+
+# === ESTADO EN LA BARRA LATERAL ===
+def mostrar_estado():
+    estado = _estado()
+    with obtener_engine(url_replica()).connect() as conn:
+        cola = conn.execute(text(
+            "SELECT id, operacion, creada, estado, detalle FROM cola_escrituras ORDER BY id"
+        )).fetchall()
+    por_enviar = sum(1 for f in cola if f.estado == "pendiente")
+    avisos = [f for f in cola if f.estado != "pendiente"]
+
+    if not estado["activa"]:
+        st.sidebar.caption("🔄 Preparando la copia local; mientras tanto se lee de la base central.")
+    elif estado["error"]:
+        st.sidebar.warning(f"📴 Sin conexión con la base central. Cambios por enviar: {por_enviar}.")
+    else:
+        hace = int(time.time() - estado["sincronizada"]) if estado["sincronizada"] else None
+        texto = "🔄 Copia local" + (f" sincronizada hace {hace} s" if hace is not None else "")
+        st.sidebar.caption(texto + (f" · {por_enviar} cambios por enviar" if por_enviar else ""))
+
+    if avisos:
+        with st.sidebar.expander(f"⚠️ {len(avisos)} cambios no se aplicaron en la base central"):
+            for aviso in avisos:
+                st.caption(f"{aviso.creada} · {aviso.operacion}: {aviso.detalle}")
+            if st.button("Descartar avisos"):
+                with obtener_engine(url_replica()).begin() as conn:
+                    conn.execute(text("DELETE FROM cola_escrituras WHERE estado <> 'pendiente'"))
+                st.rerun()
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import obtener_engine, usar_url  # noqa: E402
+from migraciones import aplicar_migraciones  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    # SQLite vacía con todas las migraciones, y la API con token y escrituras habilitadas
+    url = f"sqlite:///{tmp_path / 'pendientes.db'}"
+    # La caché de lecturas no distingue bases: lo leído en otra prueba no debe servir aquí
+    st.cache_data.clear()
+    usar_url(url)
+    aplicar_migraciones(obtener_engine(url))
+    monkeypatch.setenv("API_TOKEN", "secreto")
+    monkeypatch.setenv("API_ESCRITURA", "1")
+    yield url
+    usar_url(None)
+
+
+def pedir(app, metodo, ruta, cuerpo=None):
+    # Una petición directa a la app ASGI, sin servidor: (estado, JSON de la respuesta)
+    ruta, _, query = ruta.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": metodo, "scheme": "http", "path": ruta, "raw_path": ruta.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"authorization", b"Bearer secreto"), (b"content-type", b"application/json")],
+        "server": ("prueba", 80), "client": ("127.0.0.1", 1),
+    }
+    datos = b"" if cuerpo is None else json.dumps(cuerpo).encode()
+    mensajes = []
+
+    async def recibir():
+        return {"type": "http.request", "body": datos, "more_body": False}
+
+    async def enviar(mensaje):
+        mensajes.append(mensaje)
+
+    asyncio.run(app(scope, recibir, enviar))
+    estado = next(m["status"] for m in mensajes if m["type"] == "http.response.start")
+    respuesta = b"".join(m.get("body", b"") for m in mensajes if m["type"] == "http.response.body")
+    return estado, json.loads(respuesta) if respuesta else None
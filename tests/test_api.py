@@ -0,0 +1,81 @@
+import pytest
+
+import api
+import consultas
+from conftest import pedir
+
+
+FILA = {"empresa": "Acme", "producto": "Tornillo", "cantidad": 3, "n_nota_venta": "NV1", "sku": "T-1"}
+
+
+def test_resumen_sin_columnas_es_error_de_validacion():
+    with pytest.raises(ValueError):
+        consultas.sql_resumen_cantidades([])
+
+
+def test_resumen_con_agrupar_por_vacio_responde_400(base):
+    estado, cuerpo = pedir(api.app, "GET", "/api/resumen?agrupar_por=")
+    assert estado == 400
+    assert "error" in cuerpo
+
+
+def test_lote_con_params_que_no_son_objeto_responde_400(base):
+    estado, cuerpo = pedir(api.app, "POST", "/api/lote", {"consultas": [{"ruta": "/api/resumen", "params": [1]}]})
+    assert estado == 400
+    assert "error" in cuerpo
+
+
+def test_lote_valido_sigue_respondiendo(base):
+    estado, cuerpo = pedir(api.app, "POST", "/api/lote", {"consultas": [{"ruta": "/api/resumen", "params": {}}]})
+    assert estado == 200
+    assert cuerpo[0]["estado"] == 200
+
+
+def test_crear_con_filas_que_no_son_lista_responde_400(base):
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes", {"filas": "abc"})
+    assert estado == 400
+    assert "error" in cuerpo
+
+
+def test_crear_con_una_fila_que_no_es_objeto_responde_400(base):
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA, "abc"]})
+    assert estado == 400
+    assert cuerpo["detalle"] == [{"fila": 1, "error": "debe ser un objeto JSON"}]
+
+
+def test_crear_pendientes(base):
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA]})
+    assert estado == 200
+    assert cuerpo["creados"] == 1
+
+
+def test_crear_una_linea_ya_cargada_la_suma_y_lo_informa(base):
+    pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA]})
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA, {**FILA, "sku": "T-2"}]})
+    assert estado == 200
+    assert cuerpo["creados"] == 1
+    assert cuerpo["sumados"] == 1
+    assert cuerpo["filas_sumadas"] == [{"fila": 0, "id": 1}]
+
+
+@pytest.mark.parametrize("cantidad", ["inf", "nan", 1e300])
+def test_crear_con_cantidad_no_finita_responde_400(base, cantidad):
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes", {"filas": [{**FILA, "cantidad": cantidad}]})
+    assert estado == 400
+    assert cuerpo["detalle"][0]["fila"] == 0
+
+
+@pytest.mark.parametrize("ids", ["12", {"1": 1, "2": 2}, [1.9], [True], ["1"], None])
+def test_archivar_con_ids_que_no_son_lista_de_enteros_responde_400(base, ids):
+    pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA, {**FILA, "sku": "T-2"}]})
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes/archivar", {"ids": ids})
+    assert estado == 400
+    assert "error" in cuerpo
+    assert consultas.buscar("pendientes", 10).shape[0] == 2
+
+
+def test_archivar_con_lista_de_enteros(base):
+    pedir(api.app, "POST", "/api/pendientes", {"filas": [FILA, {**FILA, "sku": "T-2"}]})
+    estado, cuerpo = pedir(api.app, "POST", "/api/pendientes/archivar", {"ids": [2]})
+    assert estado == 200
+    assert cuerpo["archivados"] == 1
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+import consultas
+from db import obtener_engine, invalidar
+
+
+def _cargar(url, fechas):
+    with obtener_engine(url).begin() as conn:
+        conn.execute(
+            text("INSERT INTO pendientes (empresa, producto, cantidad, fecha_creacion) VALUES ('Acme', 'P', 1, :fecha)"),
+            [{"fecha": fecha} for fecha in fechas]
+        )
+    invalidar("pendientes")
+
+
+def test_paginas_keyset_con_fechas_iguales_no_saltan_ni_repiten_filas(base):
+    # Cinco filas con la misma fecha de creación, cortadas por el límite en medio del empate
+    iguales = datetime(2024, 3, 1, 10, 0, 0)
+    _cargar(base, [datetime(2024, 3, 2), iguales, iguales, iguales, iguales, iguales, datetime(2024, 2, 28)])
+
+    vistos, cursor, hay_mas = [], None, True
+    while hay_mas:
+        df, hay_mas = consultas.pagina_pendientes(2, cursor)
+        vistos += df["id"].tolist()
+        cursor = consultas.cursor_de(df)
+
+    with obtener_engine(base).connect() as conn:
+        esperado = [f[0] for f in conn.execute(text("SELECT id FROM pendientes ORDER BY fecha_creacion DESC, id DESC"))]
+    assert vistos == esperado
+    assert len(set(vistos)) == 7
+
+
+def test_ultima_pagina_exacta_no_promete_otra(base):
+    _cargar(base, [datetime(2024, 3, 1)] * 4)
+    df, hay_mas = consultas.pagina_pendientes(2)
+    df, hay_mas = consultas.pagina_pendientes(2, consultas.cursor_de(df))
+    assert len(df) == 2
+    assert not hay_mas
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import historico
+from db import obtener_engine
+
+
+def _entregas(url, *fechas):
+    with obtener_engine(url).begin() as conn:
+        for fecha in fechas:
+            conn.execute(
+                text("INSERT INTO entregas_completadas (empresa, producto, cantidad, fecha_entrega) VALUES ('Acme', 'Tornillo', 1, :f)"),
+                {"f": fecha}
+            )
+
+
+def _en_base(url):
+    with obtener_engine(url).connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM entregas_completadas")).scalar()
+
+
+@pytest.mark.parametrize("directorio", [None, "historico"])
+def test_no_compacta_sin_directorio_absoluto(base, monkeypatch, directorio):
+    monkeypatch.setattr(historico, "HISTORICO_DIR", None)
+    _entregas(base, datetime(2020, 1, 5))
+    with pytest.raises(RuntimeError):
+        historico.compactar(obtener_engine(base), 1, directorio)
+    assert _en_base(base) == 1
+
+
+def test_compactar_mueve_el_mes_al_archivo(base, tmp_path):
+    _entregas(base, datetime(2020, 1, 5), datetime(2020, 1, 20), datetime.now())
+    movidas = historico.compactar(obtener_engine(base), 1, str(tmp_path / "historico"))
+    assert movidas == {pd.Period("2020-01", freq="M"): 2}
+    assert _en_base(base) == 1
+    assert len(pd.read_parquet(historico.ruta_mes(pd.Period("2020-01", freq="M"), str(tmp_path / "historico")))) == 2
+
+
+def test_no_borra_si_el_archivo_no_tiene_todas_las_filas(base, tmp_path, monkeypatch):
+    _entregas(base, datetime(2020, 1, 5), datetime(2020, 1, 20))
+    monkeypatch.setattr(historico, "_ids_archivo", lambda ruta: {1})
+    with pytest.raises(RuntimeError):
+        historico.compactar(obtener_engine(base), 1, str(tmp_path / "historico"))
+    assert _en_base(base) == 2
@@ -0,0 +1,40 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from importar import leer_archivo, validar, validar_fila
+
+
+def test_xlsx_con_celdas_de_fecha_no_invierte_dia_y_mes(tmp_path):
+    archivo = tmp_path / "nota_venta.xlsx"
+    pd.DataFrame({
+        "empresa": ["Acme", "Beta"],
+        "producto": ["Tornillo", "Tuerca"],
+        "cantidad": [3, 1],
+        "fecha_nota_venta": [datetime(2024, 1, 5), datetime(2024, 3, 2)],
+    }).to_excel(archivo, index=False)
+
+    filas, errores = validar(leer_archivo(archivo))
+    assert errores.empty
+    assert [f["fecha_nota_venta"] for f in filas] == [date(2024, 1, 5), date(2024, 3, 2)]
+
+
+@pytest.mark.parametrize("texto, esperada", [
+    ("05/01/2024", date(2024, 1, 5)),
+    ("2024-01-05", date(2024, 1, 5)),
+    ("2024-03-02 00:00:00", date(2024, 3, 2)),
+])
+def test_fechas_de_texto(texto, esperada):
+    fila = validar_fila({"empresa": "Acme", "producto": "P", "cantidad": "1", "fecha_nota_venta": texto})
+    assert fila["fecha_nota_venta"] == esperada
+
+
+@pytest.mark.parametrize("cantidad", ["inf", "-inf", "nan", "1e20", "2147483648", "0", "1,5"])
+def test_cantidades_invalidas_son_error_de_validacion(cantidad):
+    with pytest.raises(ValueError):
+        validar_fila({"empresa": "Acme", "producto": "P", "cantidad": cantidad})
+
+
+def test_cantidad_maxima_se_acepta():
+    assert validar_fila({"empresa": "Acme", "producto": "P", "cantidad": "2147483647"})["cantidad"] == 2147483647
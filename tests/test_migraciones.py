@@ -0,0 +1,33 @@
+from sqlalchemy import text
+
+from db import obtener_engine
+from migraciones import MIGRACIONES, aplicar_migraciones, versiones_aplicadas
+
+
+def _esquema(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")).fetchall()
+
+
+def test_aplicar_dos_veces_no_cambia_nada(tmp_path):
+    engine = obtener_engine(f"sqlite:///{tmp_path / 'migraciones.db'}")
+    todas = [m[0] for m in MIGRACIONES]
+    assert aplicar_migraciones(engine) == todas
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO pendientes (empresa, producto, cantidad) VALUES ('Acme', 'P', 3)"))
+    esquema = _esquema(engine)
+
+    assert aplicar_migraciones(engine) == []
+    assert _esquema(engine) == esquema
+    assert versiones_aplicadas(engine) == set(todas)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM pendientes")).scalar() == 1
+
+
+def test_aplicar_por_partes_deja_el_mismo_esquema(tmp_path):
+    completa = obtener_engine(f"sqlite:///{tmp_path / 'completa.db'}")
+    por_partes = obtener_engine(f"sqlite:///{tmp_path / 'por_partes.db'}")
+    aplicar_migraciones(completa)
+    assert aplicar_migraciones(por_partes, hasta=4) == [1, 2, 3, 4]
+    assert aplicar_migraciones(por_partes) == [m[0] for m in MIGRACIONES if m[0] > 4]
+    assert _esquema(por_partes) == _esquema(completa)
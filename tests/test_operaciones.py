@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import text
+
+from db import obtener_engine
+from operaciones import CLAVE_LINEA, archivar_pendientes, clave_linea, destinos_filas, editar_pendiente, insertar_pendientes
+
+
+def _fila(**cambios):
+    return {
+        "empresa": "Acme", "producto": "Tornillo", "cantidad": 2, "n_nota_venta": "NV1",
+        "sku": "T-1", "orden_compra": "", "estado": "Pendiente", **cambios,
+    }
+
+
+def _cantidades(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT id, cantidad FROM pendientes ORDER BY id")).fetchall()
+
+
+def test_insertar_separa_creados_de_sumados(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        assert insertar_pendientes(conn, [_fila(), _fila(sku=" t-1 ", cantidad=3)]) == (1, [{"fila": 1, "fila_igual": 0}])
+    with engine.begin() as conn:
+        creados, sumadas = insertar_pendientes(conn, [_fila(empresa="ACME", cantidad=4), _fila(sku="")])
+    assert (creados, sumadas) == (1, [{"fila": 0, "id": 1}])
+    assert _cantidades(engine) == [(1, 9), (2, 2)]
+
+
+def test_distinta_orden_de_compra_no_se_suma(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [_fila()])
+        assert destinos_filas(conn, [_fila(orden_compra="OC-7"), _fila()]) == [None, {"id": 1}]
+
+
+def test_clave_linea_normaliza_igual_que_la_base(base):
+    # TRIM() de SQL solo quita espacios: un tab al final es otra línea, en Python y en la base
+    engine = obtener_engine(base)
+    fila = _fila(n_nota_venta=" nv1\t", sku="t-1 ", empresa=" Acme ", orden_compra="\noc ")
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [fila])
+        en_base = conn.execute(text(f"SELECT {', '.join(CLAVE_LINEA)} FROM pendientes")).one()
+        assert tuple(en_base) == clave_linea(fila)
+        assert destinos_filas(conn, [fila, _fila()]) == [{"id": 1}, None]
+
+
+def _version(engine, id_):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT version FROM pendientes WHERE id = :id"), {"id": id_}).scalar()
+
+
+def test_editar_con_la_version_leida_guarda_y_sube_la_version(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [_fila()])
+        assert editar_pendiente(conn, 1, 1, {"cantidad": 5}) == 1
+    assert _version(engine, 1) == 2
+
+
+def test_editar_con_version_vieja_no_guarda(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [_fila()])
+        editar_pendiente(conn, 1, 1, {"motivo": "primero"})
+        # Otro usuario leyó la versión 1 antes de esa edición
+        assert editar_pendiente(conn, 1, 1, {"motivo": "segundo"}) == 0
+        assert conn.execute(text("SELECT motivo FROM pendientes WHERE id = 1")).scalar() == "primero"
+
+
+def test_editar_un_pendiente_ya_archivado_no_guarda(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [_fila()])
+        assert archivar_pendientes(conn, [1]) == 1
+        assert editar_pendiente(conn, 1, 1, {"cantidad": 5}) == 0
+        assert archivar_pendientes(conn, [1]) == 0
+
+
+def test_editar_un_campo_no_permitido_es_error(base):
+    engine = obtener_engine(base)
+    with engine.begin() as conn:
+        insertar_pendientes(conn, [_fila()])
+        with pytest.raises(ValueError):
+            editar_pendiente(conn, 1, 1, {"version": 99})
@@ -0,0 +1,54 @@
+from sqlalchemy import text
+
+from db import obtener_engine
+
+
+CLAVE = "empresa, proveedor, producto, sku"
+
+
+def _ejecutar(engine, sql, params=None):
+    with engine.begin() as conn:
+        conn.execute(text(sql), params or {})
+
+
+def _resumen(engine):
+    with engine.connect() as conn:
+        return sorted(conn.execute(text(f"SELECT {CLAVE}, cantidad, filas FROM resumen_pendientes")).fetchall(), key=repr)
+
+
+def _recalculado(engine):
+    # Lo que los triggers deberían haber dejado: el GROUP BY sobre pendientes
+    with engine.connect() as conn:
+        return sorted(conn.execute(text(
+            f"SELECT {CLAVE}, SUM(cantidad), COUNT(*) FROM pendientes GROUP BY {CLAVE}"
+        )).fetchall(), key=repr)
+
+
+def test_triggers_mantienen_el_resumen(base):
+    engine = obtener_engine(base)
+    _ejecutar(engine, f"""
+        INSERT INTO pendientes ({CLAVE}, cantidad) VALUES
+            ('Acme', 'ProvA', 'Tornillo', 'T-1', 3),
+            ('Acme', 'ProvA', 'Tornillo', 'T-1', 2),
+            ('Acme', 'ProvB', 'Tuerca', NULL, 5)
+    """)
+    assert _resumen(engine) == _recalculado(engine)
+    assert ("Acme", "ProvA", "Tornillo", "T-1", 5, 2) in _resumen(engine)
+
+    # Cambia la cantidad y, en otra fila, la clave: una sale de su grupo y entra en otro
+    _ejecutar(engine, "UPDATE pendientes SET cantidad = 10 WHERE id = 1")
+    _ejecutar(engine, "UPDATE pendientes SET proveedor = 'ProvB', producto = 'Tuerca', sku = NULL WHERE id = 2")
+    assert _resumen(engine) == _recalculado(engine)
+    assert ("Acme", "ProvB", "Tuerca", None, 7, 2) in _resumen(engine)
+
+    _ejecutar(engine, "DELETE FROM pendientes WHERE id = 3")
+    assert _resumen(engine) == _recalculado(engine)
+
+
+def test_grupo_sin_filas_desaparece(base):
+    engine = obtener_engine(base)
+    _ejecutar(engine, f"INSERT INTO pendientes ({CLAVE}, cantidad) VALUES ('Acme', 'ProvA', 'Tornillo', 'T-1', 3)")
+    _ejecutar(engine, "UPDATE pendientes SET proveedor = 'ProvB'")
+    _ejecutar(engine, "DELETE FROM pendientes")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM resumen_pendientes")).scalar() == 0
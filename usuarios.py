@@ -0,0 +1,282 @@
+import argparse
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import math
+import secrets
+import sys
+import threading
+import time
+
+import bcrypt
+import streamlit as st
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from db import obtener_config, obtener_config_int, obtener_engine, usar_url
+
+
+# === USUARIOS Y SESIONES ===
+# Cada usuario tiene su cuenta en la tabla usuarios (migración 7), con la contraseña
+# hasheada con bcrypt. bcrypt es lento a propósito (unos 0,2 s por verificación), así
+# que se verifica una sola vez, al entrar: la sesión guarda un token firmado con HMAC
+# (cuenta + vencimiento) que en cada rerun se comprueba en microsegundos, sin tocar
+# la base ni bcrypt.
+#
+# Mientras no haya ninguna cuenta se sigue aceptando APP_PASSWORD, para poder pasar
+# a usuarios sin cortar el acceso. Al crear la primera cuenta deja de valer.
+#
+# Los intentos fallidos se cuentan por usuario y por IP en cada proceso: pasado
+# LOGIN_MAX_INTENTOS en LOGIN_VENTANA_MINUTOS, se rechaza sin verificar nada.
+
+ROLES = ("admin", "vendedor")
+
+BCRYPT_COSTO = 12
+
+# bcrypt solo usa los primeros 72 bytes de la contraseña
+MAX_BYTES_CLAVE = 72
+
+SESION_HORAS = obtener_config_int("SESION_HORAS", 12)
+
+LOGIN_MAX_INTENTOS = obtener_config_int("LOGIN_MAX_INTENTOS", 5)
+LOGIN_VENTANA_MINUTOS = obtener_config_int("LOGIN_VENTANA_MINUTOS", 15)
+
+# Una oficina entera puede salir por la misma IP: la IP tolera más fallos que un usuario
+INTENTOS_POR_IP = 4
+
+CUENTA_COMPARTIDA = {"usuario": "", "nombre": "", "rol": "admin", "vendedor": None}
+
+
+# --- Contraseñas ---
+def hashear(clave):
+    datos = clave.encode("utf-8")
+    if len(datos) > MAX_BYTES_CLAVE:
+        raise ValueError(f"La contraseña no puede tener más de {MAX_BYTES_CLAVE} bytes.")
+    if len(clave) < 8:
+        raise ValueError("La contraseña debe tener al menos 8 caracteres.")
+    return bcrypt.hashpw(datos, bcrypt.gensalt(BCRYPT_COSTO)).decode("ascii")
+
+
+@st.cache_resource(show_spinner=False)
+def _hash_de_relleno():
+    # Para usuarios inexistentes se verifica contra este hash: la respuesta tarda
+    # lo mismo y no delata qué usuarios existen
+    return bcrypt.hashpw(secrets.token_bytes(16), bcrypt.gensalt(BCRYPT_COSTO))
+
+
+def _clave_correcta(clave, hash_guardado):
+    datos = clave.encode("utf-8")
+    if len(datos) > MAX_BYTES_CLAVE:
+        return False
+    return bcrypt.checkpw(datos, hash_guardado.encode("ascii"))
+
+
+# --- Token de sesión: base64(cuenta + vencimiento) + "." + HMAC-SHA256 ---
+@st.cache_resource(show_spinner=False)
+def _secreto():
+    # Sin SESION_SECRETO se usa uno al azar por proceso: las sesiones de Streamlit
+    # tampoco sobreviven a un reinicio
+    secreto = obtener_config("SESION_SECRETO")
+    return secreto.encode("utf-8") if secreto else secrets.token_bytes(32)
+
+
+def _firma(datos):
+    return hmac.new(_secreto(), datos, hashlib.sha256).hexdigest()
+
+
+def firmar(cuenta, horas=SESION_HORAS):
+    datos = base64.urlsafe_b64encode(json.dumps({**cuenta, "vence": int(time.time() + horas * 3600)}).encode("utf-8"))
+    return f"{datos.decode('ascii')}.{_firma(datos)}"
+
+
+def leer_token(token):
+    # La cuenta del token, o None si la firma no coincide o ya venció
+    try:
+        datos, firma = token.encode("ascii").rsplit(b".", 1)
+    except (AttributeError, UnicodeEncodeError, ValueError):
+        return None
+    if not hmac.compare_digest(firma, _firma(datos).encode("ascii")):
+        return None
+    cuenta = json.loads(base64.urlsafe_b64decode(datos))
+    if cuenta.pop("vence") < time.time():
+        return None
+    return cuenta
+
+
+# --- Límite de intentos ---
+@st.cache_resource(show_spinner=False)
+def _intentos():
+    # {("usuario" | "ip", valor): [instantes de los fallos]} compartido por todas las sesiones
+    return {"lock": threading.Lock(), "fallos": {}}
+
+
+def _limites(usuario, ip):
+    limites = {("usuario", usuario): LOGIN_MAX_INTENTOS}
+    if ip:
+        limites[("ip", ip)] = LOGIN_MAX_INTENTOS * INTENTOS_POR_IP
+    return limites
+
+
+def _espera(limites):
+    # Segundos que faltan para poder volver a intentar (0 si no hay bloqueo)
+    intentos = _intentos()
+    ventana = LOGIN_VENTANA_MINUTOS * 60
+    ahora = time.monotonic()
+    espera = 0
+    with intentos["lock"]:
+        for clave, maximo in limites.items():
+            fallos = [t for t in intentos["fallos"].get(clave, []) if ahora - t < ventana]
+            if fallos:
+                intentos["fallos"][clave] = fallos
+            else:
+                intentos["fallos"].pop(clave, None)
+            if len(fallos) >= maximo:
+                espera = max(espera, fallos[-maximo] + ventana - ahora)
+    return espera
+
+
+def _registrar_fallo(limites):
+    intentos = _intentos()
+    with intentos["lock"]:
+        for clave in limites:
+            intentos["fallos"].setdefault(clave, []).append(time.monotonic())
+
+
+def _olvidar_fallos(usuario):
+    intentos = _intentos()
+    with intentos["lock"]:
+        intentos["fallos"].pop(("usuario", usuario), None)
+
+
+# --- Login ---
+def _hay_usuarios(conn):
+    # Sin la migración 7 o sin cuentas creadas se usa APP_PASSWORD
+    if not inspect(conn).has_table("usuarios"):
+        return False
+    return conn.execute(text("SELECT COUNT(*) FROM (SELECT 1 FROM usuarios LIMIT 1) t")).scalar() > 0
+
+
+def _verificar(usuario, clave):
+    # Contra la base principal, no la copia local (replica.py no copia usuarios)
+    with obtener_engine().connect() as conn:
+        if not _hay_usuarios(conn):
+            compartida = obtener_config("APP_PASSWORD", "")
+            if compartida and hmac.compare_digest(clave.encode("utf-8"), compartida.encode("utf-8")):
+                return dict(CUENTA_COMPARTIDA)
+            return None
+        fila = conn.execute(
+            text("SELECT usuario, nombre, hash, rol, vendedor FROM usuarios WHERE usuario = :usuario AND activo"),
+            {"usuario": usuario}
+        ).mappings().first()
+    if fila is None:
+        _clave_correcta(clave, _hash_de_relleno().decode("ascii"))
+        return None
+    if not _clave_correcta(clave, fila["hash"]):
+        return None
+    return {"usuario": fila["usuario"], "nombre": fila["nombre"], "rol": fila["rol"], "vendedor": fila["vendedor"]}
+
+
+def iniciar_sesion(usuario, clave, ip=None):
+    # Devuelve el token de la sesión; ValueError con el mensaje para la pantalla si no
+    usuario = usuario.strip().lower()
+    limites = _limites(usuario, ip)
+    espera = _espera(limites)
+    if espera:
+        raise ValueError(f"Demasiados intentos fallidos. Vuelve a intentar en {math.ceil(espera / 60)} min.")
+    cuenta = _verificar(usuario, clave)
+    if cuenta is None:
+        _registrar_fallo(limites)
+        raise ValueError("Usuario o contraseña incorrectos.")
+    _olvidar_fallos(usuario)
+    return firmar(cuenta)
+
+
+# --- Administración de cuentas ---
+def crear_usuario(conn, usuario, nombre, clave, rol="vendedor", vendedor=None):
+    if rol not in ROLES:
+        raise ValueError(f"Rol no válido: {rol}")
+    conn.execute(
+        text("""
+            INSERT INTO usuarios (usuario, nombre, hash, rol, vendedor)
+            VALUES (:usuario, :nombre, :hash, :rol, :vendedor)
+        """),
+        {"usuario": usuario.strip().lower(), "nombre": nombre, "hash": hashear(clave), "rol": rol, "vendedor": vendedor}
+    )
+
+
+def cambiar_clave(conn, usuario, clave):
+    # 1 si existe el usuario; las sesiones abiertas siguen hasta que vencen
+    return conn.execute(
+        text("UPDATE usuarios SET hash = :hash WHERE usuario = :usuario"),
+        {"usuario": usuario.strip().lower(), "hash": hashear(clave)}
+    ).rowcount
+
+
+def activar_usuario(conn, usuario, activo):
+    return conn.execute(
+        text("UPDATE usuarios SET activo = :activo WHERE usuario = :usuario"),
+        {"usuario": usuario.strip().lower(), "activo": activo}
+    ).rowcount
+
+
+def listar_usuarios(conn):
+    return conn.execute(text("SELECT usuario, nombre, rol, vendedor, activo FROM usuarios ORDER BY usuario")).fetchall()
+
+
+# === CLI ===
+# python usuarios.py crear ana --nombre "Ana Pérez" --vendedor "Ana Pérez"
+# python usuarios.py crear jefe --nombre "Jefe de ventas" --rol admin
+# python usuarios.py clave ana | desactivar ana | activar ana | listar
+def _pedir_clave():
+    clave = getpass.getpass("Contraseña: ")
+    if getpass.getpass("Repite la contraseña: ") != clave:
+        raise ValueError("Las contraseñas no coinciden.")
+    return clave
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cuentas de usuario del Sistema de Pendientes")
+    parser.add_argument("accion", choices=["crear", "clave", "desactivar", "activar", "listar"])
+    parser.add_argument("usuario", nargs="?")
+    parser.add_argument("--nombre", help="Nombre para mostrar (crear)")
+    parser.add_argument("--rol", choices=ROLES, default="vendedor")
+    parser.add_argument("--vendedor", help="Nombre con el que figura en la columna vendedor (crear)")
+    parser.add_argument("--url", help="URL de la base (por defecto NEON_DB_URL)")
+    args = parser.parse_args(argv)
+
+    if args.accion != "listar" and not args.usuario:
+        parser.error("Falta el usuario.")
+    if args.url:
+        usar_url(args.url)
+
+    try:
+        with obtener_engine().begin() as conn:
+            if args.accion == "listar":
+                for usuario, nombre, rol, vendedor, activo in listar_usuarios(conn):
+                    print(f"{usuario:<20} {rol:<9} {'activo' if activo else 'inactivo':<9} {nombre} ({vendedor or '-'})")
+                return 0
+            if args.accion == "crear":
+                crear_usuario(conn, args.usuario, args.nombre or args.usuario, _pedir_clave(), args.rol, args.vendedor)
+            elif args.accion == "clave":
+                cambios = cambiar_clave(conn, args.usuario, _pedir_clave())
+            else:
+                cambios = activar_usuario(conn, args.usuario, args.accion == "activar")
+            if args.accion != "crear" and not cambios:
+                print(f"No existe el usuario {args.usuario}.", file=sys.stderr)
+                return 1
+    except IntegrityError:
+        print(f"Ya existe el usuario {args.usuario}.", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Listo: {args.accion} {args.usuario}.")
+    if args.accion != "crear":
+        print(f"Las sesiones abiertas siguen hasta que vencen ({SESION_HORAS} h).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())